@@ -0,0 +1,68 @@
+"""Benchmark compression codecs on typical atomistic results (configurations with positions,
+forces, cell, energy, and species), reporting bytes transferred and end-to-end latency,
+i.e. time to write the compressed pickle, transfer it with a given bandwidth (simulated,
+since the copy itself is done by rsync), and read and unpickle it.
+
+Usage: PYTHONPATH=. python benchmarks/bench_compression.py [bandwidth_MB_per_s]
+"""
+import sys
+import time
+import array
+import random
+import pickle
+import tempfile
+
+from pathlib import Path
+
+from expyre import compression
+
+
+def atomistic_results(n_configs, n_atoms):
+    rng = random.Random(5)
+    results = []
+    for _ in range(n_configs):
+        # perturbed simple cubic lattice, with full precision floats like DFT output
+        positions = array.array('d', [2.0 * ((atom_i // 100 ** (3 - 1 - dir_i)) % 100) + rng.gauss(0.0, 0.05)
+                                      for atom_i in range(n_atoms) for dir_i in range(3)])
+        forces = array.array('d', [rng.gauss(0.0, 0.5) for _ in range(3 * n_atoms)])
+        results.append({'positions': positions, 'forces': forces,
+                        'cell': [[2.0 * n_atoms ** (1 / 3), 0.0, 0.0], [0.0, 2.0 * n_atoms ** (1 / 3), 0.0],
+                                 [0.0, 0.0, 2.0 * n_atoms ** (1 / 3)]],
+                        'energy': rng.uniform(-5.0, -4.0) * n_atoms,
+                        'species': ['Si' if atom_i % 4 else 'C' for atom_i in range(n_atoms)]})
+    return results
+
+
+def main(bandwidth=10.0):
+    codecs = [None] + list(compression.codecs)
+
+    print(f'simulated bandwidth {bandwidth} MB/s')
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filename = Path(tmp_dir) / '_expyre_job_succeeded'
+        for n_configs, n_atoms in [(100, 64), (1000, 128), (50, 4096)]:
+            results = atomistic_results(n_configs, n_atoms)
+            print(f'{n_configs} configs of {n_atoms} atoms')
+            for codec in codecs:
+                try:
+                    t0 = time.perf_counter()
+                    with open(filename, 'wb') as fout_raw, compression.writer(fout_raw, codec) as fout:
+                        pickle.dump(results, fout)
+                    t_write = time.perf_counter() - t0
+                except ImportError:
+                    print(f'    {codec:>5} not available')
+                    continue
+
+                n_bytes = filename.stat().st_size
+                t_transfer = n_bytes / (bandwidth * 1024 * 1024)
+
+                t0 = time.perf_counter()
+                assert pickle.loads(compression.read(filename)) == results
+                t_read = time.perf_counter() - t0
+
+                print(f'    {str(codec):>5} {n_bytes / 1024 / 1024:8.2f} MB write {t_write:7.3f} s '
+                      f'transfer {t_transfer:7.3f} s read {t_read:7.3f} s '
+                      f'total {t_write + t_transfer + t_read:7.3f} s')
+
+
+if __name__ == '__main__':
+    main(*[float(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,42 @@
+"""Benchmark ExPyRe constructor time with large input files, comparing a cold digest cache
+(all input files hashed) to a warm one (e.g. restarting a workflow with unchanged inputs).
+
+Usage: PYTHONPATH=. python benchmarks/bench_input_hashing.py [n_files] [file_size_MB]
+"""
+import sys
+import os
+import time
+import json
+import tempfile
+
+from pathlib import Path
+
+
+def main(n_files=8, file_size_MB=64):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_dir = Path(tmp_dir)
+        (tmp_dir / '_expyre').mkdir()
+        with open(tmp_dir / '_expyre' / 'config.json', 'w') as fout:
+            json.dump({'systems': {'bench': {'host': None, 'scheduler': 'slurm', 'partitions': None}}}, fout)
+
+        import expyre.config
+        expyre.config.init(tmp_dir / '_expyre')
+        from expyre.func import ExPyRe
+
+        (tmp_dir / 'inputs').mkdir()
+        chunk = os.urandom(1024 * 1024)
+        for file_i in range(n_files):
+            with open(tmp_dir / 'inputs' / f'input_{file_i}', 'wb') as fout:
+                for _ in range(file_size_MB):
+                    fout.write(chunk)
+        os.chdir(tmp_dir)
+
+        print(f'{n_files} input files of {file_size_MB} MB')
+        for label in ['cold', 'warm', 'warm']:
+            t0 = time.perf_counter()
+            xpr = ExPyRe('bench', input_files=['inputs'], function=sum, args=[[1, 2]])
+            print(f'{label:>5} constructor {time.perf_counter() - t0:8.3f} s (recreated {xpr.recreated})')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
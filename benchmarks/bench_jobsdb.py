@@ -0,0 +1,54 @@
+"""Benchmark JobsDB lookups in a database with many (historical) jobs, comparing the indexed SQL
+queries of ``JobsDB.get`` and ``JobsDB.jobs`` to the previous selection of every row in python.
+
+Usage: PYTHONPATH=. python benchmarks/bench_jobsdb.py [n_rows]
+"""
+import sys
+import re
+import time
+import random
+import tempfile
+
+from pathlib import Path
+
+from expyre.jobsdb import JobsDB
+
+
+def python_scan(db, id_re):
+    # previous implementation, which selected all rows and matched regexps in python
+    return [row for row in db.db.execute('SELECT * FROM jobs') if re.search('^' + id_re + '$', row[db.id_col])]
+
+
+def main(n_rows=100000):
+    rng = random.Random(5)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = JobsDB(Path(tmp_dir) / 'jobs.db')
+        statuses = ['processed'] * 8 + ['cleaned', 'submitted']
+        with db.db:
+            db.db.executemany('INSERT INTO jobs (id, name, from_dir, status, system, remote_id, remote_status, creation_time) '
+                              'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                              [(f'task_{job_i // 100}_{job_i:08x}_{job_i}', f'task_{job_i // 100}', f'/stage/run_{job_i}',
+                                rng.choice(statuses), f'sys_{job_i % 3}', str(job_i), 'done', int(time.time()))
+                               for job_i in range(n_rows)])
+
+        ids = [f'task_{job_i // 100}_{job_i:08x}_{job_i}' for job_i in rng.sample(range(n_rows), 100)]
+
+        print(f'{n_rows} rows')
+        for label, lookup in [('get(id)', lambda id: db.get(id)),
+                              ('jobs(id=re.escape(id))', lambda id: list(db.jobs(id=re.escape(id)))),
+                              ('jobs(id=prefix.*) (restart)', lambda id: list(db.jobs(id=re.escape(id.rsplit('_', 1)[0]) + '_.*'))),
+                              ('jobs(id=regexp)', lambda id: list(db.jobs(id='.*' + re.escape(id[5:])))),
+                              ('python scan (previous)', lambda id: python_scan(db, re.escape(id)))]:
+            n_lookups = 100 if 'scan' not in label and 'regexp' not in label else 5
+            t0 = time.perf_counter()
+            for id in ids[:n_lookups]:
+                lookup(id)
+            print(f'{label:>30} {(time.perf_counter() - t0) / n_lookups * 1.0e3:10.3f} ms per lookup')
+
+        t0 = time.perf_counter()
+        n_ongoing = len(list(db.jobs(status='ongoing', system='sys_1')))
+        print(f'{"jobs(status=ongoing, system)":>30} {(time.perf_counter() - t0) * 1.0e3:10.3f} ms ({n_ongoing} jobs)')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,65 @@
+"""Benchmark parsing of scheduler status output, with synthetic outputs listing many jobs (e.g. a
+squeue of a user with a large job history, or chunked qstat queries of many tracked jobs), of
+which some or all are tracked.
+
+Usage: PYTHONPATH=. python benchmarks/bench_status_parsing.py [n_jobs]
+"""
+import sys
+import time
+import json
+import random
+
+from expyre.schedulers import Slurm, PBS, SGE
+
+
+def slurm_output(job_ids):
+    states = ['RUNNING', 'PENDING', 'COMPLETING']
+    return ''.join([f'{job_id:<20}{states[job_id % 3]:<30}None\n' for job_id in job_ids])
+
+
+def pbs_output(job_ids, chunk_size=500):
+    states = ['R', 'Q', 'F', 'H']
+    out = ''
+    for chunk_start in range(0, len(job_ids), chunk_size):
+        jobs = {f'{job_id}.server': {'Job_Name': f'job_{job_id}', 'job_state': states[job_id % 4], 'Exit_status': 0,
+                                     'Resource_List': {'ncpus': 16, 'walltime': '01:00:00'},
+                                     'Variable_List': 'PATH=/usr/bin:/bin,PBS_O_WORKDIR=/home/user/run_expyre'}
+                for job_id in job_ids[chunk_start:chunk_start + chunk_size]}
+        out += json.dumps({'pbs_version': '2022.1', 'Jobs': jobs}, indent=4) + '\n'
+    return out
+
+
+def sge_output(job_ids):
+    out = "<?xml version='1.0'?>\n<job_info>\n  <queue_info>\n"
+    for job_id in job_ids:
+        out += ('    <job_list state="running">\n'
+                f'      <JB_job_number>{job_id}</JB_job_number>\n'
+                '      <JAT_prio>0.50000</JAT_prio>\n'
+                '      <JB_owner>user</JB_owner>\n'
+                '      <state>r</state>\n'
+                '      <queue_name>all.q@node1</queue_name>\n'
+                '      <slots>1</slots>\n'
+                '    </job_list>\n')
+    return out + '  </queue_info>\n  <job_info>\n  </job_info>\n</job_info>\n'
+
+
+def main(n_jobs=100000):
+    job_ids = list(range(1000000, 1000000 + n_jobs))
+    rng = random.Random(5)
+
+    for scheduler, output, remote_id in [(Slurm(None), slurm_output(job_ids), str),
+                                         (PBS(None), pbs_output(job_ids), lambda job_id: f'{job_id}.server'),
+                                         (SGE(None), sge_output(job_ids), str)]:
+        n_lines = len(output.splitlines())
+        for n_tracked in [100, 10000, n_jobs]:
+            remote_ids = [remote_id(job_id) for job_id in rng.sample(job_ids, min(n_tracked, n_jobs))]
+            t0 = time.perf_counter()
+            status = scheduler.parse_status(output, remote_ids)
+            t = time.perf_counter() - t0
+            assert len(status) == len(remote_ids)
+            print(f'{scheduler.__class__.__name__:>5} {n_jobs} listed jobs ({n_lines:8d} lines) {len(remote_ids):7d} tracked '
+                  f'parse {t:7.3f} s')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
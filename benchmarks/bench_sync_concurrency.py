@@ -0,0 +1,68 @@
+"""Benchmark syncing results of many jobs on several systems, with a local stand-in for ssh (which runs
+commands locally) and for rsync (which only sleeps, to simulate the latency of one transfer), showing how
+wall time scales with the number of job groups (one remote copy each) and sync threads.
+
+Usage: PYTHONPATH=. python benchmarks/bench_sync_concurrency.py [n_systems] [copy_time_s]
+"""
+import sys
+import os
+import time
+import json
+import tempfile
+
+from pathlib import Path
+
+
+def main(n_systems=3, copy_time=0.5):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_dir = Path(tmp_dir)
+
+        bin_dir = tmp_dir / 'bin'
+        bin_dir.mkdir()
+        with open(bin_dir / 'fake_ssh', 'w') as fout:
+            fout.write('#!/bin/bash\n'
+                       'while [[ $1 == -* ]]; do shift 2; done\n'
+                       'shift\n'
+                       'exec bash -c "$*"\n')
+        # scheduler lists no jobs, so all are done
+        for cmd in ['squeue', 'sacct']:
+            with open(bin_dir / cmd, 'w') as fout:
+                fout.write('#!/bin/bash\n')
+        with open(bin_dir / 'rsync', 'w') as fout:
+            fout.write(f'#!/bin/bash\nsleep {copy_time}\n')
+        for f in bin_dir.iterdir():
+            f.chmod(0o755)
+        os.environ['PATH'] = str(bin_dir) + ':' + os.environ['PATH']
+
+        (tmp_dir / '_expyre').mkdir()
+        systems = {f'bench_{sys_i}': {'host': f'host_{sys_i}', 'scheduler': 'slurm', 'partitions': None,
+                                      'remsh_cmd': str(bin_dir / 'fake_ssh'), 'max_concurrent_copies': 4}
+                   for sys_i in range(n_systems)}
+        with open(tmp_dir / '_expyre' / 'config.json', 'w') as fout:
+            json.dump({'systems': systems}, fout)
+
+        import expyre.config
+        expyre.config.init(tmp_dir / '_expyre')
+        from expyre.func import ExPyRe
+
+        n_group = 10
+        print(f'{n_systems} systems, {n_group} jobs per group, {copy_time} s per copy')
+        for n_groups in [1, 4, 16]:
+            jobs = []
+            for sys_i in range(n_systems):
+                for job_i in range(n_groups * n_group):
+                    job_id = f'job_{n_groups}_{sys_i}_{job_i}'
+                    (tmp_dir / '_expyre' / job_id).mkdir()
+                    expyre.config.db.add(job_id, name='bench', from_dir=str(tmp_dir / '_expyre' / job_id),
+                                         status='submitted', system=f'bench_{sys_i}', remote_id=str(job_i))
+                    jobs.append(list(expyre.config.db.jobs(id=job_id))[0])
+
+            for sync_threads in [1, 4, 16]:
+                expyre.config.sync_threads = sync_threads
+                t0 = time.perf_counter()
+                ExPyRe._sync_remote_results_status_ll(jobs, n_group=n_group)
+                print(f'{n_groups:3d} groups per system {sync_threads:3d} threads sync {time.perf_counter() - t0:7.3f} s')
+
+
+if __name__ == '__main__':
+    main(*[conv(arg) for conv, arg in zip([int, float], sys.argv[1:])])
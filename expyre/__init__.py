@@ -1,4 +1,6 @@
 from .config import systems
 from .func import ExPyRe, ExPyReJobDiedError, ExPyReTimeoutError
+from .aio import gather
+from .executor import ExPyReExecutor
 
 __version__ = "v0.1.6"
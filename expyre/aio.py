@@ -0,0 +1,173 @@
+"""asyncio interface for waiting on many jobs.  All jobs awaited on the same system in an event loop
+share a single poller task, which checks the scheduler status of all of them with one command,
+syncs their files with one remote copy per group, and resolves each job's future as it finishes.
+"""
+import time
+import asyncio
+import warnings
+
+from . import config
+from .func import ExPyRe, ExPyReTimeoutError
+from .polling import FixedPolling
+
+
+class _Waiter:
+    def __init__(self, xpr, future, timeout, policy, lazy):
+        self.xpr = xpr
+        self.future = future
+        self.deadline = None if timeout is None or timeout < 0 else time.time() + timeout
+        self.policy = policy
+        self.lazy = lazy
+        self.problem_last_chance = False
+
+
+class _SystemPoller:
+    """Poll loop for all jobs awaited on one system
+
+    Parameters
+    ----------
+    system_name: str
+        name of system
+    verbose: bool, default False
+        verbose output (from remote system/scheduler commands)
+    """
+    # failures of status query and sync (e.g. of ssh) in a row after which all waiting jobs fail,
+    # rather than being retried at the next check
+    max_sync_failures = 5
+
+    def __init__(self, system_name, verbose=False):
+        self.system_name = system_name
+        self.verbose = verbose
+        self.waiters = {}
+        self.task = None
+        self.n_sync_failures = 0
+
+
+    def add(self, waiter):
+        self.waiters[waiter.future] = waiter
+        if self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self._run())
+
+
+    def _resolve(self, waiter, result=None, exc=None):
+        del self.waiters[waiter.future]
+        waiter.policy.forget(waiter.xpr.id)
+        if waiter.future.done():
+            # cancelled by caller
+            return
+        if exc is not None:
+            waiter.future.set_exception(exc)
+        else:
+            waiter.future.set_result(result)
+
+
+    async def _next_interval(self):
+        # interval until next check, the shortest of any job's policy
+        system = config.systems[self.system_name]
+        waiters = list(self.waiters.values())
+        status = {w.xpr.id: config.db.get(w.xpr.id)['remote_status'] for w in waiters}
+
+        # estimates for all jobs that need them from one scheduler command
+        need_estimates = [w for w in waiters if w.policy.needs_estimate(w.xpr.id, status[w.xpr.id])]
+        estimates = {}
+        if len(need_estimates) > 0:
+            try:
+                estimates = await system.scheduler.atime_estimates([w.xpr.remote_id for w in need_estimates],
+                                                                   verbose=self.verbose)
+            except Exception as exc:
+                warnings.warn(f'Failed to get time estimates for jobs on {self.system_name}: {exc}')
+
+        return min([w.policy.interval(w.xpr.id, status[w.xpr.id], estimates.get(w.xpr.remote_id)) for w in waiters])
+
+
+    async def _run(self):
+        try:
+            while len(self.waiters) > 0:
+                waiters = list(self.waiters.values())
+
+                # one status query and one remote copy (per group) for all jobs that are not known to be done
+                jobs = [config.db.get(w.xpr.id) for w in waiters]
+                jobs_to_sync = [job for job in jobs if job['remote_status'] != 'done']
+                try:
+                    await ExPyRe._async_sync_remote_results_status_ll(self.system_name, jobs_to_sync, verbose=self.verbose)
+                except Exception as exc:
+                    # may be transient, so only jobs that are out of time fail, unless it keeps failing
+                    self.n_sync_failures += 1
+                    warnings.warn(f'Failed to sync jobs on {self.system_name} ({self.n_sync_failures} failures in a '
+                                  f'row, giving up after {self.max_sync_failures}): {exc}')
+                    for waiter in waiters:
+                        if waiter.future.done():
+                            self._resolve(waiter)
+                        elif (self.n_sync_failures >= self.max_sync_failures or
+                              (waiter.deadline is not None and time.time() > waiter.deadline)):
+                            self._resolve(waiter, exc=exc)
+                    if len(self.waiters) > 0:
+                        await asyncio.sleep(await self._next_interval())
+                    continue
+                self.n_sync_failures = 0
+
+                for waiter in waiters:
+                    if waiter.future.done():
+                        self._resolve(waiter)
+                        continue
+
+                    status = config.db.get(waiter.xpr.id)['remote_status']
+                    try:
+                        out, waiter.problem_last_chance = waiter.xpr._poll_results(status, waiter.problem_last_chance,
+                                                                                   lazy=waiter.lazy)
+                    except Exception as exc:
+                        self._resolve(waiter, exc=exc)
+                        continue
+
+                    if out is not None:
+                        self._resolve(waiter, result=out)
+                    elif (waiter.deadline is not None and time.time() > waiter.deadline and
+                          status in ['queued', 'held', 'running']):
+                        self._resolve(waiter, exc=ExPyReTimeoutError(f'Job {waiter.xpr.id} did not finish in time'))
+
+                if len(self.waiters) > 0:
+                    await asyncio.sleep(await self._next_interval())
+        finally:
+            # no await between loop exit and this, so no waiter can be added to a finished poller
+            if _pollers.get((asyncio.get_running_loop(), self.system_name)) is self:
+                del _pollers[(asyncio.get_running_loop(), self.system_name)]
+
+
+# pollers of each (event loop, system name)
+_pollers = {}
+
+
+async def wait_for_results(xpr, timeout=3600, check_interval=None, verbose=False, lazy=False):
+    """Wait for results of a job using the shared poller of its system, see ``ExPyRe.aget_results``
+    """
+    loop = asyncio.get_running_loop()
+    poller = _pollers.get((loop, xpr.system_name))
+    if poller is None:
+        poller = _SystemPoller(xpr.system_name, verbose=verbose)
+        _pollers[(loop, xpr.system_name)] = poller
+
+    future = loop.create_future()
+    policy = config.systems[xpr.system_name].polling if check_interval is None else FixedPolling(check_interval)
+    poller.add(_Waiter(xpr, future, timeout, policy, lazy))
+
+    return await future
+
+
+async def gather(*xprs, timeout=3600, check_interval=None, verbose=False, lazy=False, return_exceptions=False):
+    """Wait for results of many jobs, sharing status queries and remote copies among all jobs on each system
+
+    Parameters
+    ----------
+    *xprs: ExPyRe
+        started jobs to wait for
+    timeout, check_interval, verbose, lazy:
+        same as for ``ExPyRe.aget_results``
+    return_exceptions: bool, default False
+        return exceptions of failed jobs in place of their results, rather than raising the first one
+
+    Returns
+    -------
+    list of (return, stdout, stderr) of each job, as returned by ``ExPyRe.get_results``
+    """
+    return await asyncio.gather(*[xpr.aget_results(timeout=timeout, check_interval=check_interval, verbose=verbose, lazy=lazy)
+                                  for xpr in xprs], return_exceptions=return_exceptions)
@@ -0,0 +1,202 @@
+"""Content-addressed store of staged input files.  Each distinct file content is stored once,
+named by its digest, and stage directories contain hardlinks to it, so that many jobs that share
+the same (possibly large) input files do not each need a separate copy.
+
+Blobs are reference counted by their hardlink count: a blob whose link count is 1 is not referenced
+by any stage directory, and can be evicted.  Since a hardlinked file is shared by every stage directory
+that uses it, blobs are made read-only.
+"""
+import os
+import errno
+import shutil
+import tempfile
+import json
+import stat
+import uuid
+
+from pathlib import Path
+
+
+class BlobStore:
+    """Content addressed store of files
+
+    Parameters
+    ----------
+    root: str / Path
+        directory containing blobs, created if needed
+    digest_cache: FileDigestCache
+        cache used to get digests of files being added
+    """
+    def __init__(self, root, digest_cache):
+        self.root = Path(root)
+        self.digest_cache = digest_cache
+
+
+    def blob_path(self, digest):
+        """Path of blob with a given digest
+
+        Parameters
+        ----------
+        digest: bytes / str
+            digest as bytes or hex str
+
+        Returns
+        -------
+        path: Path
+        """
+        if isinstance(digest, bytes):
+            digest = digest.hex()
+        return self.root / digest
+
+
+    def add(self, filename, digest=None):
+        """Add a file to the store, if its content is not already there
+
+        Parameters
+        ----------
+        filename: str / Path
+            file to add
+        digest: bytes, optional
+            digest of file content, computed (or looked up in digest cache) if not provided
+
+        Returns
+        -------
+        digest: str hex digest of file content
+        """
+        if digest is None:
+            digest = self.digest_cache.digest(filename)
+        blob = self.blob_path(digest)
+        if not blob.exists():
+            self.root.mkdir(parents=True, exist_ok=True)
+            # copy to temporary file and rename, so blob only ever appears with its complete content
+            fd, tmp_blob = tempfile.mkstemp(dir=self.root, prefix='_tmp_')
+            os.close(fd)
+            try:
+                shutil.copy2(filename, tmp_blob)
+                mode = stat.S_IMODE(os.stat(tmp_blob).st_mode)
+                os.chmod(tmp_blob, mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+                os.replace(tmp_blob, blob)
+            except Exception:
+                Path(tmp_blob).unlink(missing_ok=True)
+                raise
+
+        return blob.name
+
+
+    def link(self, src, dest):
+        """Copy a file by adding it to the store and hardlinking the blob to the destination.
+        Signature is compatible with ``shutil.copytree`` ``copy_function``.  Falls back to a
+        regular copy if hardlinking is not possible, e.g. across filesystems.
+
+        Parameters
+        ----------
+        src: str / Path
+            file to copy
+        dest: str / Path
+            destination file
+
+        Returns
+        -------
+        digest: str hex digest of file if it was linked, None if it had to be copied
+        """
+        Path(dest).unlink(missing_ok=True)
+        for _ in range(2):
+            digest = self.add(src)
+            try:
+                os.link(self.blob_path(digest), dest)
+                return digest
+            except FileNotFoundError:
+                # blob evicted by some other process after being added, try again
+                continue
+            except OSError as exc:
+                if exc.errno in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                    break
+                raise
+
+        shutil.copy2(src, dest)
+        return None
+
+
+    def evict(self, digests=None, dry_run=False):
+        """Delete blobs that are no longer referenced by any stage directory
+
+        Parameters
+        ----------
+        digests: list(str), default None
+            hex digests of blobs to consider, or None for all blobs in store
+        dry_run: bool, default False
+            only report which blobs would be evicted
+
+        Returns
+        -------
+        evicted: list(str) hex digests of blobs that were (or would be) evicted
+        """
+        if digests is None:
+            if not self.root.is_dir():
+                return []
+            blobs = [f for f in self.root.iterdir() if not f.name.startswith('_tmp_')]
+        else:
+            blobs = [self.blob_path(digest) for digest in set(digests)]
+
+        evicted = []
+        for blob in blobs:
+            try:
+                if blob.stat().st_nlink > 1:
+                    continue
+                if not dry_run:
+                    # another process may link the blob after the check above, so it is renamed (so that it can no
+                    # longer be linked) and checked again before being deleted
+                    tmp_blob = self.root / f'_tmp_evict_{uuid.uuid4().hex}_{blob.name}'
+                    os.rename(blob, tmp_blob)
+                    if tmp_blob.stat().st_nlink > 1:
+                        # restore, unless blob was added again meanwhile
+                        try:
+                            os.link(tmp_blob, blob)
+                        except FileExistsError:
+                            pass
+                        tmp_blob.unlink()
+                        continue
+                    tmp_blob.unlink()
+            except FileNotFoundError:
+                continue
+            evicted.append(blob.name)
+
+        return evicted
+
+
+    @staticmethod
+    def write_manifest(stage_dir, store_root, linked_files):
+        """Write manifest of blobs linked into a stage dir
+
+        Parameters
+        ----------
+        stage_dir: str / Path
+            stage directory
+        store_root: str / Path
+            root of store blobs are linked from
+        linked_files: dict
+            hex digest of each linked file, keyed by its path relative to stage_dir
+        """
+        with open(Path(stage_dir) / '_expyre_blobs', 'w') as fout:
+            json.dump({'store': str(Path(store_root).absolute()), 'files': linked_files}, fout, indent=1)
+
+
+    @staticmethod
+    def read_manifest(stage_dir):
+        """Read manifest of blobs linked into a stage dir
+
+        Parameters
+        ----------
+        stage_dir: str / Path
+            stage directory
+
+        Returns
+        -------
+        manifest: dict with 'store' (str path of store root) and 'files' (dict of hex digests keyed
+            by path relative to stage dir), or None if stage dir has no manifest
+        """
+        try:
+            with open(Path(stage_dir) / '_expyre_blobs') as fin:
+                return json.load(fin)
+        except FileNotFoundError:
+            return None
@@ -10,6 +10,7 @@ import numpy as np
 import click
 from ..jobsdb import JobsDB
 from ..func import ExPyRe
+from ..units import time_to_sec
 from .. import config
 
 
@@ -167,6 +168,32 @@ def cli_db_unlock(ctx):
     config.db.unlock()
 
 
+@cli.command("db_compact")
+@click.option("--older-than", "-o", help="move jobs whose status was set longer ago than this time (number with "
+              "optional s, m, h, d suffix)", default="30d", show_default=True)
+@click.option("--status", "-s", help="comma separated list of status values to move, from "
+              f"{', '.join(JobsDB.compactable_status)}", default="processed,cleaned", show_default=True)
+@click.option("--no-vacuum", is_flag=True, help="do not rebuild database files to shrink them")
+@click.pass_context
+def cli_db_compact(ctx, older_than, status, no_vacuum):
+    """Move old jobs that are processed or cleaned to archive, and shrink the database
+
+    Archived jobs are not listed by other commands, but can be read with
+    ``JobsDB.jobs(archived=True)``.
+    """
+    status = [stat.strip() for stat in status.split(',')]
+    invalid_status = [stat for stat in status if stat not in JobsDB.compactable_status]
+    if len(invalid_status) > 0:
+        raise click.BadParameter(f"invalid status {', '.join(invalid_status)}, only jobs with status "
+                                 f"{', '.join(JobsDB.compactable_status)} can be archived", param_hint="'--status'")
+
+    res = config.db.compact(time_to_sec(older_than), status=status, vacuum=not no_vacuum)
+
+    print(f"Archived {res['archived']} jobs, {res['jobs']} jobs remain, {res['archive_jobs']} jobs in archive")
+    for filename, (size_before, size_after) in res['file_sizes'].items():
+        print(f"{filename}: {size_before / 1.0e6:.2f} MB -> {size_after / 1.0e6:.2f} MB")
+
+
 @cli.command("reset_status")
 @click.option("--id", "-i", help="comma separated list of regexps for entire job id")
 @click.option("--name", "-n", help="comma separated list of regexps for entire job name")
@@ -187,8 +214,7 @@ def cli_reset_status(ctx, id, name, status, system, new_status):
     if len(jobs) == 0:
         warnings.warn(f"sync found no jobs with status {status} to reset")
 
-    for job in jobs:
-        config.db.update(job['id'], status=new_status)
+    config.db.update_many({job['id']: {'status': new_status} for job in jobs}, source='cli')
 
 
 @cli.command("create_job")
@@ -208,7 +234,8 @@ def cli_reset_status(ctx, from_dir, system, id, name):
     if name is None:
         name = id[:-54]
 
-    config.db.add(id=id, name=name, from_dir=str(from_dir.absolute()), status="created", system=system, remote_id="NA", remote_status="unknown")
+    config.db.add(id=id, name=name, from_dir=str(from_dir.absolute()), status="created", system=system, remote_id="NA", remote_status="unknown",
+                  source="cli")
 
 
 @cli.command("fail_job")
@@ -0,0 +1,255 @@
+"""Compression codecs for task, result, and exception pickles.  A compressed file starts with a
+header line ``EXPYRE-CODEC:<name>`` that records the codec, so that it can be decoded without
+knowing in advance how (or whether) it was compressed, since an uncompressed pickle never starts
+with that header.
+
+Codecs ``zlib``, ``bz2`` and ``lzma`` use the python standard library, ``zstd`` requires the
+``zstandard`` module, and ``lz4`` requires the ``lz4`` module, on both local and remote machines.
+
+Out-of-band buffer files (see ``expyre.serialize``) are never compressed, so that they can still be
+memory-mapped.
+
+NOTE: this module is also copied verbatim into each job's remote python script, so it must only
+depend on the python standard library (other than lazily imported optional codecs).
+"""
+import os
+import io
+import contextlib
+
+HEADER_PREFIX = b'EXPYRE-CODEC:'
+
+
+def _lz4_compressor():
+    import lz4.frame
+
+    class _LZ4Compressor:
+        def __init__(self):
+            self.compressor = lz4.frame.LZ4FrameCompressor()
+            self.started = False
+
+        def compress(self, data):
+            out = b''
+            if not self.started:
+                out = self.compressor.begin()
+                self.started = True
+            return out + self.compressor.compress(data)
+
+        def flush(self):
+            return self.compress(b'') + self.compressor.flush()
+
+    return _LZ4Compressor()
+
+
+def _lz4_decompressor():
+    import lz4.frame
+    return lz4.frame.LZ4FrameDecompressor()
+
+
+def _zstd_compressor():
+    import zstandard
+    return zstandard.ZstdCompressor().compressobj()
+
+
+def _zstd_decompressor():
+    import zstandard
+    return zstandard.ZstdDecompressor().decompressobj()
+
+
+def _bz2_compressor():
+    import bz2
+    return bz2.BZ2Compressor()
+
+
+def _bz2_decompressor():
+    import bz2
+    return bz2.BZ2Decompressor()
+
+
+def _lzma_compressor():
+    import lzma
+    return lzma.LZMACompressor()
+
+
+def _lzma_decompressor():
+    import lzma
+    return lzma.LZMADecompressor()
+
+
+def _zlib_compressor():
+    import zlib
+    return zlib.compressobj()
+
+
+def _zlib_decompressor():
+    import zlib
+    return zlib.decompressobj()
+
+
+# incremental compressor and decompressor constructors for each codec
+codecs = {'zlib': (_zlib_compressor, _zlib_decompressor),
+          'bz2': (_bz2_compressor, _bz2_decompressor),
+          'lzma': (_lzma_compressor, _lzma_decompressor),
+          'zstd': (_zstd_compressor, _zstd_decompressor),
+          'lz4': (_lz4_compressor, _lz4_decompressor)}
+
+
+class CompressedWriter:
+    """File-like object that compresses everything written to it, after writing the codec header,
+    so that e.g. ``pickle.dump()`` to it does not need to hold an uncompressed copy in memory.
+
+    Parameters
+    ----------
+    fileobj: binary file object
+        file to write compressed data to
+    codec: str
+        name of codec
+    """
+    def __init__(self, fileobj, codec):
+        self.fileobj = fileobj
+        self.compressor = codecs[codec][0]()
+        self.fileobj.write(HEADER_PREFIX + codec.encode() + b'\n')
+
+    def write(self, data):
+        self.fileobj.write(self.compressor.compress(data))
+        return len(data)
+
+    def close(self):
+        self.fileobj.write(self.compressor.flush())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+
+
+def writer(fileobj, codec):
+    """Context manager for writing to a file compressed with a codec
+
+    Parameters
+    ----------
+    fileobj: binary file object
+        file to write to
+    codec: str / None
+        name of codec, or None for uncompressed
+
+    Returns
+    -------
+    writer: CompressedWriter, or fileobj itself if codec is None
+    """
+    if codec is None:
+        return contextlib.nullcontext(fileobj)
+    return CompressedWriter(fileobj, codec)
+
+
+def codec_of(filename):
+    """Get codec a file is compressed with
+
+    Parameters
+    ----------
+    filename: str / Path
+        file to check
+
+    Returns
+    -------
+    codec: str name of codec, or None if file is uncompressed
+    """
+    with open(filename, 'rb') as fin:
+        if fin.read(len(HEADER_PREFIX)) != HEADER_PREFIX:
+            return None
+        return fin.readline().decode().strip()
+
+
+class _DecompressingReader(io.RawIOBase):
+    # raw stream of decompressed data, for buffering by io.BufferedReader
+    def __init__(self, fileobj, codec, chunk_size):
+        self.fileobj = fileobj
+        self.decompressor = codecs[codec][1]()
+        self.chunk_size = chunk_size
+        self.pending = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, buf):
+        while len(self.pending) == 0:
+            chunk = self.fileobj.read(self.chunk_size)
+            if not chunk:
+                return 0
+            # memoryview, so that slicing off what has been read does not copy the rest
+            self.pending = memoryview(self.decompressor.decompress(chunk))
+        n = min(len(buf), len(self.pending))
+        buf[:n] = self.pending[:n]
+        self.pending = self.pending[n:]
+        return n
+
+    def close(self):
+        self.fileobj.close()
+        super().close()
+
+
+def open_read(filename, chunk_size=4 * 1024 * 1024):
+    """Open a file for reading, decompressing it as it is read if it has a codec header, so that
+    e.g. a sequence of pickles can be loaded one at a time without decompressing the entire file
+
+    Parameters
+    ----------
+    filename: str / Path
+        file to open
+    chunk_size: int, default 4 MB
+        size of chunks to decompress at a time
+
+    Returns
+    -------
+    fileobj: binary file object
+    """
+    fin = open(filename, 'rb')
+    try:
+        if fin.read(len(HEADER_PREFIX)) != HEADER_PREFIX:
+            fin.seek(0)
+            return fin
+        codec = fin.readline().decode().strip()
+        return io.BufferedReader(_DecompressingReader(fin, codec, chunk_size), buffer_size=chunk_size)
+    except Exception:
+        fin.close()
+        raise
+
+
+def read(filename, chunk_size=4 * 1024 * 1024):
+    """Read a file, decompressing it if it has a codec header
+
+    Parameters
+    ----------
+    filename: str / Path
+        file to read
+    chunk_size: int, default 4 MB
+        size of chunks to decompress at a time
+
+    Returns
+    -------
+    data: bytes uncompressed content
+    """
+    with open_read(filename, chunk_size) as fin:
+        return fin.read()
+
+
+def recode(filename, codec):
+    """Rewrite a file compressed with a codec, decompressing it first if needed
+
+    Parameters
+    ----------
+    filename: str / Path
+        file to rewrite
+    codec: str / None
+        name of codec, or None for uncompressed
+    """
+    if codec_of(filename) == codec:
+        return
+
+    data = memoryview(read(filename))
+    chunk_size = 4 * 1024 * 1024
+    with open(str(filename) + '.tmp', 'wb') as fout_raw, writer(fout_raw, codec) as fout:
+        for chunk_start in range(0, len(data), chunk_size):
+            fout.write(data[chunk_start:chunk_start + chunk_size])
+    os.replace(str(filename) + '.tmp', filename)
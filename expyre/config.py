@@ -14,6 +14,14 @@ systems: dict
     dict of expyre.system.System that jobs can run on
 db: JobsDB
     expyre.jobsdb.JobsDB database of jobs
+file_digests: FileDigestCache
+    expyre.filehash.FileDigestCache cache of input file content digests
+blob_store: BlobStore
+    expyre.blobstore.BlobStore content-addressed store that input files are hardlinked from,
+    None unless enabled with ``"blob_store": true`` in ``config.json``
+sync_threads: int
+    max number of threads used to sync results, i.e. run status queries and remote copies of
+    all systems and job groups concurrently, from ``"sync_threads"`` in ``config.json``, default 8
 """
 import sys
 import os
@@ -94,18 +102,23 @@ def _get_config(root_dir, verbose=False):
 local_stage_dir = None
 systems = None
 db = None
+file_digests = None
+blob_store = None
+sync_threads = 8
 
 
 def init(root_dir, verbose=False):
-    """Initializes ``root``, ``systems``, ``db``"""
+    """Initializes ``root``, ``systems``, ``db``, ``file_digests``, ``blob_store``, ``sync_threads``"""
 
     import os
 
     from .units import time_to_sec, mem_to_kB
     from .system import System
     from .jobsdb import JobsDB
+    from .filehash import FileDigestCache
+    from .blobstore import BlobStore
 
-    global local_stage_dir, systems, db
+    global local_stage_dir, systems, db, file_digests, blob_store, sync_threads
 
     try:
         local_stage_dir, _config_data = _get_config(root_dir, verbose=verbose)
@@ -113,6 +126,9 @@ def init(root_dir, verbose=False):
         local_stage_dir = None
         systems = {}
         db = None
+        file_digests = None
+        blob_store = None
+        sync_threads = 8
         return
 
     if local_stage_dir.name == '.expyre' or local_stage_dir.name == '_expyre':
@@ -133,9 +149,18 @@ def init(root_dir, verbose=False):
             for _partitions in _sys_data['partitions']:
                 _sys_data['partitions'][_partitions]['max_time'] = time_to_sec(_sys_data['partitions'][_partitions]['max_time'])
                 _sys_data['partitions'][_partitions]['max_mem'] = mem_to_kB(_sys_data['partitions'][_partitions]['max_mem'])
-        systems[_sys_name] = System(rundir_extra=_rundir_extra, **_sys_data)
-
-    db = JobsDB(local_stage_dir / 'jobs.db')
+        systems[_sys_name] = System(rundir_extra=_rundir_extra, status_cache_dir=local_stage_dir, **_sys_data)
+
+    db = JobsDB(local_stage_dir / 'jobs.db', busy_timeout=_config_data.get('db_busy_timeout', 60.0),
+                journal_mode=_config_data.get('db_journal_mode', 'WAL'),
+                events_retention=time_to_sec(_config_data.get('db_events_retention', '90d')),
+                archive_filename=(local_stage_dir / _config_data['db_archive'] if _config_data.get('db_archive') is not None else None))
+    file_digests = FileDigestCache(local_stage_dir / 'file_digests.db')
+    if _config_data.get('blob_store', False):
+        blob_store = BlobStore(local_stage_dir / 'blobs', file_digests)
+    else:
+        blob_store = None
+    sync_threads = _config_data.get('sync_threads', 8)
     if verbose:
         sys.stderr.write(f'expyre config got systems {list(systems.keys())}\n')
 
@@ -0,0 +1,224 @@
+"""``concurrent.futures.Executor`` that runs each call as an ExPyRe job, so that workflow code
+can use ``submit()`` and ``map()`` instead of creating, starting, and getting results of jobs itself.
+"""
+import asyncio
+import functools
+import itertools
+import threading
+
+from concurrent.futures import Executor
+
+from .func import ExPyRe
+
+
+class _Slot:
+    """One of the ``max_in_flight`` slots of an executor, held by a job until its task has ended, including
+    cancelling its remote job, or until its future is cancelled, if its task never started.  Released only once.
+    """
+    def __init__(self, semaphore):
+        self.semaphore = semaphore
+        self.lock = threading.Lock()
+        self.started = False
+        self.released = False
+
+
+    def start(self):
+        with self.lock:
+            self.started = True
+
+
+    def release(self, if_not_started=False):
+        with self.lock:
+            if self.released or (if_not_started and self.started):
+                return
+            self.released = True
+        self.semaphore.release()
+
+
+class ExPyReExecutor(Executor):
+    """Executor that runs each submitted call as a remote job on a system
+
+    All jobs are waited for by an event loop in one background thread, which polls all outstanding
+    jobs together (see ``ExPyRe.aget_results``), so each check is one scheduler status command and
+    one remote copy for all of them, while new jobs are created and started in worker threads.
+    Futures resolve to the value returned by the function, or raise its exception.  Stdout and stderr of the function are not returned,
+    but are kept in each job's stage dir.
+
+    Parameters
+    ----------
+    system_name: str
+        name of system in config.systems
+    resources: dict or Resources
+        resources to use for each job
+    name: str, default 'executor'
+        name of each job
+    max_in_flight: int, default 100
+        max number of jobs that are submitted but not finished.  ``submit()`` blocks when this many
+        are outstanding, and ``map()`` only consumes its inputs as earlier jobs finish
+    timeout: int or str, default None
+        max time to wait for each job, None to wait forever
+    check_interval: int, default None
+        time to wait (in sec) between checks of job completion, None to use system's polling policy
+    header_extra, exact_fit, partial_node, python_cmd:
+        passed to ``ExPyRe.start``
+    expyre_kwargs: dict, default {}
+        other keyword arguments for ``ExPyRe`` constructor, e.g. input_files or output_files
+    """
+    def __init__(self, system_name, resources, name='executor', max_in_flight=100, timeout=None, check_interval=None,
+                 header_extra=[], exact_fit=True, partial_node=False, python_cmd='python3', expyre_kwargs={}):
+        self.system_name = system_name
+        self.resources = resources
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.check_interval = check_interval
+        self.start_kwargs = {'header_extra': header_extra, 'exact_fit': exact_fit, 'partial_node': partial_node,
+                             'python_cmd': python_cmd}
+        self.expyre_kwargs = expyre_kwargs
+
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._shutdown = False
+        self._shutdown_lock = threading.Lock()
+        self._futures = set()
+        # only accessed from event loop thread
+        self._tasks = set()
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run_loop, daemon=True)
+        self._thread.start()
+
+
+    def _run_loop(self):
+        self._loop.run_forever()
+        self._loop.close()
+
+
+    async def _run(self, fn, args, kwargs, slot):
+        slot.start()
+        self._tasks.add(asyncio.current_task())
+        loop = asyncio.get_running_loop()
+        xpr = None
+        started = None
+        try:
+            # creating (pickling, hashing, staging) and starting (copying, submitting) a job block, so they are done
+            # in other threads, and other jobs are still polled meanwhile
+            xpr = await loop.run_in_executor(None, functools.partial(ExPyRe, self.name, function=fn, args=list(args),
+                                                                     kwargs=kwargs, **self.expyre_kwargs))
+            started = loop.run_in_executor(None, functools.partial(xpr.start, self.resources, system_name=self.system_name,
+                                                                   **self.start_kwargs))
+            # shielded, since start continues in its thread even if task is cancelled
+            await asyncio.shield(started)
+            results, _stdout, _stderr = await xpr.aget_results(timeout=self.timeout, check_interval=self.check_interval)
+            return results
+        except asyncio.CancelledError:
+            if xpr is not None:
+                # job can only be cancelled once it has been submitted
+                if started is not None and not started.done():
+                    await asyncio.wait([started])
+                await loop.run_in_executor(None, xpr.cancel)
+            raise
+        finally:
+            self._tasks.discard(asyncio.current_task())
+            # only now, since a cancelled job is in flight until it has been cancelled remotely
+            slot.release()
+
+
+    def submit(self, fn, /, *args, **kwargs):
+        """Submit a call of fn(\\*args, \\*\\*kwargs) as a remote job, blocking while ``max_in_flight``
+        jobs are outstanding
+
+        Returns
+        -------
+        concurrent.futures.Future with value returned by fn
+        """
+        with self._shutdown_lock:
+            if self._shutdown:
+                raise RuntimeError('cannot schedule new futures after shutdown')
+
+        self._slots.acquire()
+        slot = _Slot(self._slots)
+        future = asyncio.run_coroutine_threadsafe(self._run(fn, args, kwargs, slot), self._loop)
+        with self._shutdown_lock:
+            self._futures.add(future)
+        future.add_done_callback(functools.partial(self._done, slot=slot))
+
+        return future
+
+
+    def _done(self, future, slot):
+        with self._shutdown_lock:
+            self._futures.discard(future)
+        # future is done as soon as it is cancelled, but its task releases slot when it ends, unless it never started
+        slot.release(if_not_started=True)
+
+
+    def map(self, fn, *iterables, timeout=None, chunksize=1):
+        """Like ``concurrent.futures.Executor.map``, except that iterables are consumed lazily, submitting
+        a new job only as results of earlier ones are returned, so at most ``max_in_flight`` are outstanding
+
+        Parameters
+        ----------
+        fn: callable
+            function to call
+        *iterables:
+            iterables of positional args, possibly infinite
+        timeout: float, default None
+            max time (in sec) to wait for each result
+        chunksize: int, default 1
+            ignored, each call is a separate job
+
+        Returns
+        -------
+        iterator over values returned by fn, in order
+        """
+        args_iter = zip(*iterables)
+        pending = [self.submit(fn, *args) for args in itertools.islice(args_iter, self.max_in_flight)]
+
+        def _results():
+            try:
+                while len(pending) > 0:
+                    result = pending.pop(0).result(timeout)
+                    for args in itertools.islice(args_iter, 1):
+                        pending.append(self.submit(fn, *args))
+                    yield result
+            finally:
+                for future in pending:
+                    future.cancel()
+
+        return _results()
+
+
+    async def _stop_when_idle(self):
+        while len(self._tasks) > 0:
+            await asyncio.wait(list(self._tasks))
+        # stop pollers that are still checking jobs of cancelled futures
+        others = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in others:
+            task.cancel()
+        await asyncio.gather(*others, return_exceptions=True)
+        self._loop.stop()
+
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        """Stop accepting new jobs, and stop background thread once outstanding jobs are done
+
+        Parameters
+        ----------
+        wait: bool, default True
+            wait for outstanding jobs to finish
+        cancel_futures: bool, default False
+            cancel all outstanding futures (and their remote jobs)
+        """
+        with self._shutdown_lock:
+            already_shutdown = self._shutdown
+            self._shutdown = True
+            futures = list(self._futures)
+
+        if cancel_futures:
+            for future in futures:
+                future.cancel()
+
+        if not already_shutdown:
+            asyncio.run_coroutine_threadsafe(self._stop_when_idle(), self._loop)
+        if wait:
+            self._thread.join()
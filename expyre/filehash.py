@@ -0,0 +1,136 @@
+"""Hashing of file contents for job identification, streaming each file in chunks so that
+large input files are never read into memory all at once, hashing several files in parallel,
+and caching digests persistently so that unchanged files are not reread.
+"""
+import os
+import sqlite3
+import hashlib
+import threading
+
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+
+def file_digest(filename, chunk_size=4 * 1024 * 1024):
+    """Compute sha256 digest of a file's content, reading it in chunks
+
+    Parameters
+    ----------
+    filename: str / Path
+        file to hash
+    chunk_size: int, default 4 MB
+        number of bytes to read at a time
+
+    Returns
+    -------
+    digest: bytes
+    """
+    h = hashlib.sha256()
+    buf = bytearray(chunk_size)
+    view = memoryview(buf)
+    with open(filename, 'rb', buffering=0) as fin:
+        while True:
+            n = fin.readinto(buf)
+            if not n:
+                break
+            # hashlib releases the GIL for large updates, so threads hashing different files overlap
+            h.update(view[:n])
+    return h.digest()
+
+
+class FileDigestCache:
+    """Persistent cache of file content digests, stored in an sqlite database.  A cached digest
+    is reused as long as the file's path, size, modification time (ns) and inode are unchanged.
+
+    Parameters
+    ----------
+    db_filename: str / Path
+        database file, created if it does not exist
+    max_workers: int, default None
+        max number of threads to use to hash files that are not in the cache, None for
+        ThreadPoolExecutor default
+    """
+    def __init__(self, db_filename, max_workers=None):
+        self.db_filename = db_filename
+        self.max_workers = max_workers
+        # connect lazily, so that an ExPyRe with no input files does not need the file at all.
+        # One connection per thread (and process), since ExPyRe objects may be created from several threads
+        # at once, e.g. by ExPyReExecutor, and an sqlite connection must not be used concurrently.
+        self._local = threading.local()
+
+
+    @property
+    def db(self):
+        if getattr(self._local, 'pid', None) != os.getpid():
+            db = sqlite3.connect(self.db_filename, timeout=60)
+            with db:
+                db.execute('CREATE TABLE IF NOT EXISTS digests (path TEXT PRIMARY KEY, size INTEGER, '
+                           'mtime_ns INTEGER, inode INTEGER, digest BLOB)')
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return self._local.db
+
+
+    @staticmethod
+    def _key(filename):
+        st = os.stat(filename)
+        return (str(Path(filename).absolute()), st.st_size, st.st_mtime_ns, st.st_ino)
+
+
+    def digests(self, filenames):
+        """Get digests of several files, from cache when possible, otherwise hashing (in parallel)
+        and saving to cache
+
+        Parameters
+        ----------
+        filenames: list(str / Path)
+            files to get digests of
+
+        Returns
+        -------
+        digests: list(bytes) in same order as filenames
+        """
+        keys = [FileDigestCache._key(f) for f in filenames]
+        digests = [None] * len(keys)
+
+        db = self.db
+        missing = []
+        for key_i, key in enumerate(keys):
+            row = db.execute('SELECT size, mtime_ns, inode, digest FROM digests WHERE path = ?',
+                                  (key[0],)).fetchone()
+            if row is not None and tuple(row[0:3]) == key[1:]:
+                digests[key_i] = row[3]
+            else:
+                missing.append(key_i)
+
+        if len(missing) == 0:
+            return digests
+
+        if len(missing) == 1:
+            new_digests = [file_digest(keys[missing[0]][0])]
+        else:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                new_digests = list(executor.map(file_digest, [keys[key_i][0] for key_i in missing]))
+
+        for key_i, digest in zip(missing, new_digests):
+            digests[key_i] = digest
+        with db:
+            db.executemany('INSERT OR REPLACE INTO digests (path, size, mtime_ns, inode, digest) VALUES (?, ?, ?, ?, ?)',
+                                [keys[key_i] + (digest,) for key_i, digest in zip(missing, new_digests)])
+
+        return digests
+
+
+    def digest(self, filename):
+        """Get digest of one file, from cache if possible
+
+        Parameters
+        ----------
+        filename: str / Path
+            file to get digest of
+
+        Returns
+        -------
+        digest: bytes
+        """
+        return self.digests([filename])[0]
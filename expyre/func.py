@@ -10,9 +10,10 @@
 import sys
 import os
 import time
-import itertools
 import re
 import warnings
+import asyncio
+import concurrent.futures
 
 import shutil
 import tempfile
@@ -25,12 +26,19 @@ import hashlib
 import base64
 
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 
 from . import config
 from .subprocess import subprocess_run
 from .resources import Resources
+from .system import SubmitManyError
 from .jobsdb import JobsDB
+from .blobstore import BlobStore
+from . import serialize
+from . import compression
 from .units import time_to_sec
+from .polling import FixedPolling
+from .filehash import file_digest
 
 class ExPyReJobDiedError(Exception):
     """Exception that is raised when ExPyRe remote job appears to have been killed
@@ -79,6 +87,14 @@ class ExPyRe:
     	positional arguments to function
     kwargs: dict
     	keyword arguments to function
+    oob_buffer_min_size: int, optional
+    	if present, pickle function, arguments, and results with protocol 5, writing buffers (e.g. numpy
+    	arrays, bytes) of at least this many bytes out-of-band to separate files, which are hashed directly
+    	from memory and memory-mapped when loaded.  Requires python >= 3.8 on remote system.
+    stream_results: bool, default False
+    	if function returns a list, tuple, or iterator (e.g. generator), write each item as a separate
+    	pickle frame, so that neither the remote job nor ``get_results(lazy=True)`` needs the entire
+    	result in memory at once
     _from_db_info: dict, optional (intended for internal use)
     	restart is from db, and dict contains special arguments: remote_id, system_name, status, stage_dir
 
@@ -87,7 +103,7 @@ class ExPyRe:
 
     def __init__(self, name, *, input_files=[], env_vars=[], pre_run_commands=[], post_run_commands=[],
                  output_files=[], try_restart_from_prev=True, hash_ignore=[],
-                 function=None, args=[], kwargs={},
+                 function=None, args=[], kwargs={}, oob_buffer_min_size=None, stream_results=False,
                  _from_db_info=None):
         
 
@@ -129,8 +145,9 @@ class ExPyRe:
             if f.startswith('/'):
                 raise ValueError(f'Absolute output path "{f}" not supported')
 
-        # pickle function and arguments
-        pickled_func = pickle.dumps((function, args, kwargs))
+        # pickle function and arguments (out-of-band buffers are written directly to stage dir below)
+        if oob_buffer_min_size is None:
+            pickled_func = pickle.dumps((function, args, kwargs))
 
         if 'EXPYRE_TIMING_VERBOSE' in os.environ:
             sys.stderr.write(f'ExPyRe {name} constructor starting hash {time.time()}\n')
@@ -142,22 +159,31 @@ class ExPyRe:
         assert all([isinstance(arg, (int, str)) for arg in hash_ignore])
         for arg_i, arg in enumerate(args):
             if arg_i not in hash_ignore:
-                h.update(pickle.dumps(arg))
+                if oob_buffer_min_size is None:
+                    h.update(pickle.dumps(arg))
+                else:
+                    serialize.hash_update(h, arg, oob_buffer_min_size)
         for arg_key in sorted(list(kwargs)):
             if arg_key not in hash_ignore:
-                h.update(pickle.dumps((arg_key, kwargs[arg_key])))
+                if oob_buffer_min_size is None:
+                    h.update(pickle.dumps((arg_key, kwargs[arg_key])))
+                else:
+                    serialize.hash_update(h, (arg_key, kwargs[arg_key]), oob_buffer_min_size)
         # hash on input filenames and content
+        subfiles = []
         for infile in input_files:
-            subfiles = [infile]
+            subfiles.append(infile)
             if infile.is_dir():
                 subfiles += sorted(infile.rglob('*'))
-            for subfile in subfiles:
-                # filename
-                h.update(str(subfile).encode())
-                if subfile.is_file():
-                    # file contents
-                    with open(subfile, 'rb') as fin:
-                        h.update(fin.read())
+        # file contents are hashed in streaming chunks, in parallel, and cached by path, size, mtime, and inode
+        content_digests = dict(zip([f for f in subfiles if f.is_file()],
+                                   config.file_digests.digests([f for f in subfiles if f.is_file()])))
+        for subfile in subfiles:
+            # filename
+            h.update(str(subfile).encode())
+            if subfile in content_digests:
+                # file contents
+                h.update(content_digests[subfile])
         # create deterministic unique identifier that can be part of filename
         arghash = base64.urlsafe_b64encode(h.digest()).decode()
 
@@ -201,8 +227,11 @@ class ExPyRe:
         if 'EXPYRE_TIMING_VERBOSE' in os.environ:
             sys.stderr.write(f'ExPyRe {name} constructor starting pickle {time.time()}\n')
         # write pickled function and arguments
-        with open(self.stage_dir / '_expyre_task_in.pckl', 'wb') as fout:
-            fout.write(pickled_func)
+        if oob_buffer_min_size is None:
+            with open(self.stage_dir / '_expyre_task_in.pckl', 'wb') as fout:
+                fout.write(pickled_func)
+        else:
+            serialize.dump((function, args, kwargs), self.stage_dir / '_expyre_task_in.pckl', oob_buffer_min_size)
 
         if len(output_files) > 0:
             with open(self.stage_dir / '_expyre_output_files', 'w') as fout:
@@ -212,12 +241,17 @@ class ExPyRe:
             sys.stderr.write(f'ExPyRe {name} constructor starting stage in files {time.time()}\n')
         # stage in input files
         # NOTE: does this require more thought?
+        linked_files = {}
         for f in input_files:
             if f.is_absolute():
                 # copy absolute path into stage_dir stripping all leading components
-                ExPyRe._copy(None, self.stage_dir, f)
+                linked_files.update(ExPyRe._copy(None, self.stage_dir, f, blob_store=config.blob_store))
             else:
-                ExPyRe._copy(Path.cwd(), self.stage_dir, f)
+                linked_files.update(ExPyRe._copy(Path.cwd(), self.stage_dir, f, blob_store=config.blob_store))
+        if len(linked_files) > 0:
+            # record hardlinked files so System can stage them via remote blob store, and clean can evict them
+            BlobStore.write_manifest(self.stage_dir, config.blob_store.root,
+                                     {str(out_file.relative_to(self.stage_dir)): digest for out_file, digest in linked_files.items()})
         sys.stderr.write(f'ExPyRe {name} constructor done stage in files {time.time()}\n')
 
 
@@ -240,22 +274,70 @@ class ExPyRe:
         # Below always write to temporary file and then mv to try to make creation of final files more atomic
 
         # create core of remote job script
+        if oob_buffer_min_size is None:
+            load_task = '    (function, args, kwargs) = pickle.loads(read("_expyre_task_in.pckl"))\n'
+            dump_func = ('    def _dump(obj, fout):\n'
+                         '        pickle.dump(obj, fout)\n')
+        else:
+            # memory-map input buffers, write large result buffers to _expyre_job_succeeded.buf.<i>
+            load_task = ('    import mmap\n'
+                         '    def _map_buffers(fname):\n'
+                         '        buf_i = 0\n'
+                         '        while os.path.exists(f"{fname}.buf.{buf_i}"):\n'
+                         '            with open(f"{fname}.buf.{buf_i}", "rb") as fin_buf:\n'
+                         '                if os.fstat(fin_buf.fileno()).st_size == 0:\n'
+                         '                    yield bytearray()\n'
+                         '                else:\n'
+                         '                    yield mmap.mmap(fin_buf.fileno(), 0, access=mmap.ACCESS_COPY)\n'
+                         '            buf_i += 1\n'
+                         '    (function, args, kwargs) = pickle.loads(read("_expyre_task_in.pckl"),\n'
+                         '                                            buffers=_map_buffers("_expyre_task_in.pckl"))\n')
+            dump_func = ('    class _OOBPickler(pickle._Pickler):\n'
+                            '        def reducer_override(self, obj):\n'
+                           f'            if type(obj) in (bytes, bytearray) and len(obj) >= {oob_buffer_min_size}:\n'
+                            '                return type(obj), (pickle.PickleBuffer(obj),)\n'
+                            '            return NotImplemented\n'
+                            '    n_bufs = 0\n'
+                            '    def _write_buffer(buf):\n'
+                            '        global n_bufs\n'
+                            '        raw = buf.raw()\n'
+                           f'        if raw.nbytes < {oob_buffer_min_size}:\n'
+                            '            return True\n'
+                            '        with open(f"_expyre_job_succeeded.buf.{n_bufs}", "wb") as fout_buf:\n'
+                            '            fout_buf.write(raw)\n'
+                            '        n_bufs += 1\n'
+                            '        return False\n'
+                            '    def _dump(obj, fout):\n'
+                            '        _OOBPickler(fout, protocol=5, buffer_callback=_write_buffer).dump(obj)\n')
         with open(self.stage_dir / '_expyre_script_core.py', 'w') as fout:
-            fout.write('try:\n'
-                       '    import pickle, traceback, sys\n'
-                       '    with open("_expyre_task_in.pckl", "rb") as fin:\n'
-                       '        (function, args, kwargs) = pickle.load(fin)\n'
+            # compression codec functions, so remote does not need expyre installed
+            fout.write(Path(compression.__file__).read_text() + '\n\n')
+            # codec for results is set by start(), depending on system
+            fout.write('codec = None\n'
+                       'if os.path.exists("_expyre_codec"):\n'
+                       '    with open("_expyre_codec") as fin:\n'
+                       '        codec = fin.read().strip()\n'
+                       'try:\n'
+                       '    import pickle, traceback, sys\n' +
+                       load_task +
                        '    stdout_orig = sys.stdout\n'
                        '    stderr_orig = sys.stderr\n'
                        '    sys.stdout = open("_expyre_stdout", "w")\n'
                        '    sys.stderr = open("_expyre_stderr", "w")\n'
-                       '    results = function(*args, **kwargs)\n'
+                       '    results = function(*args, **kwargs)\n' +
+                       dump_func +
+                       # stdout/stderr restored after writing results, since a generator's code runs as it is written
+                       '    with open(f"_tmp_expyre_job_succeeded", "wb") as fout_raw, writer(fout_raw, codec) as fout:\n'
+                      f'        if {stream_results} and (isinstance(results, (list, tuple)) or hasattr(results, "__next__")):\n'
+                      f'            _dump({serialize.FRAMES_HEADER!r}, fout)\n'
+                       '            for item in results:\n'
+                       '                _dump(item, fout)\n'
+                       '        else:\n'
+                       '            _dump(results, fout)\n'
                        '    sys.stdout = stdout_orig\n'
                        '    sys.stderr = stderr_orig\n'
-                       '    with open(f"_tmp_expyre_job_succeeded", "wb") as fout:\n'
-                       '        pickle.dump(results, fout)\n'
                        'except Exception as exc:\n'
-                       '    with open(f"_expyre_exception", "wb") as fout:\n'
+                       '    with open(f"_expyre_exception", "wb") as fout_raw, writer(fout_raw, codec) as fout:\n'
                        '        pickle.dump(exc, fout)\n'
                        '    with open(f"_expyre_error", "w") as fout:\n'
                        '        fout.write(f"Exception: {exc}\\n")\n'
@@ -287,20 +369,23 @@ class ExPyRe:
                               '        mv _tmp_expyre_job_error _expyre_job_error',
                               '    fi',
                               'fi',
+                              # manifest commands are inserted here for systems with two-phase sync, see _prepare_start
+                              # last, so that all other files are complete once this exists
+                              'touch _expyre_job_finished',
                               ''])
 
         # save to file in stage dir
         with open(self.stage_dir / '_expyre_post_run_commands', 'w') as fout:
             fout.write('\n'.join(post_run_commands) + '\n')
 
-        config.db.add(self.id, name=name, from_dir=str(self.stage_dir), status=self.status)
+        config.db.add(self.id, name=name, from_dir=str(self.stage_dir), status=self.status, source='constructor')
 
         if 'EXPYRE_TIMING_VERBOSE' in os.environ:
             sys.stderr.write(f'ExPyRe {name} constructor end {time.time()}\n')
 
 
     @staticmethod
-    def _copy(in_dir, out_dir, file_glob):
+    def _copy(in_dir, out_dir, file_glob, blob_store=None):
         """ Copy files from in_dir to out_dir, including globs in filenames.
         If file_glob is absolute, file or directory is copied into out_dir with all of file's
             leading path components remove, i.e. file_glob -> out_dir / file_glob.name
@@ -315,6 +400,12 @@ class ExPyRe:
             output directory
         file_glob: str or Path
             glob of file or directory to copy (recursively), absolute iff in_dir is None
+        blob_store: BlobStore, optional
+            if present, add files to this store and hardlink them into out_dir instead of copying
+
+        Returns
+        -------
+        linked_files: dict of hex digest for each file that was hardlinked from blob_store, keyed by output Path
         """
         out_dir = Path(out_dir)
         file_glob = Path(file_glob)
@@ -348,6 +439,18 @@ class ExPyRe:
         in_files = [f for f in in_files if f not in excluded_files]
         if len(in_files) == 0:
             raise RuntimeError(f'File glob "{file_glob}" (excluding {exclude_glob}) in input_files does not match any files')
+
+        linked_files = {}
+        if blob_store is not None:
+            def _copy_file(src, dest):
+                digest = blob_store.link(src, dest)
+                if digest is not None:
+                    linked_files[Path(dest)] = digest
+            copytree_kwargs = {'copy_function': _copy_file}
+        else:
+            _copy_file = shutil.copy
+            copytree_kwargs = {}
+
         for in_file in in_files:
             if strip_leading:
                 rel_out_file = in_file.name
@@ -358,9 +461,11 @@ class ExPyRe:
 
             out_file.parent.mkdir(parents=True, exist_ok=True)
             try:
-                shutil.copytree(in_file, out_file, dirs_exist_ok=True)
+                shutil.copytree(in_file, out_file, dirs_exist_ok=True, **copytree_kwargs)
             except NotADirectoryError:
-                shutil.copy(in_file, out_file)
+                _copy_file(in_file, out_file)
+
+        return linked_files
 
 
     @property
@@ -405,6 +510,238 @@ class ExPyRe:
                 pass
 
 
+    def _prepare_start(self, system, python_cmd):
+        """Prepare stage dir for submission to a system
+
+        Parameters
+        ----------
+        system: System
+            system job will be submitted to
+        python_cmd: str
+            name of python interpreter to use on remote machine
+
+        Returns
+        -------
+        list(str) commands to run job
+        """
+        # compress task with system's codec, and tell remote job to compress results with it
+        compression.recode(self.stage_dir / '_expyre_task_in.pckl', system.compression)
+        if system.compression is None:
+            (self.stage_dir / '_expyre_codec').unlink(missing_ok=True)
+        else:
+            with open(self.stage_dir / '_expyre_codec', 'w') as fout:
+                fout.write(system.compression + '\n')
+
+        with open(self.stage_dir / '_expyre_pre_run_commands') as fin:
+            pre_run_commands = fin.readlines()
+        with open(self.stage_dir / '_expyre_post_run_commands') as fin:
+            post_run_commands = fin.readlines()
+        if system.two_phase_sync:
+            finished_i = post_run_commands.index('touch _expyre_job_finished\n')
+            post_run_commands[finished_i:finished_i] = [line + '\n' for line in ExPyRe._manifest_commands]
+
+        return pre_run_commands + [f'{python_cmd} _expyre_script_core.py'] + post_run_commands
+
+
+    def _write_task_commands(self, system, python_cmd):
+        # prepare stage dir for submission as part of a scheduler job that runs several jobs, writing
+        # commands to _expyre_task_commands, since they are specific to each job (e.g. env vars)
+        with open(self.stage_dir / '_expyre_task_commands', 'w') as fout:
+            fout.write(''.join([line if line.endswith('\n') else line + '\n'
+                                for line in self._prepare_start(system, python_cmd)]))
+
+
+    @staticmethod
+    def _not_started(xprs):
+        # jobs that need to be started, checking that others were recreated (same check as in start())
+        xprs_to_start = []
+        for xpr in xprs:
+            if xpr.status != 'created':
+                assert xpr.recreated
+                continue
+            xprs_to_start.append(xpr)
+        return xprs_to_start
+
+
+    @staticmethod
+    def start_packed(xprs, resources, system_name=os.environ.get('EXPYRE_SYS', None), header_extra=[],
+                     exact_fit=True, partial_node=False, python_cmd='python3', tasks_per_job=None, cores_per_task=1):
+        """Start many jobs on a remote machine packed into scheduler jobs, each of which runs up to tasks_per_job
+        of them concurrently, as many at a time as fit into its cores, staging out all of their files at once.
+        Each job is tracked separately, as though it had been started individually with ``start``, although
+        jobs packed together share a remote id (so, e.g., cancelling one cancels all of them).
+
+        Parameters
+        ----------
+        xprs: list(ExPyRe)
+            jobs to start. Jobs that are not newly created (e.g. recreated from a previous run) are skipped.
+        resources: dict or Resources
+            resources for each scheduler job, which should be a single node, since all of its tasks run on
+            the node that runs the job script
+        tasks_per_job: int, default None
+            max number of jobs to pack into each scheduler job, or None for all of them
+        cores_per_task: int, default 1
+            number of cores used by each job, which is its EXPYRE_NUM_CORES
+        system_name, header_extra, exact_fit, partial_node, python_cmd:
+            same as for ``start``
+        """
+        xprs_to_start = ExPyRe._not_started(xprs)
+
+        if len(xprs_to_start) == 0:
+            return
+
+        if isinstance(resources, dict):
+            resources = Resources(**resources)
+
+        system = config.systems[system_name]
+
+        if tasks_per_job is None:
+            tasks_per_job = len(xprs_to_start)
+        for chunk_start in range(0, len(xprs_to_start), tasks_per_job):
+            xprs_chunk = xprs_to_start[chunk_start:chunk_start + tasks_per_job]
+
+            for xpr in xprs_chunk:
+                xpr.system_name = system_name
+                xpr._write_task_commands(system, python_cmd)
+
+            remote_id = system.submit_packed(f'packed_{xprs_chunk[0].id}', [xpr.id for xpr in xprs_chunk],
+                                             [xpr.stage_dir for xpr in xprs_chunk], resources=resources,
+                                             header_extra=header_extra, commands=['. ./_expyre_task_commands'],
+                                             exact_fit=exact_fit, partial_node=partial_node,
+                                             cores_per_task=cores_per_task, python_cmd=python_cmd)
+
+            for xpr in xprs_chunk:
+                xpr.remote_id = remote_id
+                xpr.status = 'submitted'
+            config.db.update_many({xpr.id: dict(status=xpr.status, system=xpr.system_name, remote_id=xpr.remote_id)
+                                   for xpr in xprs_chunk}, source='start')
+            ExPyRe._log_partitions(system, xprs_chunk, [resources] * len(xprs_chunk), exact_fit, partial_node)
+
+
+    @staticmethod
+    def start_array(xprs, resources, system_name=os.environ.get('EXPYRE_SYS', None), header_extra=[],
+                    exact_fit=True, partial_node=False, python_cmd='python3'):
+        """Start many jobs on a remote machine as array jobs, staging out all of their files at once, and
+        submitting one array job (with one task per job) for every ``max_array_size`` (a per-system setting)
+        jobs.  Each job is tracked separately, using its array task remote id, as though it had been
+        started individually with ``start``.
+
+        Parameters
+        ----------
+        xprs: list(ExPyRe)
+            jobs to start, all with the same resources. Jobs that are not newly created (e.g. recreated from
+            a previous run) are skipped.
+        resources, system_name, header_extra, exact_fit, partial_node, python_cmd:
+            same as for ``start``
+        """
+        xprs_to_start = ExPyRe._not_started(xprs)
+
+        if len(xprs_to_start) == 0:
+            return
+
+        if len(xprs_to_start) == 1:
+            # some schedulers do not allow arrays with a single task
+            xprs_to_start[0].start(resources, system_name=system_name, header_extra=header_extra,
+                                   exact_fit=exact_fit, partial_node=partial_node, python_cmd=python_cmd)
+            return
+
+        if isinstance(resources, dict):
+            resources = Resources(**resources)
+
+        system = config.systems[system_name]
+
+        for chunk_start in range(0, len(xprs_to_start), system.max_array_size):
+            xprs_chunk = xprs_to_start[chunk_start:chunk_start + system.max_array_size]
+
+            for xpr in xprs_chunk:
+                xpr.system_name = system_name
+                xpr._write_task_commands(system, python_cmd)
+
+            remote_ids = system.submit_array(f'array_{xprs_chunk[0].id}', [xpr.id for xpr in xprs_chunk],
+                                             [xpr.stage_dir for xpr in xprs_chunk], resources=resources,
+                                             header_extra=header_extra, commands=['. ./_expyre_task_commands'],
+                                             exact_fit=exact_fit, partial_node=partial_node)
+
+            for xpr, remote_id in zip(xprs_chunk, remote_ids):
+                xpr.remote_id = remote_id
+                xpr.status = 'submitted'
+            config.db.update_many({xpr.id: dict(status=xpr.status, system=xpr.system_name, remote_id=xpr.remote_id)
+                                   for xpr in xprs_chunk}, source='start')
+            ExPyRe._log_partitions(system, xprs_chunk, [resources] * len(xprs_chunk), exact_fit, partial_node)
+
+
+    @staticmethod
+    def start_many(xprs, resources, system_name=os.environ.get('EXPYRE_SYS', None), header_extra=[],
+                   exact_fit=True, partial_node=False, python_cmd='python3'):
+        """Start many jobs on a remote machine, each as its own scheduler job with its own resources
+        (and therefore possibly partition), but staging out all of their files at once and submitting all
+        of them with one remote command (see ``System.submit_many``).  Jobs are tracked as though they had
+        been started individually with ``start``, and all of them are recorded in the JobsDB in one transaction.
+        If some jobs fail to submit, the others are still recorded as submitted, and the ``SubmitManyError``
+        (which lists the failed jobs) is re-raised.
+
+        Parameters
+        ----------
+        xprs: list(ExPyRe)
+            jobs to start. Jobs that are not newly created (e.g. recreated from a previous run) are skipped.
+        resources: dict or Resources, or list of them
+            resources to use for all jobs, or for each job in xprs
+        system_name, header_extra, exact_fit, partial_node, python_cmd:
+            same as for ``start``
+        """
+        if isinstance(resources, (dict, Resources)):
+            resources = [resources] * len(xprs)
+        if len(resources) != len(xprs):
+            raise ValueError(f'Got {len(resources)} resources for {len(xprs)} jobs')
+        resources = [Resources(**res) if isinstance(res, dict) else res for res in resources]
+
+        xprs_to_start = ExPyRe._not_started(xprs)
+        ids_to_start = set([xpr.id for xpr in xprs_to_start])
+        resources = [res for xpr, res in zip(xprs, resources) if xpr.id in ids_to_start]
+
+        if len(xprs_to_start) == 0:
+            return
+
+        system = config.systems[system_name]
+
+        jobs = []
+        for xpr, res in zip(xprs_to_start, resources):
+            xpr.system_name = system_name
+            jobs.append({'id': xpr.id, 'stage_dir': xpr.stage_dir, 'resources': res,
+                         'commands': xpr._prepare_start(system, python_cmd), 'header_extra': header_extra,
+                         'exact_fit': exact_fit, 'partial_node': partial_node})
+
+        submit_error = None
+        try:
+            remote_ids = system.submit_many(jobs)
+        except SubmitManyError as exc:
+            submit_error = exc
+            remote_ids = exc.remote_ids
+
+        updates = {}
+        for xpr, remote_id in zip(xprs_to_start, remote_ids):
+            if remote_id is None:
+                continue
+            xpr.remote_id = remote_id
+            xpr.status = 'submitted'
+            updates[xpr.id] = {'status': xpr.status, 'system': xpr.system_name, 'remote_id': xpr.remote_id}
+        config.db.update_many(updates, source='start')
+        ExPyRe._log_partitions(system, [xpr for xpr, remote_id in zip(xprs_to_start, remote_ids) if remote_id is not None],
+                               [res for res, remote_id in zip(resources, remote_ids) if remote_id is not None],
+                               exact_fit, partial_node)
+
+        if submit_error is not None:
+            raise submit_error
+
+
+    @staticmethod
+    def _log_partitions(system, xprs, resources, exact_fit, partial_node):
+        # record partition each job was submitted to, for latencies of each partition (see JobsDB.latencies)
+        config.db.log_events([(xpr.id, 'partition', res.find_nodes(system.partitions, exact_fit=exact_fit,
+                                                                   partial_node=partial_node)[0])
+                              for xpr, res in zip(xprs, resources)], source='start')
+
+
     def start(self, resources, system_name=os.environ.get('EXPYRE_SYS', None), header_extra=[],
               exact_fit=True, partial_node=False, python_cmd='python3', force_rerun=False):
         """Start a job on a remote machine
@@ -444,24 +781,21 @@ class ExPyRe:
 
         self.system_name = system_name
         system = config.systems[self.system_name]
-        with open(self.stage_dir / '_expyre_pre_run_commands') as fin:
-            pre_run_commands = fin.readlines()
-        with open(self.stage_dir / '_expyre_post_run_commands') as fin:
-            post_run_commands = fin.readlines()
+
+        commands = self._prepare_start(system, python_cmd)
         if 'EXPYRE_TIMING_VERBOSE' in os.environ:
             sys.stderr.write(f'ExPyRe {self.id} start() calling system.submit {time.time()}\n')
         self.remote_id = system.submit(self.id, self.stage_dir, resources=resources, header_extra=header_extra,
-                                       commands=(pre_run_commands + [f'{python_cmd} _expyre_script_core.py'] +
-                                                 post_run_commands),
-                                       exact_fit=exact_fit, partial_node=partial_node)
+                                       commands=commands, exact_fit=exact_fit, partial_node=partial_node)
         if 'EXPYRE_TIMING_VERBOSE' in os.environ:
             sys.stderr.write(f'ExPyRe {self.id} start() done system.submit {time.time()}\n')
 
         self.status = 'submitted'
-        config.db.update(self.id, status=self.status, system=self.system_name, remote_id=self.remote_id)
+        config.db.update(self.id, status=self.status, system=self.system_name, remote_id=self.remote_id, source='start')
+        ExPyRe._log_partitions(system, [self], [resources], exact_fit, partial_node)
         # make sure remote status is not done, so get_results() actually syncs new status before giving up
         if force_rerun:
-            config.db.update(self.id, remote_status=None)
+            config.db.update(self.id, remote_status=None, source='start')
 
         if 'EXPYRE_TIMING_VERBOSE' in os.environ:
             sys.stderr.write(f'ExPyRe {self.id} start() end {time.time()}\n')
@@ -523,37 +857,219 @@ class ExPyRe:
         if len(jobs_to_sync) == 0:
             return
 
-        def _grouper(n, iterable):
-            it = iter(iterable)
-            while True:
-                chunk = tuple(itertools.islice(it, n))
-                if not chunk:
-                    return
-                yield chunk
-
-        for system_name in set([j['system'] for j in jobs_to_sync]):
-            system = config.systems[system_name]
-            # assume all jobs are staged from same place
-            stage_root = Path(jobs_to_sync[0]['from_dir']).parent
-
-            # get remote statuses and update in JobsDB
-            status_of_remote_id = system.scheduler.status([j['remote_id'] for j in jobs_to_sync], verbose=verbose)
-            for j in jobs_to_sync:
-                old_remote_status = list(config.db.jobs(id=re.escape(j['id'])))[0]['remote_status']
-                new_remote_status = status_of_remote_id[j['remote_id']]
-                if old_remote_status != new_remote_status:
-                    if cli:
-                        sys.stderr.write(f'Update remote status of {j["id"]} to {status_of_remote_id[j["remote_id"]]}\n')
-                    config.db.update(j['id'], remote_status=status_of_remote_id[j['remote_id']])
+        jobs_of_system = {}
+        for j in jobs_to_sync:
+            jobs_of_system.setdefault(j['system'], []).append(j)
+        systems = {system_name: config.systems[system_name] for system_name in jobs_of_system}
+        # assume all jobs on a system are staged from same place
+        stage_roots = {system_name: Path(jobs[0]['from_dir']).parent for system_name, jobs in jobs_of_system.items()}
+
+        # status queries and remote copies of all systems and groups run in one thread pool, with the number of
+        # concurrent copies from each host limited by its system's max_concurrent_copies
+        with ThreadPoolExecutor(max_workers=config.sync_threads) as executor:
+            # get remote statuses, and update JobsDB in this thread only
+            status_of_system = dict(zip(jobs_of_system, executor.map(
+                lambda system_name: systems[system_name].scheduler.status([j['remote_id'] for j in jobs_of_system[system_name]],
+                                                                          verbose=verbose),
+                jobs_of_system)))
+            for system_name, jobs in jobs_of_system.items():
+                ExPyRe._update_remote_status(jobs, status_of_system[system_name], cli=cli)
 
             # get remote files only _AFTER_ getting remote status, since otherwise might result in
             # a race condition:
             #    copy files while job is running, so not all files are ready
             #    while files are being copied, job finishes (but some files were not copied)
             #    update status, showing job as done (despite missing files)
-            for job_group in _grouper(n_group, jobs_to_sync):
-                system.get_remotes(stage_root, subdir_glob=[Path(j['from_dir']).name for j in job_group],
-                                   delete=delete, verbose=verbose)
+            ExPyRe._wait_all([executor.submit(systems[system_name].get_remotes, stage_roots[system_name],
+                                              subdir_glob=subdir_glob, include=include, verbose=verbose)
+                              for system_name, jobs in jobs_of_system.items()
+                              for subdir_glob, include in ExPyRe._marker_copies(systems[system_name], jobs, n_group)])
+
+            # result copies depend on marker files that were just copied
+            futures = []
+            for system_name, jobs in jobs_of_system.items():
+                system = systems[system_name]
+                manifest_files, copies = ExPyRe._result_copies(system, jobs, status_of_system[system_name], n_group)
+                if len(manifest_files) > 0:
+                    futures.append(executor.submit(system.get_remote_files, stage_roots[system_name], manifest_files,
+                                                   verbose=verbose))
+                futures.extend([executor.submit(system.get_remotes, stage_roots[system_name], subdir_glob=subdir_glob,
+                                                include=include, delete=delete, verbose=verbose)
+                                for subdir_glob, include in copies])
+            ExPyRe._wait_all(futures)
+
+
+    @staticmethod
+    def _wait_all(futures):
+        # wait for all futures to finish, so none is left running, and then raise the first exception, if any
+        concurrent.futures.wait(futures)
+        for future in futures:
+            future.result()
+
+
+    @staticmethod
+    async def _async_sync_remote_results_status_ll(system_name, jobs_to_sync, n_group=250, verbose=False):
+        """asyncio version of ``_sync_remote_results_status_ll`` for jobs on one system, which does not
+        block the event loop while waiting for the remote status and copy commands
+
+        Parameters
+        ----------
+        system_name: str
+            name of system all jobs are on
+        jobs_to_sync: list(dict)
+            list of job dicts returned by jobsdb.jobs()
+        n_group: int, default 250
+            number of jobs to do in a group with each rsync call
+        verbose: bool, default False
+            verbose output
+        """
+        if len(jobs_to_sync) == 0:
+            return
+
+        system = config.systems[system_name]
+        # assume all jobs are staged from same place
+        stage_root = Path(jobs_to_sync[0]['from_dir']).parent
+
+        # remote status before remote files, to avoid race condition (see _sync_remote_results_status_ll)
+        status_of_remote_id = await system.scheduler.astatus([j['remote_id'] for j in jobs_to_sync], verbose=verbose)
+        ExPyRe._update_remote_status(jobs_to_sync, status_of_remote_id)
+
+        # up to max_concurrent_copies copies at a time
+        copy_slots = asyncio.Semaphore(system.max_concurrent_copies)
+        async def _copy(copy_coro):
+            async with copy_slots:
+                await copy_coro
+
+        await asyncio.gather(*[_copy(system.aget_remotes(stage_root, subdir_glob=subdir_glob, include=include, verbose=verbose))
+                               for subdir_glob, include in ExPyRe._marker_copies(system, jobs_to_sync, n_group)])
+        manifest_files, copies = ExPyRe._result_copies(system, jobs_to_sync, status_of_remote_id, n_group)
+        copy_coros = [system.aget_remotes(stage_root, subdir_glob=subdir_glob, include=include, verbose=verbose)
+                      for subdir_glob, include in copies]
+        if len(manifest_files) > 0:
+            copy_coros.append(system.aget_remote_files(stage_root, manifest_files, verbose=verbose))
+        await asyncio.gather(*[_copy(copy_coro) for copy_coro in copy_coros])
+
+
+    # files that show progress of job, which are all that two-phase sync gets for jobs that have not finished
+    # commands at end of job that write manifest of result and output files, with sizes and sha256 digests, so that
+    # they can be copied with rsync --files-from, rather than by listing job dirs on the remote filesystem.  Scheduler's
+    # stdout and stderr files are still being written, so they are listed without size and digest, and always copied.
+    _manifest_commands = ['for f in _expyre_job_* _expyre_stdout _expyre_stderr; do',
+                          '    [ -e "$f" ] && echo "$f"',
+                          'done > _tmp_expyre_manifest_files',
+                          'if [ -f _expyre_output_files ]; then',
+                          '    while read -r f; do for g in $f; do [ -e "$g" ] && echo "$g"; done; done < _expyre_output_files >> _tmp_expyre_manifest_files',
+                          'fi',
+                          'while read -r f; do find "$f" -type f; done < _tmp_expyre_manifest_files | sort -u | while read -r f; do',
+                          '    echo "$(stat -c %s "$f") $(sha256sum < "$f" | cut -d " " -f 1) $f"',
+                          'done > _tmp_expyre_manifest',
+                          'for f in job.*.stdout job.*.stderr; do',
+                          '    [ -e "$f" ] && echo "- - $f"',
+                          'done >> _tmp_expyre_manifest',
+                          'rm -f _tmp_expyre_manifest_files',
+                          'mv _tmp_expyre_manifest _expyre_manifest']
+    _marker_files = ['_expyre_job_started', '_expyre_job_finished', '_expyre_manifest']
+    # files needed for results of finished job, other than its output_files
+    _result_files = ['_expyre_job_*', '_expyre_stdout', '_expyre_stderr', 'job.*.stdout', 'job.*.stderr']
+
+
+    @staticmethod
+    def _marker_copies(system, jobs, n_group):
+        # (subdir globs, include patterns) of each remote copy of first phase of sync, none unless system uses two-phase sync
+        if not system.two_phase_sync:
+            return []
+        return [([Path(j['from_dir']).name for j in jobs[group_start:group_start + n_group]], ExPyRe._marker_files)
+                for group_start in range(0, len(jobs), n_group)]
+
+
+    @staticmethod
+    def _result_copies(system, jobs, status_of_remote_id, n_group):
+        # files (relative to stage root) of jobs with a manifest that need copying, and (subdir globs, include patterns)
+        # of each remote copy of files of other jobs, which must be called after marker copies are done
+        manifest_files = []
+        if system.two_phase_sync:
+            # finished jobs, as well as any that are no longer queued or running without having finished (e.g. killed)
+            jobs = [j for j in jobs if (Path(j['from_dir']) / '_expyre_job_finished').exists() or
+                    status_of_remote_id[j['remote_id']] not in ['queued', 'held', 'running']]
+
+            # files listed in manifest that are not already identical locally, for jobs that wrote one
+            jobs_without_manifest = []
+            for j in jobs:
+                job_dir = Path(j['from_dir'])
+                if not (job_dir / '_expyre_manifest').exists():
+                    jobs_without_manifest.append(j)
+                    continue
+                manifest_files.extend([f'{job_dir.name}/{filename}' for filename in ExPyRe._manifest_missing(job_dir)])
+            jobs = jobs_without_manifest
+
+        copies = []
+        for group_start in range(0, len(jobs), n_group):
+            job_group = jobs[group_start:group_start + n_group]
+            include = None
+            if system.two_phase_sync and system.sync_only_outputs:
+                include = ExPyRe._result_files.copy()
+                for j in job_group:
+                    if (Path(j['from_dir']) / '_expyre_output_files').exists():
+                        with open(Path(j['from_dir']) / '_expyre_output_files') as fin:
+                            include += [f.strip() for f in fin.readlines() if len(f.strip()) > 0]
+                # unique, in order
+                include = list(dict.fromkeys(include))
+            copies.append(([Path(j['from_dir']).name for j in job_group], include))
+
+        return manifest_files, copies
+
+
+    @staticmethod
+    def _manifest_missing(job_dir):
+        # files listed in a job's _expyre_manifest (lines of "size sha256 path", or "- - path" for files that
+        # are always copied) that do not exist locally with the same size and content.  Digests of local files
+        # come from the digest cache, so files that were already copied are not hashed again on every sync.
+        filenames = []
+        same_size = {}
+        with open(job_dir / '_expyre_manifest') as fin:
+            for line in fin:
+                if len(line.strip()) == 0:
+                    continue
+                size, digest, filename = line.rstrip('\n').split(' ', 2)
+                filenames.append(filename)
+                local_file = job_dir / filename
+                if size != '-' and local_file.is_file() and local_file.stat().st_size == int(size):
+                    same_size[filename] = digest
+
+        if len(same_size) > 0:
+            local_files = [job_dir / filename for filename in same_size]
+            if config.file_digests is not None:
+                local_digests = config.file_digests.digests(local_files)
+            else:
+                local_digests = [file_digest(local_file) for local_file in local_files]
+            for (filename, digest), local_digest in zip(list(same_size.items()), local_digests):
+                if local_digest.hex() != digest:
+                    del same_size[filename]
+
+        return [filename for filename in filenames if filename not in same_size]
+
+
+    @staticmethod
+    def _update_remote_status(jobs, status_of_remote_id, cli=False):
+        """update 'remote_status' of jobs in JobsDB
+
+        Parameters
+        ----------
+        jobs: list(dict)
+            list of job dicts returned by jobsdb.jobs()
+        status_of_remote_id: dict
+            remote status of each remote id, as returned by Scheduler.status()
+        cli: bool, default False
+            command is being from from cli 'xpr sync'
+        """
+        if cli:
+            for j in jobs:
+                if j['remote_status'] != status_of_remote_id[j['remote_id']]:
+                    sys.stderr.write(f'Update remote status of {j["id"]} to {status_of_remote_id[j["remote_id"]]}\n')
+
+        # all changes in one transaction, skipping jobs whose remote status is unchanged
+        config.db.update_many({j['id']: {'remote_status': status_of_remote_id[j['remote_id']]} for j in jobs}, only_changed=True,
+                              source='sync')
 
 
     def clean(self, wipe=False, dry_run=False, remote_only=False, verbose=False):
@@ -584,32 +1100,43 @@ class ExPyRe:
                 system.clean_rundir(self.stage_dir, None, dry_run=dry_run, verbose=verbose or dry_run)
             # delete local stage dir
             if not remote_only:
+                blobs_manifest = BlobStore.read_manifest(self.stage_dir)
                 subprocess_run(None, ['find', str(self.stage_dir), '-type', 'd', '-exec', 'chmod', 'u+rwx', '{}', '\\;'],
                                dry_run=dry_run, verbose=verbose or dry_run)
                 subprocess_run(None, ['rm', '-rf', str(self.stage_dir)], dry_run=dry_run, verbose=verbose or dry_run)
+                if blobs_manifest is not None:
+                    # evict blobs that were only referenced by this stage dir
+                    blob_store = BlobStore(blobs_manifest['store'], config.file_digests)
+                    evicted = blob_store.evict(blobs_manifest['files'].values(), dry_run=dry_run)
+                    if dry_run or verbose:
+                        print(f'{"dry-run " if dry_run else ""}evict unreferenced blobs {evicted}')
         else:
+            # out-of-band buffers of task and results pickles, if any
+            buf_files = (serialize.buffer_files(self.stage_dir / '_expyre_task_in.pckl') +
+                         serialize.buffer_files(self.stage_dir / '_expyre_job_succeeded'))
             if system is not None:
                 # clean remote stage dir
-                system.clean_rundir(self.stage_dir, ['_expyre_task_in.pckl', '_expyre_job_succeeded'],
+                system.clean_rundir(self.stage_dir, ['_expyre_task_in.pckl', '_expyre_job_succeeded'] +
+                                                    [f.name for f in buf_files],
                                 dry_run=dry_run, verbose=verbose or dry_run)
             if dry_run:
                 print(f"dry-run overwrite local dirs {self.stage_dir / '_expyre_task_in.pckl'} and "
-                      f"{self.stage_dir / '_expyre_job_succeeded'}, and create "
+                      f"{self.stage_dir / '_expyre_job_succeeded'} {' '.join([str(f) for f in buf_files])}, and create "
                       f"{self.stage_dir / '_expyre_job_cleaned'}")
             else:
                 # clean local stage dir
                 with open(self.stage_dir / '_expyre_task_in.pckl', 'w') as fout:
                     fout.write('CLEANED\n')
-                f = self.stage_dir / '_expyre_job_succeeded'
-                if f.exists():
-                    with open(f, 'w') as fout:
-                        fout.write('CLEANED\n')
+                for f in [self.stage_dir / '_expyre_job_succeeded'] + buf_files:
+                    if f.exists():
+                        with open(f, 'w') as fout:
+                            fout.write('CLEANED\n')
                 with open(self.stage_dir / '_expyre_job_cleaned', 'w') as fout:
                     fout.write('CLEANED\n')
 
         if not dry_run:
             self.status = 'cleaned'
-            config.db.update(self.id, status=self.status)
+            config.db.update(self.id, status=self.status, source='clean')
 
 
     def _read_stdout_err(self):
@@ -643,15 +1170,108 @@ class ExPyRe:
         return stdout, stderr, job_stdout, job_stderr
 
 
-    def get_results(self, timeout=3600, check_interval=30, sync=True, sync_all=True, force_sync=False, quiet=False, verbose=False):
+    def _poll_results(self, remote_status, problem_last_chance, lazy=False):
+        """Check local stage dir (already synced with remote, if needed) once for results of job,
+        and update its status
+
+        Parameters
+        ----------
+        remote_status: str
+            remote status of job from JobsDB
+        problem_last_chance: bool
+            a previous check already found job neither finished nor queued/running
+        lazy: bool, default False
+            return ``serialize.LazyResults`` instead of value of function
+
+        Returns
+        -------
+        (return, stdout, stderr) as from ``get_results``, or None if job has not finished, and
+        updated problem_last_chance
+        """
+        # poke filesystem, since on some machines Path.exists() fails even if file appears to be there when doing ls
+        _ = list(self.stage_dir.glob('_expyre_job_*'))
+        # read all text output
+        stdout, stderr, job_stdout, job_stderr = self._read_stdout_err()
+
+        # update state depending on presence of various progress files and remote status
+        if (self.stage_dir / '_expyre_job_succeeded').exists():
+            # job created final succeeded file
+            assert remote_status not in ['queued', 'held']
+            try:
+                if lazy:
+                    results = serialize.LazyResults(self.stage_dir / '_expyre_job_succeeded')
+                else:
+                    results = serialize.load(self.stage_dir / '_expyre_job_succeeded')
+            except Exception as exc:
+                raise RuntimeError(f'Job {self.id} got "_succeeded" file, but failed to parse it with error {exc}\n'
+                                   f'stdout: {stdout}\nstderr: {stderr}\njob stdout: {job_stdout}\njob stderr: {job_stderr}')
+            self.status = 'succeeded'
+        elif (self.stage_dir / '_expyre_job_error').exists():
+            # job created final failed file
+            assert remote_status not in ['queued', 'held']
+            with open(self.stage_dir / '_expyre_job_error') as fin:
+                error_msg = fin.read()
+            self.status = 'failed'
+        else:
+            if (self.stage_dir / '_expyre_job_started').exists():
+                self.status = 'started'
+            # job does not _appear_ to have finished
+            if remote_status not in ['queued', 'held', 'running']:
+                # problem - job does not seem to be queued (even held) or running
+                if problem_last_chance:
+                    # already on last chance, giving up
+                    self.status = 'died'
+                    config.db.update(self.id, status=self.status, source='get_results')
+                    raise ExPyReJobDiedError(f'Job {self.id} has remote status {remote_status} but no _succeeded or _error\n'
+                                             f'stdout: {stdout}\nstderr: {stderr}\n'
+                                             f'job stdout: {job_stdout}\njob stderr: {job_stderr}\n')
+                # give it one more chance, perhaps queuing system status and file are slow to sync to head node
+                warnings.warn(f'Job {self.id} has no _succeeded or _error file, but remote status {remote_status} is '
+                               'not "queued", "held", or "running". Giving it one more chance.')
+                problem_last_chance = True
+
+        # update status in database, only if changed, since this is called on every poll of a job
+        config.db.update(self.id, status=self.status, only_changed=True, source='get_results')
+
+        # return if succeeded or failed
+        if self.status == 'succeeded':
+            # stage out remotely created files
+            # should we do this for failed calls?
+            if (self.stage_dir / '_expyre_output_files').exists():
+                with open(self.stage_dir / '_expyre_output_files') as fin:
+                    for in_file in [f.replace('\n', '') for f in fin.readlines()]:
+                        ExPyRe._copy(self.stage_dir, Path.cwd(), in_file)
+
+            return (results, stdout, stderr), problem_last_chance
+        elif self.status == 'failed':
+            if (self.stage_dir / "_expyre_job_exception").is_file():
+                # reraise python exception that caused job to fail
+                exc = pickle.loads(compression.read(self.stage_dir / "_expyre_job_exception"))
+                sys.stderr.write(f'Remote job {self.id} failed with exception '
+                                 f'error_msg {error_msg}\n'
+                                 f'stdout: {stdout}\nstderr: {stderr}\n'
+                                 f'job stdout: {job_stdout}\njob stderr: {job_stderr}')
+                raise exc
+            else:
+                raise ExPyReJobDiedError(f'Remote job {self.id} failed with no exception but remote status {remote_status} '
+                                         f'error_msg {error_msg}\n'
+                                         f'stdout: {stdout}\nstderr: {stderr}\n'
+                                         f'job stdout: {job_stdout}\njob stderr: {job_stderr}')
+
+        return None, problem_last_chance
+
+
+    def get_results(self, timeout=3600, check_interval=None, sync=True, sync_all=True, force_sync=False, quiet=False, verbose=False,
+                    lazy=False):
         """Get results from a remote job
 
         Parameters
         ----------
         timeout: int or str, default 3600
             Max time (in sec if int, time spec if str) to wait for job to complete, None or int <= 0 to wait forever
-        check_interval: int, default 30
-            Time to wait (in sec) between checks of job completion
+        check_interval: int, default None
+            Time to wait (in sec) between checks of job completion, None to use system's polling policy
+            (see ``polling``)
         sync: bool, default True
             Synchronize remote files before checking for results
             Note that if this is False and job is finished on remote system but output files haven't been
@@ -665,11 +1285,15 @@ class ExPyRe:
             No progress info
         verbose: bool, default False
             Verbose output (from remote system/scheduler commands)
+        lazy: bool, default False
+            Return a ``serialize.LazyResults`` handle instead of the value of the function, which loads
+            the value only when requested, or one item at a time for results written with ``stream_results``.
+            Must be used before job is cleaned.
 
         Returns
         -------
         return, stdout, stderr:
-            * value of function
+            * value of function (list of items if written with ``stream_results``), or LazyResults if lazy
             * string containing stdout during function
             * string containing stderr during function
         """
@@ -679,6 +1303,7 @@ class ExPyRe:
 
         timeout = time_to_sec(timeout)
         system = config.systems[self.system_name]
+        policy = system.polling if check_interval is None else FixedPolling(check_interval)
         start_time = time.time()
         problem_last_chance = False
         out_of_time = False
@@ -692,7 +1317,7 @@ class ExPyRe:
             # get remote status of job from db (either unset or was set by call to
             #     self.sync_remote_results_status() in previous iter)
             # remote_status values: queued, held,       running,    done, failed, timeout, other
-            remote_status = list(config.db.jobs(id=re.escape(self.id)))[0]['remote_status']
+            remote_status = config.db.get(self.id)['remote_status']
             if remote_status != 'done':
                 # If previous status was not 'done', need to sync remote status.
                 # If it was pre-done, we obviously need current state and results.
@@ -700,91 +1325,32 @@ class ExPyRe:
                 #     more time or was fixed manually.
                 self.sync_remote_results_status(sync_all, force_sync, verbose=verbose)
 
-                remote_status = list(config.db.jobs(id=re.escape(self.id)))[0]['remote_status']
-
-            # poke filesystem, since on some machines Path.exists() fails even if file appears to be there when doing ls
-            _ = list(self.stage_dir.glob('_expyre_job_*'))
-            # read all text output
-            stdout, stderr, job_stdout, job_stderr = self._read_stdout_err()
-
-            # update state depending on presence of various progress files and remote status
-            if (self.stage_dir / '_expyre_job_succeeded').exists():
-                # job created final succeeded file
-                assert remote_status not in ['queued', 'held']
-                try:
-                    with open(self.stage_dir / '_expyre_job_succeeded', 'rb') as fin:
-                        results = pickle.load(fin)
-                except Exception as exc:
-                    raise RuntimeError(f'Job {self.id} got "_succeeded" file, but failed to parse it with error {exc}\n'
-                                       f'stdout: {stdout}\nstderr: {stderr}\njob stdout: {job_stdout}\njob stderr: {job_stderr}')
-                self.status = 'succeeded'
-            elif (self.stage_dir / '_expyre_job_error').exists():
-                # job created final failed file
-                assert remote_status not in ['queued', 'held']
-                with open(self.stage_dir / '_expyre_job_error') as fin:
-                    error_msg = fin.read()
-                self.status = 'failed'
-            else:
-                if (self.stage_dir / '_expyre_job_started').exists():
-                    self.status = 'started'
-                # job does not _appear_ to have finished
-                if remote_status not in ['queued', 'held', 'running']:
-                    # problem - job does not seem to be queued (even held) or running
-                    if problem_last_chance:
-                        # already on last chance, giving up
-                        self.status = 'died'
-                        config.db.update(self.id, status=self.status)
-                        raise ExPyReJobDiedError(f'Job {self.id} has remote status {remote_status} but no _succeeded or _error\n'
-                                                 f'stdout: {stdout}\nstderr: {stderr}\n'
-                                                 f'job stdout: {job_stdout}\njob stderr: {job_stderr}\n')
-                    # give it one more chance, perhaps queuing system status and file are slow to sync to head node
-                    warnings.warn(f'Job {self.id} has no _succeeded or _error file, but remote status {remote_status} is '
-                                   'not "queued", "held", or "running". Giving it one more chance.')
-                    problem_last_chance = True
-                else:
-                    # No apparent problem, just not done yet, leave status as is, but check for timeout
-                    if out_of_time:
-                        if not quiet and n_iter > 0:
-                            sys.stderr.write('\n')
-                            sys.stderr.flush()
-                        raise ExPyReTimeoutError
-
-            # update status in database
-            config.db.update(self.id, status=self.status)
-
-            # return if succeeded or failed
-            if self.status == 'succeeded':
-                # stage out remotely created files
-                # should we do this for failed calls?
-                if (self.stage_dir / '_expyre_output_files').exists():
-                    with open(self.stage_dir / '_expyre_output_files') as fin:
-                        for in_file in [f.replace('\n', '') for f in fin.readlines()]:
-                            ExPyRe._copy(self.stage_dir, Path.cwd(), in_file)
+                remote_status = config.db.get(self.id)['remote_status']
 
+            try:
+                out, problem_last_chance = self._poll_results(remote_status, problem_last_chance, lazy=lazy)
+            except Exception:
+                policy.forget(self.id)
                 if not quiet and n_iter > 0:
                     # newline after one or more 'q|r' progress characters
                     sys.stderr.write('\n')
                     sys.stderr.flush()
-                return results, stdout, stderr
-            elif self.status == 'failed':
+                raise
+
+            if out is not None:
+                policy.forget(self.id)
                 if not quiet and n_iter > 0:
                     # newline after one or more 'q|r' progress characters
                     sys.stderr.write('\n')
                     sys.stderr.flush()
-                if (self.stage_dir / "_expyre_job_exception").is_file():
-                    # reraise python exception that caused job to fail
-                    with open(self.stage_dir / "_expyre_job_exception", "rb") as fin:
-                        exc = pickle.load(fin)
-                    sys.stderr.write(f'Remote job {self.id} failed with exception '
-                                     f'error_msg {error_msg}\n'
-                                     f'stdout: {stdout}\nstderr: {stderr}\n'
-                                     f'job stdout: {job_stdout}\njob stderr: {job_stderr}')
-                    raise exc
-                else:
-                    raise ExPyReJobDiedError(f'Remote job {self.id} failed with no exception but remote status {remote_status} '
-                                             f'error_msg {error_msg}\n'
-                                             f'stdout: {stdout}\nstderr: {stderr}\n'
-                                             f'job stdout: {job_stdout}\njob stderr: {job_stderr}')
+                return out
+            elif out_of_time and remote_status in ['queued', 'held', 'running']:
+                # No apparent problem, just not done yet, but out of time
+                policy.forget(self.id)
+                if not quiet and n_iter > 0:
+                    sys.stderr.write('\n')
+                    sys.stderr.flush()
+                raise ExPyReTimeoutError
 
             out_of_time = (timeout is not None) and (timeout >= 0) and (time.time() - start_time > timeout)
 
@@ -803,15 +1369,52 @@ class ExPyRe:
                 sys.stderr.flush()
 
             # wait for next check
-            time.sleep(check_interval)
+            estimate = None
+            if policy.needs_estimate(self.id, remote_status):
+                try:
+                    estimate = system.scheduler.time_estimates(self.remote_id, verbose=verbose).get(self.remote_id)
+                except Exception as exc:
+                    warnings.warn(f'Failed to get time estimates for job {self.id}: {exc}')
+            time.sleep(policy.interval(self.id, remote_status, estimate))
             n_iter += 1
 
 
+    async def aget_results(self, timeout=3600, check_interval=None, verbose=False, lazy=False):
+        """asyncio version of ``get_results``.  Status queries and syncing of remote files are
+        done by one poller task per system for all jobs being awaited in the same event loop,
+        so waiting for many jobs concurrently (e.g. with ``expyre.gather``) costs one status
+        command and one remote copy per check, rather than one per job.
+
+        Parameters
+        ----------
+        timeout: int or str, default 3600
+            Max time (in sec if int, time spec if str) to wait for job to complete, None or int <= 0 to wait forever
+        check_interval: int, default None
+            Time to wait (in sec) between checks of job completion, None to use system's polling policy
+            (shortest interval of all jobs being awaited on the same system is used)
+        verbose: bool, default False
+            Verbose output (from remote system/scheduler commands)
+        lazy: bool, default False
+            Return a ``serialize.LazyResults`` handle instead of the value of the function
+
+        Returns
+        -------
+        return, stdout, stderr: same as ``get_results``
+        """
+        from .aio import wait_for_results
+
+        if self.status == 'processed' or self.status == 'cleaned':
+            raise RuntimeError(f'Job {self.id} has status {self.status}, results are no longer available')
+
+        return await wait_for_results(self, timeout=time_to_sec(timeout), check_interval=check_interval,
+                                      verbose=verbose, lazy=lazy)
+
+
     def mark_processed(self):
         """Mark job as processed (usually after results have been stored someplace)
         """
         self.status = 'processed'
-        config.db.update(self.id, status=self.status)
+        config.db.update(self.id, status=self.status, source='mark_processed')
 
 
     def __str__(self):
@@ -1,20 +1,61 @@
+import os
 import time
 import sqlite3
 import re
+import threading
+import weakref
 from pathlib import Path
 
 
-class _SQLite3Val():
-    def __init__(self, v):
-        self.v = v
+def _regexp(pattern, val):
+    # REGEXP function for sqlite, with the same anchored matching as was done in python
+    return val is not None and re.search('^' + pattern + '$', val) is not None
 
-    def __str__(self):
-        if self.v is None:
-            return 'NULL'
-        elif isinstance(self.v, (int, float)):
-            return f"{self.v}"
+
+def _literal_match(pattern):
+    """Classify a regexp (e.g. from ``re.escape``) that can be matched without a regexp
+
+    Returns
+    -------
+    ('equal', str) if it only matches a literal string, ('prefix', str) if it is a literal followed
+    by ``.*``, None otherwise
+    """
+    literal = ''
+    char_i = 0
+    while char_i < len(pattern):
+        c = pattern[char_i]
+        if c == '\\':
+            if char_i + 1 == len(pattern) or pattern[char_i + 1].isalnum() or pattern[char_i + 1] == '_':
+                # special sequence like \d, or trailing backslash
+                return None
+            literal += pattern[char_i + 1]
+            char_i += 2
+        elif c in '.^$*+?{}[]|()':
+            if pattern[char_i:] == '.*':
+                return ('prefix', literal)
+            return None
         else:
-            return f"'{self.v}'"
+            literal += c
+            char_i += 1
+
+    return ('equal', literal)
+
+
+def _stats(vals, percentiles):
+    # number, mean, and percentiles (linear interpolation between closest values) of list of values
+    vals = sorted(vals)
+    stats = {'n': len(vals), 'mean': sum(vals) / len(vals)}
+    for percentile in percentiles:
+        pos = (len(vals) - 1) * percentile / 100.0
+        lower = int(pos)
+        upper = min(lower + 1, len(vals) - 1)
+        stats[f'p{percentile:g}'] = vals[lower] + (vals[upper] - vals[lower]) * (pos - lower)
+    return stats
+
+
+class _Connection(sqlite3.Connection):
+    # subclass, since sqlite3.Connection itself cannot be weakly referenced
+    pass
 
 
 class JobsDB:
@@ -35,35 +76,73 @@ class JobsDB:
     possible_status = ['created', 'submitted', 'started', 'succeeded', 'failed', 'died', 'processed', 'cleaned']
     status_group = {'ongoing': ['created', 'submitted', 'started'],
                     'can_produce_results': ['created', 'submitted', 'started', 'succeeded', 'died']}
+    # statuses of jobs that compact() may move to archive, whose results are no longer needed
+    compactable_status = ['processed', 'cleaned']
 
 
-    def _execute(self, cmd, retry_n=3, retry_wait=1):
+    def _transaction(self, func, retry_n=3, retry_wait=1):
+        # call func(db) in one transaction, retrying if database is locked, and returning its return value.
+        # Any exception raised by func rolls back the whole transaction.
+        # connections wait up to busy_timeout for locks, so retries are only needed if that is exceeded
+        db = self.db
         for i in range(retry_n):
             try:
-                with self.db:
-                    res = self.db.execute(cmd)
-                return res
+                with db:
+                    return func(db)
             except sqlite3.OperationalError as exc:
                 if 'database is locked' in str(exc):
                     exc_str = f'{type(exc)} {exc}'
                     time.sleep(retry_wait)
                 else:
                     raise
-            except Exception as exc:
-                raise
 
-        raise RuntimeError(f'Repeatedly got {exc_str} from cmd {cmd}')
+        raise RuntimeError(f'Repeatedly got {exc_str} from {func}')
+
+
+    def _execute(self, cmd, params=(), retry_n=3, retry_wait=1):
+        # cmd may be a list of commands, which are executed in one transaction, params only apply to single cmd
+        def _run(db):
+            if isinstance(cmd, str):
+                return db.execute(cmd, params)
+            for c in cmd:
+                res = db.execute(c)
+            return res
+
+        return self._transaction(_run, retry_n=retry_n, retry_wait=retry_wait)
 
 
-    def __init__(self, db_filename):
+    def __init__(self, db_filename, busy_timeout=60.0, journal_mode='WAL', events_retention=None, archive_filename=None):
         """Create JobsDB obect
 
+        Each thread (of each process) uses its own connection, so threads do not share
+        transactions.  With WAL journaling, reads do not block writes (or vice versa), and
+        writers wait for each other up to busy_timeout.
+
         Parameters
         ----------
         db_filename: str
             database file
+        busy_timeout: float, default 60
+            time (in sec) to wait for another process's lock before failing
+        journal_mode: str, default 'WAL'
+            sqlite journal mode, e.g. 'DELETE' for filesystems that do not support WAL (some network filesystems)
+        events_retention: float, default None
+            time (in sec) to keep entries of events table, None to keep forever.  Older events are deleted by ``compact()``,
+            and when database is opened if they are more than a day older
+        archive_filename: str, default None
+            separate database file for table of jobs archived by ``compact()``, None to keep it in db_filename
         """
         self.db_filename = db_filename
+        self.busy_timeout = busy_timeout
+        self.journal_mode = journal_mode
+        self.archive_filename = archive_filename
+        # schema (as prefix) of jobs_archive table, attached to each connection if in separate file
+        self._archive_schema = 'archive.' if archive_filename is not None else ''
+        self._local = threading.local()
+        # pid of each open connection, so that unlock() can close them.  Weak, so that connection of each thread
+        # is closed when thread ends (and its self._local is deleted), rather than accumulating.
+        self._connections = weakref.WeakKeyDictionary()
+        self._connections_lock = threading.Lock()
 
         self.columns =      ['id',   'name', 'from_dir', 'status', 'system', 'remote_id', 'remote_status', 'creation_time', 'status_time']
         self.column_types = ['TEXT', 'TEXT', 'TEXT',     'TEXT',   'TEXT',   'TEXT',      'TEXT',          'DATE',          'DATE']
@@ -72,20 +151,90 @@ class JobsDB:
 
         if Path(self.db_filename).exists():
             # just connect to existing database
-            self.db = sqlite3.connect(db_filename)
+            # (may also be used from ExPyReExecutor background thread)
             # make sure database can be minimally accessed
             try:
-                _ = self._execute("SELECT * FROM jobs")
+                _ = self._execute("SELECT * FROM jobs LIMIT 1")
             except:
                 raise RuntimeError(f"Failed to read list of jobs from existing JobsDB file {self.db_filename}")
         else:
-            # connect should create the file here
-            self.db = sqlite3.connect(db_filename)
+            # connect (on first use of self.db) should create the file here
             # create actual database table
             self._execute("CREATE TABLE jobs (" + ', '.join([c + ' ' + t for c, t in zip(self.columns, self.column_types)])+")")
 
-
-    def add(self, id, name, from_dir, status='created', system=None, remote_id=None, remote_status=None):
+        # add tables and indices missing from databases created by older versions, only writing if needed,
+        # since a database is opened by every process (e.g. each xpr command)
+        self._migrate()
+
+        self.events_retention = events_retention
+        if events_retention is not None:
+            # a read, which only leads to a write at most once a day, rather than on every open
+            oldest = self._execute("SELECT MIN(time) FROM events").fetchone()[0]
+            if oldest is not None and oldest < time.time() - events_retention - JobsDB._events_prune_interval:
+                self.prune_events(time.time() - events_retention)
+
+
+    # time (in sec) that events may be kept beyond events_retention before they are pruned on open
+    _events_prune_interval = 24 * 3600
+
+
+    def _migrate(self):
+        a = self._archive_schema
+        columns = ', '.join([c + ' ' + t for c, t in zip(self.columns, self.column_types)])
+        # (name, command to create it)
+        objects = []
+        # indices for columns that jobs() can filter on.  Index on id is unique, so adding a job
+        # that exists fails without checking first.
+        objects.append(('jobs_id_unique', "CREATE UNIQUE INDEX IF NOT EXISTS jobs_id_unique ON jobs(id)"))
+        objects += [(f'jobs_{col}', f"CREATE INDEX IF NOT EXISTS jobs_{col} ON jobs({col})") for col in ['status', 'system', 'name']]
+        # jobs moved out of jobs table by compact(), with same columns and indices
+        objects.append((f'{a}jobs_archive', f"CREATE TABLE IF NOT EXISTS {a}jobs_archive ({columns})"))
+        objects.append((f'{a}jobs_archive_id_unique', f"CREATE UNIQUE INDEX IF NOT EXISTS {a}jobs_archive_id_unique ON jobs_archive(id)"))
+        objects += [(f'{a}jobs_archive_{col}', f"CREATE INDEX IF NOT EXISTS {a}jobs_archive_{col} ON jobs_archive({col})")
+                    for col in ['status', 'system', 'name']]
+        # append-only log of changes of status and remote_status (and partition jobs are submitted to) of each job
+        objects += [('events', "CREATE TABLE IF NOT EXISTS events (job_id TEXT, time REAL, field TEXT, old_value TEXT, "
+                               "new_value TEXT, source TEXT, system TEXT)"),
+                    ('events_job_id', "CREATE INDEX IF NOT EXISTS events_job_id ON events(job_id, time)"),
+                    ('events_time', "CREATE INDEX IF NOT EXISTS events_time ON events(time)")]
+
+        existing = set([row[0] for row in self._execute("SELECT name FROM main.sqlite_master")])
+        if self.archive_filename is not None:
+            existing |= set(['archive.' + row[0] for row in self._execute("SELECT name FROM archive.sqlite_master")])
+
+        cmds = [cmd for name, cmd in objects if name not in existing]
+        if 'jobs_id' in existing:
+            # non-unique index of older versions
+            cmds.append("DROP INDEX jobs_id")
+        if len(cmds) > 0:
+            self._execute(cmds)
+
+
+    @property
+    def db(self):
+        """sqlite connection of current thread"""
+        # new connection after fork, since a connection must not be used by more than one process
+        if getattr(self._local, 'pid', None) != os.getpid():
+            self._local.db = self._connect()
+            self._local.pid = os.getpid()
+        return self._local.db
+
+
+    def _connect(self):
+        db = sqlite3.connect(self.db_filename, timeout=self.busy_timeout, check_same_thread=False, factory=_Connection)
+        # persistent in database file, so only has an effect the first time
+        db.execute(f"PRAGMA journal_mode={self.journal_mode}")
+        if self.archive_filename is not None:
+            db.execute("ATTACH DATABASE ? AS archive", (str(self.archive_filename),))
+            db.execute(f"PRAGMA archive.journal_mode={self.journal_mode}")
+        # used by jobs() for filters that are not simple literals or prefixes
+        db.create_function('REGEXP', 2, _regexp, deterministic=True)
+        with self._connections_lock:
+            self._connections[db] = os.getpid()
+        return db
+
+
+    def add(self, id, name, from_dir, status='created', system=None, remote_id=None, remote_status=None, source=None):
         """Add a job to the DB
 
         Parameters
@@ -104,17 +253,50 @@ class JobsDB:
             remote id on system
         remote_status: str, optional
             remote status on system
+        source: str, optional
+            what is adding job (e.g. 'constructor'), recorded in events table
         """
-        assert status in JobsDB.possible_status
+        self.add_many([dict(id=id, name=name, from_dir=from_dir, status=status, system=system, remote_id=remote_id,
+                            remote_status=remote_status)], source=source)
+
 
-        rows = list(self._execute(f"SELECT * FROM jobs WHERE id = '{id}'"))
-        if len(rows) != 0:
-            raise ValueError(f"JobsDB trying to add job {id} which already exists")
+    def add_many(self, jobs, source=None):
+        """Add many jobs to the DB in a single transaction, so either all or none are added
 
-        self._execute(f'INSERT into jobs(id, name, from_dir, status, system, remote_id, remote_status, creation_time, status_time) '
-                      f'values ({_SQLite3Val(id)}, {_SQLite3Val(name)}, {_SQLite3Val(from_dir)}, '
-                      f'{_SQLite3Val(status)}, {_SQLite3Val(system)}, {_SQLite3Val(remote_id)}, {_SQLite3Val(remote_status)}, '
-                      f'{_SQLite3Val(int(time.time()))}, {_SQLite3Val(None)})')
+        Parameters
+        ----------
+        jobs: list(dict)
+            for each job, dict with same keys as arguments of ``add`` (only id, name, and from_dir are required)
+        source: str, optional
+            what is adding jobs, recorded in events table
+        """
+        if len(jobs) == 0:
+            return
+
+        now = time.time()
+        rows = []
+        events = []
+        for job in jobs:
+            status = job.get('status', 'created')
+            assert status in JobsDB.possible_status
+            rows.append((job['id'], job['name'], str(job['from_dir']), status, job.get('system'), job.get('remote_id'),
+                         job.get('remote_status'), int(now), None))
+            events.append((job['id'], now, 'status', None, status, source, job.get('system')))
+            if job.get('remote_status') is not None:
+                events.append((job['id'], now, 'remote_status', None, job['remote_status'], source, job.get('system')))
+
+        def _add(db):
+            db.executemany('INSERT INTO jobs (id, name, from_dir, status, system, remote_id, remote_status, creation_time, '
+                           'status_time) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            JobsDB._insert_events(db, events)
+
+        try:
+            self._transaction(_add)
+        except sqlite3.IntegrityError as exc:
+            existing = [job['id'] for job in jobs if self.get(job['id']) is not None]
+            ids = [job['id'] for job in jobs]
+            duplicate = sorted(set([id for id in ids if ids.count(id) > 1]))
+            raise ValueError(f"JobsDB trying to add jobs {existing + duplicate} which already exist") from exc
 
 
     def remove(self, id):
@@ -125,39 +307,329 @@ class JobsDB:
         id: str
             unique id of job to remove
         """
-        rows = list(self._execute(f"SELECT * FROM jobs WHERE id = '{id}'"))
-        if len(rows) != 1:
-            raise ValueError(f"JobsDB trying to remove job {id}, found {len(rows)} such entries")
+        self.remove_many([id])
+
+
+    def remove_many(self, ids):
+        """Remove many jobs from the DB in a single transaction, so either all or none are removed
+
+        Parameters
+        ----------
+        ids: list(str)
+            unique ids of jobs to remove
+        """
+        if len(ids) == 0:
+            return
+
+        def _remove(db):
+            n_removed = db.executemany("DELETE FROM jobs WHERE id = ?", [(id,) for id in ids]).rowcount
+            if n_removed != len(ids):
+                # roll back
+                raise ValueError(f"JobsDB trying to remove {len(ids)} jobs, found only {n_removed} of them")
 
-        self._execute(f"DELETE FROM jobs WHERE id = '{id}'")
+        self._transaction(_remove)
 
 
-    def update(self, id, /, **kwargs):
+    def update(self, id, /, only_changed=False, source=None, **kwargs):
         """Update some field of job
 
         Parameters
         ----------
         id: str
             unique id of job to update
+        only_changed: bool, default False
+            only write if some field's value is different, so, e.g., status_time is not reset if status is unchanged
+        source: str, optional
+            what is updating job (e.g. 'sync' or 'get_results'), recorded in events table
         from_dir, status, system, remote_id, remote_status: str
             field(s) to update
         """
-        if 'status' in kwargs:
-            assert kwargs['status'] in JobsDB.possible_status
+        self.update_many({id: kwargs}, only_changed=only_changed, source=source)
+
+
+    def update_many(self, updates, only_changed=False, source=None):
+        """Update some fields of many jobs in a single transaction, so either all or none are updated
+
+        Parameters
+        ----------
+        updates: dict
+            for each unique id of job to update, dict of fields to update, same as keyword arguments of ``update``
+        only_changed: bool, default False
+            only write jobs for which some field's value is different
+        source: str, optional
+            what is updating jobs, recorded in events table for each change of status or remote_status
+        """
+        if len(updates) == 0:
+            return
+
+        for kwargs in updates.values():
+            if 'status' in kwargs:
+                assert kwargs['status'] in JobsDB.possible_status
+
+        # one parameterized statement for each set of fields
+        status_time = int(time.time())
+        statements = {}
+        for id, kwargs in updates.items():
+            cols = tuple(kwargs.keys())
+            vals = tuple(kwargs.values())
+            if 'status' in kwargs:
+                # not compared, so only changed status resets status_time
+                cols_set = cols + ('status_time',)
+                vals_set = vals + (status_time,)
+            else:
+                cols_set = cols
+                vals_set = vals
+            params = vals_set + (id,) + (vals if only_changed else ())
+            statements.setdefault(cols, (cols_set, []))[1].append(params)
+
+        # old values of fields that are logged as events
+        logged_ids = [id for id, kwargs in updates.items() if 'status' in kwargs or 'remote_status' in kwargs]
+
+        def _update(db):
+            old_vals = JobsDB._logged_values(db, logged_ids)
+            n_updated = 0
+            for cols, (cols_set, params) in statements.items():
+                cmd = "UPDATE jobs SET " + ", ".join([f"{col} = ?" for col in cols_set]) + " WHERE id = ?"
+                if only_changed:
+                    cmd += " AND (" + " OR ".join([f"{col} IS NOT ?" for col in cols]) + ")"
+                n_updated += db.executemany(cmd, params).rowcount
+            if n_updated < len(updates):
+                # some jobs were not updated, which is an error only if they do not exist.  Jobs with
+                # old values exist, others are checked by one (chunked) query
+                unknown_ids = [id for id in updates if id not in old_vals]
+                existing_ids = JobsDB._existing_ids(db, unknown_ids)
+                missing = [id for id in unknown_ids if id not in existing_ids]
+                if len(missing) > 0:
+                    # roll back
+                    raise ValueError(f"JobsDB trying to update jobs {missing} which do not exist")
+
+            now = time.time()
+            events = []
+            for id in logged_ids:
+                old_status, old_remote_status, old_system = old_vals[id]
+                system = updates[id].get('system', old_system)
+                for field, old_val in [('status', old_status), ('remote_status', old_remote_status)]:
+                    if field in updates[id] and updates[id][field] != old_val:
+                        events.append((id, now, field, old_val, updates[id][field], source, system))
+            JobsDB._insert_events(db, events)
+
+        self._transaction(_update)
+
+
+    @staticmethod
+    def _logged_values(db, ids, chunk_size=500):
+        # status, remote_status, and system of each job, in chunks to stay below limit on number of sql parameters
+        vals = {}
+        for chunk_start in range(0, len(ids), chunk_size):
+            chunk = ids[chunk_start:chunk_start + chunk_size]
+            vals.update({row[0]: row[1:] for row in
+                         db.execute("SELECT id, status, remote_status, system FROM jobs WHERE id IN (" +
+                                    ", ".join(["?"] * len(chunk)) + ")", chunk)})
+        return vals
+
+
+    @staticmethod
+    def _existing_ids(db, ids, chunk_size=500):
+        # set of ids that are in jobs table, in chunks like _logged_values
+        existing_ids = set()
+        for chunk_start in range(0, len(ids), chunk_size):
+            chunk = ids[chunk_start:chunk_start + chunk_size]
+            existing_ids.update([row[0] for row in
+                                 db.execute("SELECT id FROM jobs WHERE id IN (" + ", ".join(["?"] * len(chunk)) + ")",
+                                            chunk)])
+        return existing_ids
+
+
+    @staticmethod
+    def _insert_events(db, events):
+        db.executemany("INSERT INTO events (job_id, time, field, old_value, new_value, source, system) "
+                       "VALUES (?, ?, ?, ?, ?, ?, ?)", events)
+
+
+    def log_events(self, events, source=None):
+        """Add events that are not changes of job fields, e.g. partition a job was submitted to
+
+        Parameters
+        ----------
+        events: list(tuple(str, str, str))
+            (job id, field, value) of each event
+        source: str, optional
+            what is logging events
+        """
+        now = time.time()
+        self._transaction(lambda db: JobsDB._insert_events(
+            db, [(id, now, field, None, value, source, None) for id, field, value in events]))
+
+
+    def events(self, id=None, since=None):
+        """Iterate through events, in order of time
+
+        Parameters
+        ----------
+        id: str, default None
+            only events of job with this id (not a regexp)
+        since: float, default None
+            only events at or after this time (sec since epoch)
+
+        Returns
+        -------
+        Iterator of dicts with keys job_id, time, field, old_value, new_value, source, system
+        """
+        conditions = []
+        params = []
+        if id is not None:
+            conditions.append("job_id = ?")
+            params.append(id)
+        if since is not None:
+            conditions.append("time >= ?")
+            params.append(since)
+        query = "SELECT job_id, time, field, old_value, new_value, source, system FROM events"
+        if len(conditions) > 0:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY time, rowid"
+
+        for row in self._execute(query, params):
+            yield dict(zip(['job_id', 'time', 'field', 'old_value', 'new_value', 'source', 'system'], row))
+
+
+    def prune_events(self, before):
+        """Delete old events
+
+        Parameters
+        ----------
+        before: float
+            delete events before this time (sec since epoch)
+
+        Returns
+        -------
+        int number of events deleted
+        """
+        return self._execute("DELETE FROM events WHERE time < ?", (before,)).rowcount
+
 
-        rows = list(self._execute(f"SELECT * FROM jobs WHERE id = '{id}'"))
-        if len(rows) != 1:
-            raise ValueError(f"JobsDB trying to update job {id}, found {len(rows)} such entries")
+    # intervals between first time each job reached (field, value in list) pairs
+    latency_intervals = {'queue_wait': (('status', ['submitted']), ('remote_status', ['running'])),
+                         'run_time': (('remote_status', ['running']), ('remote_status', ['done', 'failed', 'timeout'])),
+                         'sync_lag': (('remote_status', ['done', 'failed', 'timeout']), ('status', ['succeeded', 'failed', 'died'])),
+                         'processing': (('status', ['succeeded', 'failed', 'died']), ('status', ['processed'])),
+                         'turnaround': (('status', ['submitted']), ('status', ['succeeded', 'failed', 'died']))}
 
-        if 'status' in kwargs:
-            kwargs['status_time'] = int(time.time())
 
-        self._execute("UPDATE jobs SET " +
-                      ", ".join([f"{k}={_SQLite3Val(v)}" for k, v in kwargs.items()]) +
-                      f" WHERE id = '{id}'")
+    def latencies(self, system=None, since=None, percentiles=[50, 90, 99]):
+        """Percentiles of latencies of each system and partition, from events table.  Intervals (see
+        ``latency_intervals``) are only included for jobs that had events at both ends, e.g. jobs that
+        finished before any sync saw them running have no queue_wait or run_time.
 
+        Parameters
+        ----------
+        system: str, default None
+            only jobs on this system
+        since: float, default None
+            only jobs submitted at or after this time (sec since epoch)
+        percentiles: list(float), default [50, 90, 99]
+            percentiles to compute
+
+        Returns
+        -------
+        dict with key (system, partition) and value dict with key each of ``latency_intervals`` and value dict
+        with 'n' number of jobs, 'mean', and f'p{percentile}' for each percentile
+        """
+        first = {}
+        job_system = {}
+        job_partition = {}
+        for event in self.events():
+            job_id = event['job_id']
+            if event['field'] == 'partition':
+                job_partition[job_id] = event['new_value']
+                continue
+            if event['system'] is not None:
+                job_system[job_id] = event['system']
+            first.setdefault(job_id, {}).setdefault((event['field'], event['new_value']), event['time'])
+
+        def _first_time(job_times, field, values):
+            times = [job_times[(field, value)] for value in values if (field, value) in job_times]
+            return min(times) if len(times) > 0 else None
+
+        intervals = {}
+        for job_id, job_times in first.items():
+            if system is not None and job_system.get(job_id) != system:
+                continue
+            t_submitted = _first_time(job_times, 'status', ['submitted'])
+            if t_submitted is None or (since is not None and t_submitted < since):
+                continue
+            key = (job_system.get(job_id), job_partition.get(job_id))
+            for interval, (start, end) in JobsDB.latency_intervals.items():
+                t_start = _first_time(job_times, *start)
+                t_end = _first_time(job_times, *end)
+                if t_start is not None and t_end is not None and t_end >= t_start:
+                    intervals.setdefault(key, {}).setdefault(interval, []).append(t_end - t_start)
+
+        return {key: {interval: _stats(vals, percentiles) for interval, vals in key_intervals.items()}
+                for key, key_intervals in intervals.items()}
+
+
+    def get(self, id, readable=True, archived=False):
+        """Get one job by its id
 
-    def jobs(self, status=None, id=None, name=None, system=None, readable=True):
+        Parameters
+        ----------
+        id: str
+            unique id of job (not a regexp)
+        readable: bool, default True
+            convert times to readable strings, as in ``jobs()``
+        archived: bool, default False
+            also look for job in archive (see ``compact()``)
+
+        Returns
+        -------
+        dict with fields for all DB columns, or None if there is no such job
+        """
+        rows = list(self._execute("SELECT * FROM jobs WHERE id = ?", (id,)))
+        if len(rows) == 0 and archived:
+            rows = list(self._execute(f"SELECT * FROM {self._archive_schema}jobs_archive WHERE id = ?", (id,)))
+        if len(rows) == 0:
+            return None
+        return self._row_dict(rows[0], readable)
+
+
+    def _row_dict(self, row, readable):
+        row = {k: v for k, v in zip(self.columns, row)}
+        if readable:
+            if row['creation_time'] is not None:
+                row['creation_time'] = time.strftime('%Y-%m-%d %X', time.localtime(row['creation_time']))
+            if row['status_time'] is not None:
+                row['status_time'] = time.strftime('%Y-%m-%d %X', time.localtime(row['status_time']))
+        return row
+
+
+    @staticmethod
+    def _col_condition(col, col_res, params):
+        # SQL condition for column matching any of regexps, appending its parameters to params.
+        # Literals and literal prefixes are compared directly, so that index on column can be used.
+        conditions = []
+        for col_re in col_res:
+            match = _literal_match(col_re)
+            if match is None:
+                try:
+                    re.compile('^' + col_re + '$')
+                except re.error as exc:
+                    raise ValueError(f"Bad regexp in {col_res}") from exc
+                conditions.append(f"{col} REGEXP ?")
+                params.append(col_re)
+            elif match[0] == 'equal':
+                conditions.append(f"{col} = ?")
+                params.append(match[1])
+            elif len(match[1]) == 0:
+                conditions.append(f"{col} IS NOT NULL")
+            else:
+                # strings starting with prefix sort (as utf-8 bytes) between prefix and prefix with last char incremented
+                conditions.append(f"({col} >= ? AND {col} < ?)")
+                params.extend([match[1], match[1][:-1] + chr(ord(match[1][-1]) + 1)])
+
+        return '(' + ' OR '.join(conditions) + ')'
+
+
+    def jobs(self, status=None, id=None, name=None, system=None, readable=True, archived=False):
         """Iterate through jobs
 
         Parameters
@@ -170,6 +642,8 @@ class JobsDB:
             if present, include only jobs with name that matches regexps in this list
         system: str or list(str), default None
             if present, include only jobs with system in this list
+        archived: bool, default False
+            also include jobs in archive (see ``compact()``), after all other jobs
 
         Returns
         -------
@@ -187,27 +661,29 @@ class JobsDB:
         if status is not None:
             assert all([stat in JobsDB.possible_status or stat in JobsDB.status_group for stat in status])
 
-        def _col_match(col_res, col_val):
-            try:
-                return col_res is None or any([col_val is not None and re.search('^' + col_re + '$', col_val) for col_re in col_res])
-            except re.error as exc:
-                raise ValueError(f"Bad regexp in {col_res}") from exc
-
-        # do selection in python, not SQL query
-        for row in self._execute('SELECT * FROM jobs'):
-            if (_col_match(id, row[self.id_col]) and
-                _col_match(system, row[self.system_col]) and
-                _col_match(name, row[self.name_col]) and
-                (status is None or
-                 row[self.status_col] in status or
-                 any([row[self.status_col] in JobsDB.status_group.get(stat_grp, []) for stat_grp in status]))):
-                row = {k: v for k, v in zip(self.columns, row)}
-                if readable:
-                    if row['creation_time'] is not None:
-                        row['creation_time'] = time.strftime('%Y-%m-%d %X', time.localtime(row['creation_time']))
-                    if row['status_time'] is not None:
-                        row['status_time'] = time.strftime('%Y-%m-%d %X', time.localtime(row['status_time']))
-                yield row
+        # do selection in SQL query, so that literal and prefix matches (e.g. from re.escape) use indices
+        conditions = []
+        params = []
+        for col, col_res in [('id', id), ('system', system), ('name', name)]:
+            if col_res is not None:
+                conditions.append(JobsDB._col_condition(col, col_res, params))
+        if status is not None:
+            status = sorted(set(sum([JobsDB.status_group.get(stat, [stat]) for stat in status], [])))
+            conditions.append('status IN (' + ', '.join(['?'] * len(status)) + ')')
+            params.extend(status)
+
+        tables = ['jobs']
+        if archived:
+            tables.append(f'{self._archive_schema}jobs_archive')
+        for table in tables:
+            query = f'SELECT * FROM {table}'
+            if len(conditions) > 0:
+                query += ' WHERE ' + ' AND '.join(conditions)
+            # same order as table, regardless of which index is used
+            query += ' ORDER BY rowid'
+
+            for row in self._execute(query, params):
+                yield self._row_dict(row, readable)
 
 
     def __str__(self):
@@ -220,20 +696,102 @@ class JobsDB:
         return s
 
 
+    def _file_sizes(self):
+        # size of each database file, including its WAL
+        sizes = {}
+        for filename in [self.db_filename, self.archive_filename]:
+            if filename is not None:
+                sizes[str(filename)] = sum([(Path(str(filename) + suffix).stat().st_size
+                                             if Path(str(filename) + suffix).exists() else 0) for suffix in ['', '-wal']])
+        return sizes
+
+
+    def compact(self, older_than, status=['processed', 'cleaned'], vacuum=True):
+        """Move jobs that reached a final status some time ago to archive, so that the jobs table, which
+        is read by listings and restart lookups, stays small.  Archived jobs can still be read with
+        ``jobs(archived=True)`` and ``get(id, archived=True)``, but are not otherwise updated.
+
+        Parameters
+        ----------
+        older_than: float
+            move jobs whose status was set more than this many sec ago
+        status: str or list(str), default ['processed', 'cleaned']
+            statuses of jobs to move, which must be in ``compactable_status``, i.e. jobs whose results are no
+            longer needed (so restart never needs an archived job)
+        vacuum: bool, default True
+            rebuild database file(s) afterwards, to shrink them, and update sqlite's statistics for query planning
+
+        Returns
+        -------
+        dict with 'archived': number of jobs moved, 'events_pruned': number of events older than events_retention that
+            were deleted, 'jobs' and 'archive_jobs': number of jobs remaining in jobs table and in archive, 'file_sizes':
+            dict of (size before, size after) for each database file
+        """
+        if isinstance(status, str):
+            status = [status]
+        invalid_status = [stat for stat in status if stat not in JobsDB.compactable_status]
+        if len(invalid_status) > 0:
+            raise ValueError(f'Cannot compact jobs with status {invalid_status}, only those that cannot produce results '
+                             f'{JobsDB.compactable_status}')
+
+        sizes_before = self._file_sizes()
+
+        condition = ("status IN (" + ', '.join(['?'] * len(status)) + ") AND COALESCE(status_time, creation_time) < ?")
+        params = list(status) + [time.time() - older_than]
+
+        def _move(db):
+            # REPLACE, in case a job was copied but not deleted, since with WAL a transaction is not
+            # atomic across a separate archive database file
+            # in same order as jobs table
+            db.execute(f"INSERT OR REPLACE INTO {self._archive_schema}jobs_archive SELECT * FROM jobs WHERE {condition} "
+                       "ORDER BY rowid", params)
+            return db.execute(f"DELETE FROM jobs WHERE {condition}", params).rowcount
+
+        n_archived = self._transaction(_move)
+
+        n_events_pruned = 0
+        if self.events_retention is not None:
+            n_events_pruned = self.prune_events(time.time() - self.events_retention)
+
+        if vacuum:
+            # not allowed in a transaction, waits for other connections for up to busy_timeout
+            for schema in ['main'] + (['archive'] if self.archive_filename is not None else []):
+                self.db.execute(f"VACUUM {schema}")
+                self.db.execute(f"PRAGMA {schema}.wal_checkpoint(TRUNCATE)")
+            self.db.execute("ANALYZE")
+
+        sizes_after = self._file_sizes()
+        return {'archived': n_archived, 'events_pruned': n_events_pruned,
+                'jobs': self._execute("SELECT COUNT(*) FROM jobs").fetchone()[0],
+                'archive_jobs': self._execute(f"SELECT COUNT(*) FROM {self._archive_schema}jobs_archive").fetchone()[0],
+                'file_sizes': {filename: (sizes_before.get(filename, 0), sizes_after[filename]) for filename in sizes_after}}
+
+
     def unlock(self):
-        """unlocks the sqlite database"""
+        """unlocks the sqlite database, by replacing it with a backup.  Should rarely be needed,
+        since waits for locks are limited by busy_timeout, and only other processes that are still
+        running can hold locks.
+        """
+        db_filename = Path(self.db_filename)
         # create tmp
-        tmp_db_file = self.db_filename.parent / (self.db_filename.name + '.tmp')
+        tmp_db_file = db_filename.parent / (db_filename.name + '.tmp')
         new_db = sqlite3.connect(tmp_db_file)
 
         # do backup
         with self.db:
             self.db.backup(new_db)
-
-        # rename
-        self.db.close()
-        self.db_filename.rename(self.db_filename.parent / (self.db_filename.name + '.old'))
-        tmp_db_file.rename(self.db_filename)
-
-        # reinit saved pointers
-        self.db = sqlite3.connect(self.db_filename)
+        new_db.close()
+
+        # close all connections of this process
+        with self._connections_lock:
+            for db, pid in list(self._connections.items()):
+                if pid == os.getpid():
+                    db.close()
+            self._connections = weakref.WeakKeyDictionary()
+        self._local = threading.local()
+
+        # rename, including WAL files, which must not be used with new database
+        for suffix in ['', '-wal', '-shm']:
+            if (db_filename.parent / (db_filename.name + suffix)).exists():
+                (db_filename.parent / (db_filename.name + suffix)).rename(db_filename.parent / (db_filename.name + '.old' + suffix))
+        tmp_db_file.rename(db_filename)
@@ -0,0 +1,38 @@
+"""Runner for packed jobs (see ``Scheduler.submit_packed``), which runs several tasks concurrently
+within one scheduler job, each task in its own directory with its own job stdout and stderr files.
+
+NOTE: this module is copied verbatim into each packed job script, so it must only depend on the
+python standard library.
+
+Usage: python packed_runner.py cores_per_task task_script task_dir_1 task_id_1 [task_dir_2 task_id_2 ...]
+"""
+import sys
+import os
+import subprocess
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+def run_task(task_script, task_dir, task_id, env):
+    with open(os.path.join(task_dir, f'job.{task_id}.stdout'), 'w') as fout, \
+         open(os.path.join(task_dir, f'job.{task_id}.stderr'), 'w') as ferr:
+        return subprocess.run(['bash', task_script], cwd=task_dir, stdout=fout, stderr=ferr, env=env).returncode
+
+
+def main(cores_per_task, task_script, task_dirs_ids):
+    # each worker thread waits for one task's process, so tasks run concurrently, as many as fit
+    # into the cores of the job
+    n_workers = max(1, int(os.environ.get('EXPYRE_NUM_CORES', cores_per_task)) // cores_per_task)
+    env = dict(os.environ, EXPYRE_NUM_CORES=str(cores_per_task), EXPYRE_NUM_NODES='1')
+    task_script = os.path.abspath(task_script)
+
+    print(f'Running {len(task_dirs_ids)} tasks with {n_workers} workers of {cores_per_task} cores each')
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        futures = [executor.submit(run_task, task_script, task_dir, task_id, env) for task_dir, task_id in task_dirs_ids]
+        for (_, task_id), future in zip(task_dirs_ids, futures):
+            # task failures are recorded in each task's own files, so only report them here
+            print(f'Task {task_id} exit status {future.result()}')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]), sys.argv[2], list(zip(sys.argv[3::2], sys.argv[4::2])))
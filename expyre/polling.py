@@ -0,0 +1,212 @@
+"""Policies that decide how long to wait between checks of whether a job has finished.  Each
+check costs a remote shell connection, a scheduler status command, and a remote copy, so
+polling a job that will be queued for days every few seconds wastes resources on the login
+node, and polling a job that is about to finish every half hour wastes the user's time.
+
+Each system has a policy (``polling`` dict in its config), used by ``ExPyRe.get_results``
+and ``ExPyRe.aget_results`` when no explicit ``check_interval`` is passed.
+"""
+import json
+import time
+import random
+import importlib
+
+from collections import deque
+
+
+class PollingPolicy:
+    """Base class of polling policies, which records each decision in ``decisions``
+    (most recent ``n_decisions``) and, optionally, as a JSON line in a log file
+
+    Parameters
+    ----------
+    log_file: str, default None
+        file to append decisions to, for tuning of policy parameters
+    n_decisions: int, default 1000
+        number of most recent decisions to keep in memory
+    """
+    def __init__(self, log_file=None, n_decisions=1000):
+        self.log_file = log_file
+        self.decisions = deque(maxlen=n_decisions)
+
+
+    def needs_estimate(self, job_id, remote_status):
+        """Whether ``interval`` should be passed a scheduler estimate of start and end time of job
+
+        Parameters
+        ----------
+        job_id: str
+            id of job
+        remote_status: str
+            current remote status of job
+
+        Returns
+        -------
+        bool
+        """
+        return False
+
+
+    def interval(self, job_id, remote_status, estimate=None):
+        """Time to wait until next check of job
+
+        Parameters
+        ----------
+        job_id: str
+            id of job
+        remote_status: str
+            current remote status of job
+        estimate: (float, float), default None
+            expected start and end time of job (seconds since epoch, each None if unknown), from
+            ``Scheduler.time_estimates``
+
+        Returns
+        -------
+        float interval in seconds
+        """
+        raise RuntimeError('Not implemented')
+
+
+    def forget(self, job_id):
+        """Discard any state of a job that is no longer being polled
+
+        Parameters
+        ----------
+        job_id: str
+            id of job
+        """
+        pass
+
+
+    def _record(self, job_id, remote_status, interval, reason, estimate=None):
+        decision = {'time': time.time(), 'job': job_id, 'remote_status': remote_status, 'interval': interval,
+                    'reason': reason, 'estimate': estimate}
+        self.decisions.append(decision)
+        if self.log_file is not None:
+            with open(self.log_file, 'a') as fout:
+                fout.write(json.dumps(decision) + '\n')
+
+
+class FixedPolling(PollingPolicy):
+    """Check at a fixed interval
+
+    Parameters
+    ----------
+    check_interval: float, default 30
+        time (in sec) between checks
+    log_file, n_decisions:
+        see ``PollingPolicy``
+    """
+    def __init__(self, check_interval=30, log_file=None, n_decisions=1000):
+        super().__init__(log_file, n_decisions)
+        self.check_interval = check_interval
+
+
+    def interval(self, job_id, remote_status, estimate=None):
+        self._record(job_id, remote_status, self.check_interval, 'fixed')
+        return self.check_interval
+
+
+class AdaptivePolling(PollingPolicy):
+    """Check at intervals that grow exponentially (from ``min_interval`` to ``max_interval``)
+    while a job stays in the same state, restarting from ``min_interval`` when its state changes.
+    If the scheduler provides estimates, waiting is shortened so that a queued job is checked
+    soon after its expected start time, and a running job more often as its expected end (usually
+    start plus time limit, so an upper bound) approaches.  Each interval is randomly perturbed
+    by up to a fraction ``jitter``, so that many processes do not poll in lockstep.
+
+    Parameters
+    ----------
+    min_interval: float, default 10
+        shortest interval (in sec)
+    max_interval: float, default 1800
+        longest interval (in sec)
+    backoff: float, default 2.0
+        factor by which interval grows with each check that finds job in the same state
+    jitter: float, default 0.1
+        max fractional random perturbation of each interval
+    use_estimates: bool, default True
+        use scheduler estimates of start and end time of job
+    log_file, n_decisions:
+        see ``PollingPolicy``
+    """
+    def __init__(self, min_interval=10, max_interval=1800, backoff=2.0, jitter=0.1, use_estimates=True,
+                 log_file=None, n_decisions=1000):
+        super().__init__(log_file, n_decisions)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.jitter = jitter
+        self.use_estimates = use_estimates
+        # job_id -> [remote_status, number of checks in this status, estimate for this status]
+        self._state = {}
+
+
+    def needs_estimate(self, job_id, remote_status):
+        # one estimate each time job becomes queued or running
+        if not self.use_estimates or remote_status not in ['queued', 'held', 'running']:
+            return False
+        return job_id not in self._state or self._state[job_id][0] != remote_status
+
+
+    def interval(self, job_id, remote_status, estimate=None):
+        state = self._state.get(job_id)
+        if state is None or state[0] != remote_status:
+            state = [remote_status, 0, None]
+            self._state[job_id] = state
+        if estimate is not None:
+            state[2] = estimate
+
+        interval = min(self.min_interval * self.backoff ** state[1], self.max_interval)
+        reason = 'backoff'
+        state[1] += 1
+
+        if state[2] is not None:
+            # expected start for queued job, expected end for running one
+            expected = state[2][0] if remote_status in ['queued', 'held'] else state[2][1]
+            if expected is not None:
+                # at least min_interval, since expected time may already have passed
+                until_expected = max(self.min_interval, (expected - time.time()) / 2.0)
+                if until_expected < interval:
+                    interval = until_expected
+                    reason = 'estimate'
+
+        interval *= 1.0 + random.uniform(-self.jitter, self.jitter)
+
+        self._record(job_id, remote_status, interval, reason, state[2])
+        return interval
+
+
+    def forget(self, job_id):
+        self._state.pop(job_id, None)
+
+
+policies = {'fixed': FixedPolling, 'adaptive': AdaptivePolling}
+
+
+def make_policy(polling):
+    """Create a polling policy from its (config) description
+
+    Parameters
+    ----------
+    polling: dict / None
+        None for ``FixedPolling()``, otherwise dict with "policy" key, which is a name in ``polling.policies``
+        ("fixed" or "adaptive") or a "module.ClassName" of a ``PollingPolicy`` subclass, and remaining
+        keys passed to its constructor
+
+    Returns
+    -------
+    PollingPolicy
+    """
+    if polling is None:
+        return FixedPolling()
+
+    polling = polling.copy()
+    policy = polling.pop('policy', 'fixed')
+    if policy in policies:
+        policy = policies[policy]
+    else:
+        module_name, class_name = policy.rsplit('.', 1)
+        policy = getattr(importlib.import_module(module_name), class_name)
+
+    return policy(**polling)
@@ -1,10 +1,20 @@
 import os
+import re
+import time
+from pathlib import Path
 
-from ..subprocess import subprocess_run
+from ..subprocess import subprocess_run, asubprocess_run
 from .. import util
+from .. import packed_runner
 
 
 class Scheduler:
+    # regexps of stderr lines (e.g. "Invalid job id specified") of status or accounting commands that fail
+    # only because some of their jobs are no longer known, see ``_chunks_args``
+    unknown_job_errors = []
+    # stdout line printed for each chunk of a status or accounting command that fails
+    _chunk_failed = '_EXPYRE_CHUNK_FAILED'
+
     def __init__(self, host, remsh_cmd=None):
         """Create Scheduler object.  [NEED MORE INFO ABOUT HOW SCRIPTS WILL BE SET UP, THEIR ENVIRONMENT, ETC]
 
@@ -18,6 +28,14 @@ class Scheduler:
         self.release_command = None
         self.cancel_command = None
         self.remsh_cmd = util.remsh_cmd(remsh_cmd)
+        # name of job script file written in job's remote dir
+        self.job_script_file = None
+        # env var containing (1-based) index of array job task
+        self.array_index_env_var = None
+        # StatusCache shared with other processes, set by System
+        self.status_cache = None
+        # final status of jobs found in accounting records, which never changes, so they are not queried again
+        self._final_status = {}
 
 
     def submit(self, id, remote_dir, partition, commands, max_time, header, node_dict, no_default_header=False,
@@ -25,10 +43,383 @@ class Scheduler:
         raise RuntimeError('Not implemented')
 
 
+    def job_script(self, id, remote_dir, partition, commands, max_time, header, node_dict, no_default_header=False,
+                   script_exec="/bin/bash", array_size=None):
+        """job script that ``submit`` writes into ``job_script_file`` and submits, with arguments same as ``submit``
+
+        Returns
+        -------
+        str job script
+        """
+        raise RuntimeError('Not implemented')
+
+
+    def submit_args(self, remote_dir, pre_submit_cmds=[], write_script=True):
+        """command line arguments (run on host) that submit a job
+
+        Parameters
+        ----------
+        remote_dir: str
+            remote directory of job
+        pre_submit_cmds: list(str), default []
+            command to run before the submission, see ``submit``
+        write_script: bool, default True
+            write standard input into ``job_script_file`` before submitting, otherwise it must already exist
+
+        Returns
+        -------
+        list(str) args for ``subprocess_run``, whose output is parsed by ``parse_submit_output``
+        """
+        raise RuntimeError('Not implemented')
+
+
+    def parse_submit_output(self, stdout):
+        """parse output of command from ``submit_args``
+
+        Parameters
+        ----------
+        stdout: str
+            output of submit command
+
+        Returns
+        -------
+        str remote job id
+        """
+        raise RuntimeError('Not implemented')
+
+
     def status(self, remote_ids, verbose=False):
         raise RuntimeError('Not implemented')
 
 
+    def status_args(self, remote_ids):
+        """command line arguments (run on host) that list status of remote jobs, to be parsed by ``parse_status``
+
+        Parameters
+        ----------
+        remote_ids: list(str)
+            list of remote ids to check
+
+        Returns
+        -------
+        list(str) args for ``subprocess_run``
+        """
+        raise RuntimeError('Not implemented')
+
+
+    def user_status_args(self):
+        """command line arguments (run on host) that list status of all of user's jobs, in format parsed by
+        ``parse_status``, used instead of ``status_args`` when output is cached, so that it can be shared by
+        processes tracking different jobs
+
+        Returns
+        -------
+        list(str) args for ``subprocess_run``, or None if scheduler cannot list user's jobs efficiently
+        """
+        return None
+
+
+    def _shared_status_args(self, remote_ids):
+        # status command args, listing all of user's jobs if output is cached and scheduler can do that
+        if self.status_cache is not None:
+            args = self.user_status_args()
+            if args is not None:
+                return args
+        return self.status_args(remote_ids)
+
+
+    def parse_status(self, stdout, remote_ids, unlisted='done'):
+        """parse output of command from ``status_args``
+
+        Parameters
+        ----------
+        stdout: str
+            output of status command
+        remote_ids: list(str)
+            list of remote ids to check
+        unlisted: str, default 'done'
+            status of jobs that are not listed in output, or None to leave them out of returned dict
+
+        Returns
+        -------
+        dict { str remote_id: str status}, as returned by ``status``
+        """
+        raise RuntimeError('Not implemented')
+
+
+    def accounting_args(self, remote_ids):
+        """command line arguments (run on host) that list final state of jobs that are no longer listed by
+        status command, to be parsed by ``parse_accounting``, or None if scheduler does not keep such records
+        """
+        return None
+
+
+    def parse_accounting(self, stdout, remote_ids):
+        """parse output of command from ``accounting_args``
+
+        Parameters
+        ----------
+        stdout: str
+            output of accounting command
+        remote_ids: list(str)
+            list of remote ids to check
+
+        Returns
+        -------
+        dict { str remote_id: (str status, int exit_code) } for jobs that are listed, with status as returned by
+            ``status``, and exit code of job script (negative signal number if it was killed by a signal, None if unknown)
+        """
+        raise RuntimeError('Not implemented')
+
+
+    def _chunks_args(self, chunks):
+        # args to run a command for each chunk of ids (each a list of args), continuing after failures
+        # since commands may fail if some of their jobs are unknown, which is checked by _checked_output
+        args = []
+        for chunk in chunks:
+            args += chunk + ['||', 'echo', Scheduler._chunk_failed, ';']
+        return args[:-1]
+
+
+    def _checked_output(self, args, stdout, stderr):
+        # stdout of command from _chunks_args, without lines marking failed chunks.  Raises RuntimeError
+        # unless stderr explains each failure by an unknown job, since otherwise (e.g. if scheduler daemon
+        # is not responding) jobs that were not listed because of failure would be taken to be done
+        stdout_lines = stdout.splitlines(keepends=True)
+        n_failed = len([line for line in stdout_lines if line.strip() == Scheduler._chunk_failed])
+        if n_failed == 0:
+            return stdout
+
+        n_unknown = len([line for line in stderr.splitlines()
+                         if any([re.search(error, line) for error in self.unknown_job_errors])])
+        if n_unknown < n_failed:
+            raise RuntimeError(f'Failed to run command "{" ".join(args)}" on {self.host} ({n_failed} failed '
+                               f'parts) with err {stderr}')
+
+        return ''.join([line for line in stdout_lines if line.strip() != Scheduler._chunk_failed])
+
+
+    def _status(self, remote_ids, run, verbose=False):
+        # implementation of status, with run the subprocess_run of subclass's module
+        if isinstance(remote_ids, str):
+            remote_ids = [remote_ids]
+        if len(remote_ids) == 0:
+            return {}
+
+        args = self._shared_status_args(remote_ids)
+        stdout = self._status_output(args, lambda: self._checked_output(args, *run(self.host, args, remsh_cmd=self.remsh_cmd,
+                                                                                   verbose=verbose)))
+        out = self.parse_status(stdout, remote_ids, unlisted=None)
+
+        # exact final state of jobs that have left the queue
+        unlisted = self._unlisted(out, remote_ids)
+        args = self.accounting_args(unlisted) if len(unlisted) > 0 else None
+        if args is not None:
+            stdout = self._checked_output(args, *run(self.host, args, remsh_cmd=self.remsh_cmd, verbose=verbose))
+            self._update_final_status(out, stdout, unlisted)
+
+        # jobs that are listed by neither are assumed to be done
+        for id in remote_ids:
+            out.setdefault(id, 'done')
+        return out
+
+
+    def _unlisted(self, out, remote_ids):
+        # ids of jobs that are not listed in status output out, filling in final status of those that were
+        # already found in accounting records, and returning the rest
+        unlisted = []
+        for id in remote_ids:
+            if id in out:
+                continue
+            if id in self._final_status:
+                out[id] = self._final_status[id]
+            else:
+                unlisted.append(id)
+        return unlisted
+
+
+    def _update_final_status(self, out, stdout, unlisted):
+        # add final status of jobs in accounting command output stdout to status output out, and save them
+        final_status = {id: status for id, (status, _) in self.parse_accounting(stdout, unlisted).items()}
+        self._final_status.update(final_status)
+        out.update(final_status)
+
+
+    async def astatus(self, remote_ids, verbose=False):
+        """asyncio version of ``status``, which does not block the event loop while
+        the status command is running
+        """
+        if isinstance(remote_ids, str):
+            remote_ids = [remote_ids]
+        if len(remote_ids) == 0:
+            return {}
+
+        args = self._shared_status_args(remote_ids)
+        stdout = None if self.status_cache is None else self.status_cache.get(' '.join(args))
+        if stdout is None:
+            start_time = time.time()
+            stdout = self._checked_output(args, *await asubprocess_run(self.host, args, remsh_cmd=self.remsh_cmd,
+                                                                       verbose=verbose))
+            if self.status_cache is not None:
+                self.status_cache.put(' '.join(args), stdout, start_time)
+        out = self.parse_status(stdout, remote_ids, unlisted=None)
+
+        unlisted = self._unlisted(out, remote_ids)
+        args = self.accounting_args(unlisted) if len(unlisted) > 0 else None
+        if args is not None:
+            stdout = self._checked_output(args, *await asubprocess_run(self.host, args, remsh_cmd=self.remsh_cmd,
+                                                                       verbose=verbose))
+            self._update_final_status(out, stdout, unlisted)
+
+        for id in remote_ids:
+            out.setdefault(id, 'done')
+        return out
+
+
+    def accounting(self, remote_ids, verbose=False):
+        """final state and exit code of jobs that are no longer listed by status command, if scheduler keeps records
+
+        Parameters
+        ----------
+        remote_ids: str, list(str)
+            list of remote ids to check
+
+        Returns
+        -------
+        dict { str remote_id: (str status, int exit_code) }, as returned by ``parse_accounting``, only for jobs
+            that scheduler has records of
+        """
+        if isinstance(remote_ids, str):
+            remote_ids = [remote_ids]
+
+        args = self.accounting_args(remote_ids)
+        if args is None or len(remote_ids) == 0:
+            return {}
+
+        stdout = self._checked_output(args, *subprocess_run(self.host, args, remsh_cmd=self.remsh_cmd, verbose=verbose))
+
+        return self.parse_accounting(stdout, remote_ids)
+
+
+    def _status_output(self, args, run):
+        # stdout of status command args, from status cache if it is fresh, otherwise from run()
+        if self.status_cache is None:
+            return run()
+        return self.status_cache.get_or_run(' '.join(args), run)
+
+
+    def time_estimates(self, remote_ids, verbose=False):
+        """scheduler's estimates of start and end time of remote jobs, if available
+
+        Parameters
+        ----------
+        remote_ids: str, list(str)
+            list of remote ids to get estimates for
+
+        Returns
+        -------
+        dict { str remote_id: (start, end) } with times in seconds since epoch (each None if unknown), only
+            for jobs that scheduler has estimates for (actual start time for running jobs)
+        """
+        if isinstance(remote_ids, str):
+            remote_ids = [remote_ids]
+
+        args = self.time_estimates_args(remote_ids) if len(remote_ids) > 0 else None
+        if args is None:
+            return {}
+
+        stdout = self._checked_output(args, *subprocess_run(self.host, args, remsh_cmd=self.remsh_cmd, verbose=verbose))
+
+        return self.parse_time_estimates(stdout, remote_ids)
+
+
+    async def atime_estimates(self, remote_ids, verbose=False):
+        """asyncio version of ``time_estimates``
+        """
+        if isinstance(remote_ids, str):
+            remote_ids = [remote_ids]
+
+        args = self.time_estimates_args(remote_ids) if len(remote_ids) > 0 else None
+        if args is None:
+            return {}
+
+        stdout = self._checked_output(args, *await asubprocess_run(self.host, args, remsh_cmd=self.remsh_cmd,
+                                                                   verbose=verbose))
+
+        return self.parse_time_estimates(stdout, remote_ids)
+
+
+    def time_estimates_args(self, remote_ids):
+        """command line arguments (run on host) that list estimated start and end times of remote jobs,
+        to be parsed by ``parse_time_estimates``, or None if scheduler does not provide estimates
+        """
+        return None
+
+
+    def parse_time_estimates(self, stdout, remote_ids):
+        """parse output of command from ``time_estimates_args``, returning dict like ``time_estimates``
+        """
+        raise RuntimeError('Not implemented')
+
+
+    def array_task_remote_ids(self, remote_id, array_size):
+        """remote ids of each task of an array job
+
+        Parameters
+        ----------
+        remote_id: str
+            remote id returned by array job submission
+        array_size: int
+            number of tasks
+
+        Returns
+        -------
+        list(str) remote ids of tasks, which can be passed to status, hold, release, and cancel
+        """
+        raise RuntimeError('Not implemented')
+
+
+    def submit_array(self, id, remote_dir, task_remote_dirs, task_ids, partition, commands, max_time, header,
+                     node_dict, no_default_header=False, script_exec="/bin/bash", pre_submit_cmds=[], verbose=False):
+        """Submit an array job, each task of which runs the same commands in a different directory,
+        as though it was a separate job submitted by ``submit``
+
+        Parameters
+        ----------
+        id: str
+            unique id (local) of array job
+        remote_dir: str
+            remote directory where array job script is written
+        task_remote_dirs: list(str)
+            remote directory of each task, where files have already been prepared, either absolute or
+            relative to remote_dir
+        task_ids: list(str)
+            unique id (local) of each task, used to name its job stdout and stderr files
+        partition, commands, max_time, header, node_dict, no_default_header, script_exec, pre_submit_cmds:
+            same as for ``submit``
+
+        Returns
+        -------
+        list(str) remote job id of each task
+        """
+        if self.array_index_env_var is None:
+            raise RuntimeError(f'Array jobs not implemented for {self.__class__.__name__}')
+        assert len(task_remote_dirs) == len(task_ids)
+
+        # go to task's dir and redirect output to files named as they would be for a separate job
+        array_commands = ['_expyre_task_dirs=(' + ' '.join([f'"{d}"' for d in task_remote_dirs]) + ')',
+                          '_expyre_task_ids=(' + ' '.join([f'"{task_id}"' for task_id in task_ids]) + ')',
+                          f'_expyre_task_i=$(( ${self.array_index_env_var} - 1 ))',
+                          'cd "${_expyre_task_dirs[$_expyre_task_i]}"',
+                          'exec > "job.${_expyre_task_ids[$_expyre_task_i]}.stdout" 2> "job.${_expyre_task_ids[$_expyre_task_i]}.stderr"']
+
+        remote_id = self.submit(id, remote_dir, partition, array_commands + commands, max_time, header, node_dict,
+                                no_default_header=no_default_header, script_exec=script_exec,
+                                pre_submit_cmds=pre_submit_cmds, array_size=len(task_ids), verbose=verbose)
+
+        return self.array_task_remote_ids(remote_id, len(task_ids))
+
+
     def hold(self, remote_ids, verbose=False):
         """hold remote job
 
@@ -71,6 +462,54 @@ class Scheduler:
         subprocess_run(self.host, args=self.cancel_command + remote_ids, remsh_cmd=self.remsh_cmd, verbose=verbose)
 
 
+    def submit_packed(self, id, remote_dir, task_remote_dirs, task_ids, partition, commands, task_commands, max_time,
+                      header, node_dict, cores_per_task=1, python_cmd='python3', no_default_header=False,
+                      script_exec="/bin/bash", pre_submit_cmds=[], verbose=False):
+        """Submit a packed job, which runs several tasks concurrently, each in a different directory and
+        using cores_per_task of the job's EXPYRE_NUM_CORES, as though each was a separate job submitted by
+        ``submit``
+
+        Parameters
+        ----------
+        id: str
+            unique id (local) of packed job
+        remote_dir: str
+            remote directory where packed job script runs
+        task_remote_dirs: list(str)
+            remote directory of each task, where files have already been prepared, either absolute or
+            relative to remote_dir
+        task_ids: list(str)
+            unique id (local) of each task, used to name its job stdout and stderr files
+        commands: list(str)
+            commands to run once in job script, before tasks are started
+        task_commands: list(str)
+            commands to run for each task, in its directory
+        cores_per_task: int, default 1
+            number of cores for each task, which sets its EXPYRE_NUM_CORES and how many tasks run at once
+        python_cmd: str, default python3
+            name of python interpreter that runs tasks
+        partition, max_time, header, node_dict, no_default_header, script_exec, pre_submit_cmds:
+            same as for ``submit``
+
+        Returns
+        -------
+        str remote job id, shared by all tasks
+        """
+        assert len(task_remote_dirs) == len(task_ids)
+
+        runner_source = Path(packed_runner.__file__).read_text()
+        packed_commands = (['cat > _expyre_packed_task << "EOF_EXPYRE_PACKED_TASK"'] + task_commands +
+                           ['EOF_EXPYRE_PACKED_TASK',
+                            'cat > _expyre_packed_runner.py << "EOF_EXPYRE_PACKED_RUNNER"'] + runner_source.splitlines() +
+                           ['EOF_EXPYRE_PACKED_RUNNER',
+                            f'{python_cmd} _expyre_packed_runner.py {cores_per_task} _expyre_packed_task ' +
+                            ' '.join([f'"{task_dir}" "{task_id}"' for task_dir, task_id in zip(task_remote_dirs, task_ids)])])
+
+        return self.submit(id, remote_dir, partition, commands + packed_commands, max_time, header, node_dict,
+                           no_default_header=no_default_header, script_exec=script_exec,
+                           pre_submit_cmds=pre_submit_cmds, verbose=verbose)
+
+
     @staticmethod
     def unset_scheduler_env_vars(prefix):
         unset_cmds = []
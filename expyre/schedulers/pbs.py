@@ -19,16 +19,27 @@ class PBS(Scheduler):
     remsh_cmd: str, default EXPYRE_RSH env var or 'ssh'
         remote shell command to use
     """
+    # qstat fails if any of its jobs are unknown, even in job history
+    unknown_job_errors = ['Unknown Job Id']
+    # Exit_status of job killed for exceeding its walltime (JOB_EXEC_KILL_WALLTIME)
+    _exit_kill_walltime = -29
+
     def __init__(self, host, remsh_cmd=None):
         self.host = host
         self.hold_command = ['qhold']
         self.release_command = ['qrls']
         self.cancel_command = ['qdel']
         self.remsh_cmd = util.remsh_cmd(remsh_cmd)
+        self.job_script_file = 'job.script.pbs'
+        self.array_index_env_var = 'PBS_ARRAY_INDEX'
+        self.status_cache = None
+        self._final_status = {}
+        # max number of job ids in each qstat command
+        self.status_chunk_size = 500
 
 
     def submit(self, id, remote_dir, partition, commands, max_time, header, node_dict, no_default_header=False,
-               script_exec="/bin/bash", pre_submit_cmds=[], verbose=False):
+               script_exec="/bin/bash", pre_submit_cmds=[], array_size=None, verbose=False):
         """Submit a job on a remote machine
 
         Parameters
@@ -55,11 +66,24 @@ class PBS(Scheduler):
         pre_submit_cmds: list(str), default []
             command to run in the remote process that does the submission before the actual submission,
             e.g. to fix the environment
+        array_size: int, default None
+            submit as an array job with this many tasks, numbered from 1 (see ``Scheduler.submit_array``)
 
         Returns
         -------
         str remote job id
         """
+        script = self.job_script(id, remote_dir, partition, commands, max_time, header, node_dict,
+                                 no_default_header=no_default_header, script_exec=script_exec, array_size=array_size)
+
+        stdout, stderr = subprocess_run(self.host, args=self.submit_args(remote_dir, pre_submit_cmds), script=script,
+                                        remsh_cmd=self.remsh_cmd, verbose=verbose)
+
+        return self.parse_submit_output(stdout)
+
+
+    def job_script(self, id, remote_dir, partition, commands, max_time, header, node_dict, no_default_header=False,
+                   script_exec="/bin/bash", array_size=None):
         node_dict = node_dict.copy()
 
         # Make sure that there are no '=' in id
@@ -78,15 +102,19 @@ class PBS(Scheduler):
         node_dict['queue'] = partition
 
         header = header.copy()
+        # array tasks would all write to same file, so add task index
+        job_output = 'job.{id}' if array_size is None else 'job.{id}.^array_index^'
         if not no_default_header:
             # Make sure that first characer is alphabetic
             # Let's hope there aren't length limitations anymore
             header.append('#PBS -N N_{id}')
             header.append('#PBS -l walltime={max_time}')
-            header.append('#PBS -o job.{id}.stdout')
-            header.append('#PBS -e job.{id}.stderr')
+            header.append('#PBS -o ' + job_output + '.stdout')
+            header.append('#PBS -e ' + job_output + '.stderr')
             header.append('#PBS -S /bin/bash')
             header.append('#PBS -r n')
+        if array_size is not None:
+            header.append(f'#PBS -J 1-{array_size}')
 
         header.extend(json.loads(os.environ.get("EXPYRE_HEADER_EXTRA", "[]")))
 
@@ -115,13 +143,21 @@ class PBS(Scheduler):
         script += '\n'.join([line.rstrip().format(**node_dict) for line in header]) + '\n'
         script += '\n' + '\n'.join([line.rstrip() for line in commands]) + '\n'
 
+        return script
+
+
+    def submit_args(self, remote_dir, pre_submit_cmds=[], write_script=True):
         submit_args = Scheduler.unset_scheduler_env_vars("PBS")
         submit_args += pre_submit_cmds + (['&&'] if len(pre_submit_cmds) > 0 else [])
-        submit_args += ['cd', remote_dir, '&&', 'cat', '>', 'job.script.pbs',
-                        '&&', 'qsub', 'job.script.pbs']
+        submit_args += ['cd', remote_dir, '&&']
+        if write_script:
+            submit_args += ['cat', '>', self.job_script_file, '&&']
+        submit_args += ['qsub', self.job_script_file]
+
+        return submit_args
 
-        stdout, stderr = subprocess_run(self.host, args=submit_args, script=script, remsh_cmd=self.remsh_cmd, verbose=verbose)
 
+    def parse_submit_output(self, stdout):
         # parse stdout for remote job id
         if len(stdout.splitlines()) != 1:
             raise RuntimeError('More than one line in qsub output')
@@ -145,40 +181,120 @@ class PBS(Scheduler):
         dict { str remote_id: str status},  status is one of :
                 "queued", "held", "running",   "done", "failed", "timeout", "other"
             all remote ids passed in are guaranteed to be keys in dict, specific jobs that are
-            not listed by queueing system have status "done"
+            not known to queueing system (even in its job history) have status "done"
+        """
+        return self._status(remote_ids, subprocess_run, verbose=verbose)
+
+
+    def status_args(self, remote_ids):
+        # full status of only tracked jobs, in chunks, each allowed to fail only because of unknown_job_errors
+        # -x to include finished jobs, with their exit status
+        # -F json for machine readable output
+        # ids are escaped, since array subjob ids (<id>[<index>].<server>) look like globs
+        return self._chunks_args([['qstat', '-f', '-F', 'json', '-x'] +
+                                  [id.replace('[', '\\[').replace(']', '\\]')
+                                   for id in remote_ids[chunk_start:chunk_start + self.status_chunk_size]]
+                                  for chunk_start in range(0, len(remote_ids), self.status_chunk_size)])
+
+
+    @staticmethod
+    def _jobs(stdout, remote_ids):
+        # yield (remote_id, job dict) for tracked jobs in one or more concatenated qstat json outputs
+        # ids in output may have longer server name than qsub output, so also match by part before server
+        ids = {}
+        for id in remote_ids:
+            ids[id] = id
+            ids[id.split('.')[0]] = id
+        decoder = json.JSONDecoder(strict=False)
+        pos = 0
+        stdout = stdout.strip()
+        while pos < len(stdout):
+            data, pos = decoder.raw_decode(stdout, pos)
+            while pos < len(stdout) and stdout[pos].isspace():
+                pos += 1
+            for job_id, job in data.get('Jobs', {}).items():
+                id = ids.get(job_id, ids.get(job_id.split('.')[0]))
+                if id is not None:
+                    yield id, job
+
+
+    @staticmethod
+    def _status_of_job(job):
+        status = job.get('job_state')
+        if status in ['R', 'E']:
+            return 'running'
+        elif status == 'Q':
+            return 'queued'
+        elif status == 'H':
+            return 'held'
+        elif status in ['F', 'X']:
+            # X is finished (or expired) array subjob
+            exit_status = job.get('Exit_status', 0)
+            if exit_status == PBS._exit_kill_walltime:
+                return 'timeout'
+            return 'done' if exit_status == 0 else 'failed'
+        return 'other'
+
+
+    def parse_status(self, stdout, remote_ids, unlisted='done'):
+        out = {id: PBS._status_of_job(job) for id, job in PBS._jobs(stdout, remote_ids)}
+
+        if unlisted is not None:
+            for id in remote_ids:
+                if id not in out:
+                    out[id] = unlisted
+
+        return out
+
+
+    def accounting_args(self, remote_ids):
+        # finished jobs are already listed by status command, with exit status, until server discards its job
+        # history, so jobs it does not list are unknown
+        return None
+
+
+    def accounting(self, remote_ids, verbose=False):
+        """final state and exit code of finished jobs, from status command, while server keeps their history
+
+        Parameters
+        ----------
+        remote_ids: str, list(str)
+            list of remote ids to check
+
+        Returns
+        -------
+        dict { str remote_id: (str status, int exit_code) }, as returned by ``parse_accounting``, only for jobs
+            that server has records of
         """
         if isinstance(remote_ids, str):
             remote_ids = [remote_ids]
+        if len(remote_ids) == 0:
+            return {}
 
-        # -w to make fields wide and less likely to truncate jobid
-        # -x for historical data it should never say "Job has finished", but rather use same format for all jobs
-        # -a for all jobs, most useful version that works with -w, hence need for grep USER
-        stdout, stderr = subprocess_run(self.host,
-            ['qstat', '-w', '-x', '-a', '|', 'grep', ' $USER '],
-            remsh_cmd=self.remsh_cmd, verbose=verbose)
-
-        lines = stdout.splitlines()
-        # parse id and status from format
-        # (id, _user, _queue, _jobname, _sessid, _nds, _tsk, _mem, _timereq, status, _timeelap) = l.strip().split()
-        id_status = [(line.strip().split()[0], line.strip().split()[9]) for line in lines
-                     if line.strip().split()[0] in remote_ids]
-        out = {}
-        for id, status in id_status:
-            if status in ['R', 'E']:
-                status = 'running'
-            elif status == 'Q':
-                status = 'queued'
-            elif status == 'H':
-                status = 'held'
-            elif status == 'F':
-                status = 'done'
-            else:
-                status = 'other'
-
-            out[id] = status
+        args = self.status_args(remote_ids)
+        stdout = self._checked_output(args, *subprocess_run(self.host, args, remsh_cmd=self.remsh_cmd, verbose=verbose))
 
-        for id in remote_ids:
-            if id not in out:
-                out[id] = 'done'
+        return self.parse_accounting(stdout, remote_ids)
+
+
+    def parse_accounting(self, stdout, remote_ids):
+        out = {}
+        for id, job in PBS._jobs(stdout, remote_ids):
+            if job.get('job_state') not in ['F', 'X']:
+                continue
+            exit_code = job.get('Exit_status')
+            # >= 256 is 256 + signal that killed it
+            if exit_code is not None and exit_code >= 256:
+                exit_code = -(exit_code - 256)
+            elif exit_code is not None and exit_code < 0:
+                # negative values are server's reasons (e.g. walltime) for job not running to completion,
+                # not exit codes of job script
+                exit_code = None
+            out[id] = (PBS._status_of_job(job), exit_code)
 
         return out
+
+
+    def array_task_remote_ids(self, remote_id, array_size):
+        # array job id is <id>[].<server>
+        return [remote_id.replace('[]', f'[{task_i}]') for task_i in range(1, array_size + 1)]
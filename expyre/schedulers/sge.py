@@ -1,7 +1,10 @@
 import os
+import io
 import json
 import re
 
+from xml.etree import ElementTree
+
 from ..subprocess import subprocess_run
 from ..units import time_to_HMS
 from .. import util
@@ -19,16 +22,26 @@ class SGE(Scheduler):
     remsh_cmd: str, default EXPYRE_RSH env var or 'ssh'
         remote shell command to use
     """
+    # qacct fails if job is unknown, e.g. if it finished too recently to be in accounting file yet
+    unknown_job_errors = [r'job id \S+ not found']
+    # accounting records of user's jobs that started within this many days are read by one qacct,
+    # since each qacct reads the entire accounting file
+    accounting_days = 7
+
     def __init__(self, host, remsh_cmd=None):
         self.host = host
         self.hold_command = ['qhold']
         self.release_command = ['qrls']
         self.cancel_command = ['qdel']
         self.remsh_cmd = util.remsh_cmd(remsh_cmd)
+        self.job_script_file = 'job.script.sge'
+        self.array_index_env_var = 'SGE_TASK_ID'
+        self.status_cache = None
+        self._final_status = {}
 
 
     def submit(self, id, remote_dir, partition, commands, max_time, header, node_dict, no_default_header=False,
-               script_exec="/bin/bash", pre_submit_cmds=[], verbose=False):
+               script_exec="/bin/bash", pre_submit_cmds=[], array_size=None, verbose=False):
         """Submit a job on a remote machine
 
         Parameters
@@ -55,11 +68,24 @@ class SGE(Scheduler):
         pre_submit_cmds: list(str), default []
             command to run in the remote process that does the submission before the actual submission,
             e.g. to fix the environment
+        array_size: int, default None
+            submit as an array job with this many tasks, numbered from 1 (see ``Scheduler.submit_array``)
 
         Returns
         -------
         str remote job id
         """
+        script = self.job_script(id, remote_dir, partition, commands, max_time, header, node_dict,
+                                 no_default_header=no_default_header, script_exec=script_exec, array_size=array_size)
+
+        stdout, stderr = subprocess_run(self.host, args=self.submit_args(remote_dir, pre_submit_cmds), script=script,
+                                        remsh_cmd=self.remsh_cmd, verbose=verbose)
+
+        return self.parse_submit_output(stdout)
+
+
+    def job_script(self, id, remote_dir, partition, commands, max_time, header, node_dict, no_default_header=False,
+                   script_exec="/bin/bash", array_size=None):
         node_dict = node_dict.copy()
 
         node_dict['id'] = id
@@ -68,15 +94,19 @@ class SGE(Scheduler):
         node_dict['queue'] = partition
 
         header = header.copy()
+        # array tasks would all write to same file, so add task index
+        job_output = 'job.{id}' if array_size is None else 'job.{id}.$TASK_ID'
         if not no_default_header:
             # Make sure that first characer is alphabetic
             header.append('#$ -N N_{id}')
             header.append('#$ -l h_rt={max_time}')
-            header.append('#$ -o job.{id}.stdout')
-            header.append('#$ -e job.{id}.stderr')
+            header.append('#$ -o ' + job_output + '.stdout')
+            header.append('#$ -e ' + job_output + '.stderr')
             header.append('#$ -S /bin/bash')
             header.append('#$ -r n')
             header.append('#$ -cwd')
+        if array_size is not None:
+            header.append(f'#$ -t 1-{array_size}')
 
         header.extend(json.loads(os.environ.get("EXPYRE_HEADER_EXTRA", "[]")))
 
@@ -104,17 +134,26 @@ class SGE(Scheduler):
         script += '\n'.join([line.rstrip().format(**node_dict) for line in header]) + '\n'
         script += '\n' + '\n'.join([line.rstrip() for line in commands]) + '\n'
 
+        return script
+
+
+    def submit_args(self, remote_dir, pre_submit_cmds=[], write_script=True):
         submit_args = Scheduler.unset_scheduler_env_vars("SGE")
         submit_args += pre_submit_cmds + (['&&'] if len(pre_submit_cmds) > 0 else [])
-        submit_args += ['cd', remote_dir, '&&', 'cat', '>', 'job.script.sge',
-                        '&&', 'qsub', 'job.script.sge']
+        submit_args += ['cd', remote_dir, '&&']
+        if write_script:
+            submit_args += ['cat', '>', self.job_script_file, '&&']
+        submit_args += ['qsub', self.job_script_file]
 
-        stdout, stderr = subprocess_run(self.host, args=submit_args, script=script, remsh_cmd=self.remsh_cmd, verbose=verbose)
+        return submit_args
 
+
+    def parse_submit_output(self, stdout):
         # parse stdout for remote job id
         if len(stdout.splitlines()) != 1:
             raise RuntimeError('More than one line in qsub output')
-        m = re.match(r'Your\s+job\s+(\d+)\s+\("\S+"\)\s+has\s+been\s+submitted', stdout.strip())
+        # array job submission reports "job-array <id>.<task range>"
+        m = re.match(r'Your\s+job(?:-array)?\s+(\d+)(?:\.\S+)?\s+\("\S+"\)\s+has\s+been\s+submitted', stdout.strip())
         if m is None:
             raise RuntimeError('Empty output from qsub')
 
@@ -134,23 +173,36 @@ class SGE(Scheduler):
         dict { str remote_id: str status},  status is one of :
                 "queued", "held", "running",  "done", "failed", "timeout", "other"
             all remote ids passed in are guaranteed to be keys in dict, specific jobs that are
-            not listed by queueing system have status "done"
+            no longer listed by qstat get their final state from qacct, and those unknown to both
+            have status "done"
         """
-        if isinstance(remote_ids, str):
-            remote_ids = [remote_ids]
-
-        stdout, stderr = subprocess_run(self.host, ['qstat'],
-            remsh_cmd=self.remsh_cmd, verbose=verbose)
-
-        # first two lines are header
-        lines = stdout.splitlines()[2:]
-        # parse id and status from format
-        # (id, _priority, _jobname, _user, status, _sub_or_start_date,
-        # _sub_or_start_time, [_queue], _nprocs) = l.strip().split()
-        id_status = [(line.strip().split()[0], line.strip().split()[4]) for line in lines
-                     if line.strip().split()[0] in remote_ids]
+        return self._status(remote_ids, subprocess_run, verbose=verbose)
+
+
+    def status_args(self, remote_ids):
+        # qstat cannot list a given set of jobs (other than in full detail with -j), so list all of user's
+        # jobs, but as xml, which is unambiguous for pending and running array tasks
+        return ['qstat', '-xml']
+
+
+    def user_status_args(self):
+        return self.status_args([])
+
+
+    def parse_status(self, stdout, remote_ids, unlisted='done'):
+        remote_ids_set = set(remote_ids)
+
         out = {}
-        for id, status in id_status:
+        for event, elem in ElementTree.iterparse(io.StringIO(stdout)):
+            if elem.tag != 'job_list':
+                continue
+            job_id = elem.findtext('JB_job_number')
+            status = elem.findtext('state')
+            # array tasks are <id>.<task>, and tasks is a single task if running, or list of
+            # task ranges <first>-<last>:<step> if pending
+            tasks = elem.findtext('tasks')
+            elem.clear()
+
             if status in ['t', 'r']:
                 status = 'running'
             elif status == 'qw':
@@ -160,10 +212,76 @@ class SGE(Scheduler):
             else:
                 status = 'other'
 
-            out[id] = status
+            if tasks is None:
+                ids = [job_id]
+            else:
+                ids = []
+                for task_range in tasks.split(','):
+                    m = re.match(r'^(\d+)(?:-(\d+)(?::(\d+))?)?$', task_range)
+                    first = int(m.group(1))
+                    last = int(m.group(2)) if m.group(2) is not None else first
+                    step = int(m.group(3)) if m.group(3) is not None else 1
+                    ids.extend([f'{job_id}.{task_i}' for task_i in range(first, last + 1, step)])
+            for id in ids:
+                if id in remote_ids_set:
+                    out[id] = status
+
+        if unlisted is not None:
+            for id in remote_ids:
+                if id not in out:
+                    out[id] = unlisted
+
+        return out
+
+
+    def accounting_args(self, remote_ids):
+        # qacct can list only one job, or all jobs, so list all of user's recent jobs at once (filtered by
+        # parse_accounting), rather than scan the accounting file for each job.  Allowed to fail only because of
+        # unknown_job_errors
+        return self._chunks_args([['qacct', '-o', '$USER', '-d', str(self.accounting_days), '-j']])
+
 
-        for id in remote_ids:
-            if id not in out:
-                out[id] = 'done'
+    def parse_accounting(self, stdout, remote_ids):
+        remote_ids_set = set(remote_ids)
+
+        out = {}
+        for record in re.split(r'^=+$', stdout, flags=re.MULTILINE):
+            fields = {}
+            for line in record.splitlines():
+                key_value = line.strip().split(maxsplit=1)
+                if len(key_value) == 2:
+                    fields[key_value[0]] = key_value[1].strip()
+            if 'jobnumber' not in fields:
+                continue
+
+            id = fields['jobnumber']
+            if fields.get('taskid', 'undefined') != 'undefined':
+                id += '.' + fields['taskid']
+            if id not in remote_ids_set:
+                continue
+
+            # failed is "<code>" or "<code> : <description>"
+            failed = fields.get('failed', '0').split()[0]
+            try:
+                exit_code = int(fields.get('exit_status'))
+                # > 128 is 128 + signal that killed it
+                if exit_code > 128:
+                    exit_code = -(exit_code - 128)
+            except (TypeError, ValueError):
+                exit_code = None
+
+            if failed == '37':
+                # job exceeded h_rt
+                status = 'timeout'
+            elif failed != '0' or exit_code != 0:
+                status = 'failed'
+            else:
+                status = 'done'
+            # jobs that were rerun are listed more than once, latest last
+            out[id] = (status, exit_code)
 
         return out
+
+
+    def array_task_remote_ids(self, remote_id, array_size):
+        return [f'{remote_id}.{task_i}' for task_i in range(1, array_size + 1)]
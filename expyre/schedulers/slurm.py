@@ -2,6 +2,8 @@ import os
 import json
 import re
 
+from datetime import datetime
+
 from ..subprocess import subprocess_run
 from ..units import time_to_HMS
 from .. import util
@@ -19,16 +21,26 @@ class Slurm(Scheduler):
     remsh_cmd: str, default EXPYRE_RSH env var or 'ssh'
         remote shell command to use
     """
+    # squeue fails if none of its jobs are known any more (which are then looked up with sacct),
+    # and sacct if accounting is disabled
+    unknown_job_errors = ['Invalid job id specified', 'accounting storage is disabled']
+
     def __init__(self, host, remsh_cmd=None):
         self.host = host
         self.hold_command = ['scontrol', 'hold']
         self.release_command = ['scontrol', 'release']
         self.cancel_command = ['scancel']
         self.remsh_cmd = util.remsh_cmd(remsh_cmd)
+        self.job_script_file = 'job.script.slurm'
+        self.array_index_env_var = 'SLURM_ARRAY_TASK_ID'
+        self.status_cache = None
+        self._final_status = {}
+        # max number of job ids in each squeue or sacct command
+        self.status_chunk_size = 500
 
 
     def submit(self, id, remote_dir, partition, commands, max_time, header, node_dict, no_default_header=False,
-               script_exec="/bin/bash", pre_submit_cmds=[], verbose=False):
+               script_exec="/bin/bash", pre_submit_cmds=[], array_size=None, verbose=False):
         """Submit a job on a remote machine
 
         Parameters
@@ -55,22 +67,39 @@ class Slurm(Scheduler):
         pre_submit_cmds: list(str), default []
             command to run in the remote process that does the submission before the actual submission,
             e.g. to fix the environment
+        array_size: int, default None
+            submit as an array job with this many tasks, numbered from 1 (see ``Scheduler.submit_array``)
 
         Returns
         -------
         str remote job id
         """
+        script = self.job_script(id, remote_dir, partition, commands, max_time, header, node_dict,
+                                 no_default_header=no_default_header, script_exec=script_exec, array_size=array_size)
+
+        stdout, stderr = subprocess_run(self.host, args=self.submit_args(remote_dir, pre_submit_cmds), script=script,
+                                        remsh_cmd=self.remsh_cmd, verbose=verbose)
+
+        return self.parse_submit_output(stdout)
+
+
+    def job_script(self, id, remote_dir, partition, commands, max_time, header, node_dict, no_default_header=False,
+                   script_exec="/bin/bash", array_size=None):
         node_dict = node_dict.copy()
         node_dict['id'] = id
         node_dict['max_time'] = time_to_HMS(max_time)
         node_dict['partition'] = partition
         node_dict['queue'] = partition
         header = header.copy()
+        # array tasks would all write to same file, so add task index
+        job_output = 'job.{id}' if array_size is None else 'job.{id}.%a'
         if not no_default_header:
             header.append('#SBATCH --job-name={id}')
             header.append('#SBATCH --time={max_time}')
-            header.append('#SBATCH --output=job.{id}.stdout')
-            header.append('#SBATCH --error=job.{id}.stderr')
+            header.append('#SBATCH --output=' + job_output + '.stdout')
+            header.append('#SBATCH --error=' + job_output + '.stderr')
+        if array_size is not None:
+            header.append(f'#SBATCH --array=1-{array_size}')
 
         header.extend(json.loads(os.environ.get("EXPYRE_HEADER_EXTRA", "[]")))
 
@@ -100,13 +129,21 @@ class Slurm(Scheduler):
         script += '\n'.join([line.rstrip().format(**node_dict) for line in header]) + '\n'
         script += '\n' + '\n'.join([line.rstrip() for line in commands]) + '\n'
 
+        return script
+
+
+    def submit_args(self, remote_dir, pre_submit_cmds=[], write_script=True):
         submit_args = Scheduler.unset_scheduler_env_vars("SLURM")
         submit_args += pre_submit_cmds + (['&&'] if len(pre_submit_cmds) > 0 else [])
-        submit_args += ['cd', remote_dir, '&&', 'cat', '>', 'job.script.slurm',
-                        '&&', 'sbatch', 'job.script.slurm']
+        submit_args += ['cd', remote_dir, '&&']
+        if write_script:
+            submit_args += ['cat', '>', self.job_script_file, '&&']
+        submit_args += ['sbatch', self.job_script_file]
 
-        stdout, stderr = subprocess_run(self.host, args=submit_args, script=script, remsh_cmd=self.remsh_cmd, verbose=verbose)
+        return submit_args
 
+
+    def parse_submit_output(self, stdout):
         # parse stdout for remote job id
         remote_id = None
         for line in stdout.splitlines():
@@ -134,17 +171,50 @@ class Slurm(Scheduler):
         dict { str remote_id: str status},  status is one of :
                 "queued", "held", "running",   "done", "failed", "timeout", "other"
             all remote ids passed in are guaranteed to be keys in dict, specific jobs that are
-            not listed by queueing system have status "done"
+            no longer listed by squeue get their final state from sacct, and those unknown to both
+            have status "done"
         """
-        if isinstance(remote_ids, str):
-            remote_ids = [remote_ids]
+        return self._status(remote_ids, subprocess_run, verbose=verbose)
+
 
-        stdout, stderr = subprocess_run(self.host,
-            ['squeue', '--user', '$USER', '--noheader', '-O', 'jobid:20,state:30,reason:200'],
-            remsh_cmd=self.remsh_cmd, verbose=verbose)
+    def _chunked(self, args, remote_ids):
+        # one command per chunk of ids, each allowed to fail only because of unknown_job_errors
+        return self._chunks_args([args + ['--jobs=' + ','.join(remote_ids[chunk_start:chunk_start + self.status_chunk_size])]
+                                  for chunk_start in range(0, len(remote_ids), self.status_chunk_size)])
 
-        id_status_reasons = [line.strip().split(maxsplit=2) for line in stdout.splitlines()
-                             if line.split()[0] in remote_ids]
+
+    def status_args(self, remote_ids):
+        # only tracked jobs rather than all of user's jobs
+        # -r to list each array task separately (as <array id>_<index>), even when still pending
+        return self._chunked(['squeue', '-r', '--noheader', '-O', 'jobid:20,state:30,reason:200'], remote_ids)
+
+
+    def user_status_args(self):
+        return ['squeue', '--user', '$USER', '-r', '--noheader', '-O', 'jobid:20,state:30,reason:200']
+
+
+    @staticmethod
+    def _status_of_state(state, reason=''):
+        # expyre status of slurm job state
+        if state in ['RUNNING', 'COMPLETING']:
+            return 'running'
+        elif state in ['PENDING', 'REQUEUED']:
+            if 'held' in reason.lower():
+                return 'held'
+            return 'queued'
+        elif state == 'COMPLETED':
+            return 'done'
+        elif 'fail' in state.lower() or state == 'OUT_OF_MEMORY':
+            return 'failed'
+        elif state in ['TIMEOUT', 'DEADLINE']:
+            return 'timeout'
+        return 'other'
+
+
+    def parse_status(self, stdout, remote_ids, unlisted='done'):
+        remote_ids_set = set(remote_ids)
+        id_status_reasons = [fields for fields in [line.strip().split(maxsplit=2) for line in stdout.splitlines()]
+                             if len(fields) > 0 and fields[0] in remote_ids_set]
 
         out = {}
         for id_status_reason in id_status_reasons:
@@ -153,24 +223,68 @@ class Slurm(Scheduler):
             except Exception:
                 raise ValueError(f'failed to parse id_status_reason {id_status_reason}')
 
-            if status in ['RUNNING', 'COMPLETING']:
-                status = 'running'
-            elif status == 'PENDING':
-                if 'held' in reason.lower():
-                    status = 'held'
-                else:
-                    status = 'queued'
-            elif status == 'COMPLETED':
-                status = 'done'
-            elif 'fail' in status.lower():
-                status = 'failed'
-            elif status == 'TIMEOUT':
-                status = 'timeout'
-            else:
-                status = 'other'
-            out[id] = status
-
-        for id in remote_ids:
-            if id not in out:
-                out[id] = 'done'
+            out[id] = Slurm._status_of_state(status, reason)
+
+        if unlisted is not None:
+            for id in remote_ids:
+                if id not in out:
+                    out[id] = unlisted
         return out
+
+
+    def accounting_args(self, remote_ids):
+        # --allocations for job itself rather than its steps, --parsable2 for "|" separated fields
+        # (--json would need a recent slurm built with json support)
+        return self._chunked(['sacct', '--noheader', '--parsable2', '--allocations', '--format=JobID,State,ExitCode'],
+                             remote_ids)
+
+
+    def parse_accounting(self, stdout, remote_ids):
+        remote_ids_set = set(remote_ids)
+        out = {}
+        for line in stdout.splitlines():
+            fields = line.strip().split('|')
+            if len(fields) != 3 or fields[0] not in remote_ids_set:
+                continue
+            id, state, exit_code = fields
+            # e.g. "CANCELLED by 1234"
+            state = state.split()[0] if len(state) > 0 else state
+            try:
+                # <exit code>:<signal>
+                exit_code, signal = [int(f) for f in exit_code.split(':')]
+                exit_code = -signal if signal != 0 else exit_code
+            except ValueError:
+                exit_code = None
+            # requeued jobs are listed more than once, latest last
+            out[id] = (Slurm._status_of_state(state), exit_code)
+
+        return out
+
+
+    def time_estimates_args(self, remote_ids):
+        # for pending jobs start time is the (backfill) scheduler's expected start, N/A if not yet
+        # computed, and end time is start time plus time limit.  Only tracked jobs, in chunks like status_args
+        return self._chunked(['squeue', '-r', '--noheader', '-O', 'jobid:20,starttime:30,endtime:30'], remote_ids)
+
+
+    def parse_time_estimates(self, stdout, remote_ids):
+        def _time(t):
+            # times are in local time of cluster, assumed to be same timezone as this machine
+            try:
+                return datetime.fromisoformat(t).timestamp()
+            except ValueError:
+                # N/A, Unknown, etc
+                return None
+
+        remote_ids_set = set(remote_ids)
+        out = {}
+        for line in stdout.splitlines():
+            fields = line.strip().split()
+            if len(fields) == 3 and fields[0] in remote_ids_set:
+                out[fields[0]] = (_time(fields[1]), _time(fields[2]))
+
+        return out
+
+
+    def array_task_remote_ids(self, remote_id, array_size):
+        return [f'{remote_id}_{task_i}' for task_i in range(1, array_size + 1)]
@@ -0,0 +1,212 @@
+"""Serialization of task inputs and results with pickle protocol 5, writing large buffers
+(e.g. numpy arrays, bytes) out-of-band, each to its own raw file next to the pickle, and
+memory-mapping them when loading, so that large payloads are never held in memory twice.
+
+Buffer files for pickle ``<file>`` are named ``<file>.buf.<i>``, numbered in the order the
+pickler produced them.
+"""
+import os
+import mmap
+
+from pathlib import Path
+from pickle import PickleBuffer
+try:
+    # use dill if available so that things like lambdas can be pickled
+    import dill as pickle
+except:
+    import pickle
+
+from . import compression
+
+
+# The C pickler does not call reducer_override for builtin types like bytes, so use the python
+# implementation (dill's pickler is already derived from it).  The objects where this matters are
+# few and large, so the slower pickler costs little compared to the copies it avoids.
+_Pickler = pickle.Pickler if pickle.__name__ == 'dill' else pickle._Pickler
+
+
+class _OOBPickler(_Pickler):
+    """Pickler that also makes large bytes and bytearray objects out-of-band, which
+    protocol 5 by itself only does for objects (like numpy arrays) that support it
+    """
+    def __init__(self, file, min_size, buffer_callback):
+        super().__init__(file, protocol=5, buffer_callback=buffer_callback)
+        self.min_size = min_size
+
+
+    def reducer_override(self, obj):
+        if type(obj) in (bytes, bytearray) and len(obj) >= self.min_size:
+            return type(obj), (PickleBuffer(obj),)
+        return NotImplemented
+
+
+class _HashWriter:
+    # file-like object that hashes what is written to it instead of storing it
+    def __init__(self, h):
+        self.h = h
+
+    def write(self, data):
+        self.h.update(data)
+        return len(data)
+
+
+def buffer_files(filename):
+    """List out-of-band buffer files of a pickle file
+
+    Parameters
+    ----------
+    filename: str / Path
+        pickle file
+
+    Returns
+    -------
+    list(Path) buffer files, in order
+    """
+    filename = Path(filename)
+    buf_files = []
+    while (filename.parent / f'{filename.name}.buf.{len(buf_files)}').exists():
+        buf_files.append(filename.parent / f'{filename.name}.buf.{len(buf_files)}')
+    return buf_files
+
+
+def dump(obj, filename, min_size):
+    """Pickle object to a file, writing buffers of at least min_size bytes out-of-band
+
+    Parameters
+    ----------
+    obj: object
+        object to pickle
+    filename: str / Path
+        file to write pickle to
+    min_size: int
+        minimum size (bytes) of buffer to write to separate file
+    """
+    filename = Path(filename)
+    buf_i = 0
+
+    def _write_buffer(buf):
+        nonlocal buf_i
+        raw = buf.raw()
+        if raw.nbytes < min_size:
+            return True
+        with open(filename.parent / f'{filename.name}.buf.{buf_i}', 'wb') as fout_buf:
+            fout_buf.write(raw)
+        buf_i += 1
+        return False
+
+    with open(filename, 'wb') as fout:
+        _OOBPickler(fout, min_size, _write_buffer).dump(obj)
+
+
+def hash_update(h, obj, min_size):
+    """Update a hash with the pickle of an object, hashing buffers of at least min_size bytes
+    directly from the object's memory rather than from a copy in the pickle
+
+    Parameters
+    ----------
+    h: hashlib hash
+        hash to update
+    obj: object
+        object to hash
+    min_size: int
+        minimum size (bytes) of buffer to hash directly
+    """
+    def _hash_buffer(buf):
+        raw = buf.raw()
+        if raw.nbytes < min_size:
+            return True
+        h.update(raw)
+        return False
+
+    _OOBPickler(_HashWriter(h), min_size, _hash_buffer).dump(obj)
+
+
+def _map_buffer(buf_file):
+    with open(buf_file, 'rb') as fin:
+        if os.fstat(fin.fileno()).st_size == 0:
+            # cannot mmap empty file
+            return bytearray()
+        # copy-on-write, so that unpickled arrays are writeable without modifying file
+        return mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_COPY)
+
+
+# first pickle in a file that contains a stream of pickle frames, one per item of an iterable result
+FRAMES_HEADER = ('_expyre_result_frames', 1)
+
+
+def _is_frames_header(obj):
+    # careful not to compare arbitrary objects (e.g. numpy arrays) with ==
+    return (type(obj) is tuple and len(obj) == 2 and isinstance(obj[0], str) and isinstance(obj[1], int) and
+            obj == FRAMES_HEADER)
+
+
+class LazyResults:
+    """Handle for results in a pickle file, which are only loaded when requested.  If the file is
+    a stream of pickle frames (written by a job with ``stream_results=True`` whose function returned
+    an iterable), iterating loads one item at a time, so the entire result never needs to be in
+    memory.  Any out-of-band buffers are memory-mapped.
+
+    NOTE: results are read from the stage directory file, so they are no longer available after
+    the job is cleaned.
+
+    Parameters
+    ----------
+    filename: str / Path
+        pickle file, possibly compressed (see ``expyre.compression``)
+    """
+    def __init__(self, filename):
+        self.filename = Path(filename)
+
+
+    def _items(self):
+        # yield (is_frame, obj), either once for a regular pickle, or for each frame of a stream
+        with compression.open_read(self.filename) as fin:
+            # same iterator for all frames, since each pickle consumes only its own buffers
+            buffers = (_map_buffer(buf_file) for buf_file in buffer_files(self.filename))
+            obj = pickle.load(fin, buffers=buffers)
+            if not _is_frames_header(obj):
+                yield False, obj
+                return
+            while True:
+                try:
+                    yield True, pickle.load(fin, buffers=buffers)
+                except EOFError:
+                    return
+
+
+    def __iter__(self):
+        for is_frame, obj in self._items():
+            if is_frame:
+                yield obj
+            else:
+                yield from obj
+
+
+    def load(self):
+        """Load entire results
+
+        Returns
+        -------
+        results: unpickled object, or list of all items if results were written as a stream of frames
+        """
+        frames = []
+        for is_frame, obj in self._items():
+            if not is_frame:
+                return obj
+            frames.append(obj)
+        return frames
+
+
+def load(filename):
+    """Unpickle object from a file, memory-mapping any out-of-band buffer files
+
+    Parameters
+    ----------
+    filename: str / Path
+        pickle file, possibly compressed (see ``expyre.compression``)
+
+    Returns
+    -------
+    obj: unpickled object, or list of items if file is a stream of frames
+    """
+    return LazyResults(filename).load()
@@ -0,0 +1,165 @@
+"""Cache of scheduler status command output (e.g. ``squeue --user $USER``), shared through a file by all
+processes and threads that check jobs on the same host, so that the login node sees one status query per
+time-to-live, rather than one per process (or thread) calling ``get_results``.
+"""
+import os
+import time
+import json
+import fcntl
+
+from pathlib import Path
+from contextlib import contextmanager
+
+
+class StatusCache:
+    """Status command output of one host, stored in a JSON file.  Each entry records when its command was
+    started, and is used for ``ttl`` seconds after that, and dropped by the next write after that.  Submitting
+    a job invalidates all entries, since older output would not list the new job (and so would report it as
+    done).  Schedulers that can list all of a user's jobs use that command when their status is cached, so
+    that processes tracking different jobs share one entry.
+
+    The file is only replaced atomically, so it is read without locking.  Writes, and refreshes that
+    run the status command, hold an exclusive ``fcntl`` lock on a separate lock file, so that concurrent
+    callers wait for one fresh snapshot rather than each running the command.
+
+    Parameters
+    ----------
+    filename: str / Path
+        cache file
+    ttl: float
+        time (in sec) for which output is used
+    """
+    def __init__(self, filename, ttl):
+        self.filename = Path(filename)
+        self.ttl = ttl
+        # counters for this process
+        self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+
+    @contextmanager
+    def _lock(self, blocking=True):
+        # yields whether lock was acquired, which is always True if blocking
+        with open(self.filename.parent / (self.filename.name + '.lock'), 'a') as flock:
+            try:
+                fcntl.flock(flock, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(flock, fcntl.LOCK_UN)
+
+
+    def _read(self):
+        try:
+            with open(self.filename) as fin:
+                return json.load(fin)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {'invalidated': 0.0, 'entries': {}}
+
+
+    def _write(self, data):
+        # only called with lock held, so temporary file name is unique
+        tmp_filename = self.filename.parent / (self.filename.name + '.tmp')
+        with open(tmp_filename, 'w') as fout:
+            json.dump(data, fout)
+        os.replace(tmp_filename, self.filename)
+
+
+    def _prune(self, data):
+        # drop entries that are no longer fresh, so that output of commands that are not repeated
+        # (e.g. for other sets of jobs) does not accumulate
+        now = time.time()
+        data['entries'] = {command: entry for command, entry in data['entries'].items()
+                           if entry['time'] >= data['invalidated'] and now - entry['time'] <= self.ttl}
+
+
+    def _fresh(self, data, command):
+        entry = data['entries'].get(command)
+        if entry is None or entry['time'] < data['invalidated'] or time.time() - entry['time'] > self.ttl:
+            return None
+        return entry['stdout']
+
+
+    def get(self, command):
+        """Cached output of a command, if fresh
+
+        Parameters
+        ----------
+        command: str
+            status command
+
+        Returns
+        -------
+        str stdout of command, or None if there is no fresh output
+        """
+        stdout = self._fresh(self._read(), command)
+        self.stats['hits' if stdout is not None else 'misses'] += 1
+        return stdout
+
+
+    def put(self, command, stdout, start_time):
+        """Store output of a command, unless another process is writing to the cache, or the
+        cache was invalidated after command was started
+
+        Parameters
+        ----------
+        command: str
+            status command
+        stdout: str
+            output of command
+        start_time: float
+            time command was started
+        """
+        with self._lock(blocking=False) as locked:
+            if not locked:
+                return
+            data = self._read()
+            entry = data['entries'].get(command)
+            if start_time < data['invalidated'] or (entry is not None and entry['time'] > start_time):
+                return
+            self._prune(data)
+            data['entries'][command] = {'time': start_time, 'stdout': stdout}
+            self._write(data)
+
+
+    def get_or_run(self, command, run):
+        """Cached output of a command if fresh, otherwise run it (once for all concurrent callers) and cache its output
+
+        Parameters
+        ----------
+        command: str
+            status command
+        run: callable
+            called with no arguments to run command, returning its stdout
+
+        Returns
+        -------
+        str stdout of command
+        """
+        stdout = self._fresh(self._read(), command)
+        if stdout is None:
+            with self._lock():
+                # another caller may have refreshed it while this one waited for lock
+                data = self._read()
+                stdout = self._fresh(data, command)
+                if stdout is None:
+                    start_time = time.time()
+                    stdout = run()
+                    self._prune(data)
+                    data['entries'][command] = {'time': start_time, 'stdout': stdout}
+                    self._write(data)
+                    self.stats['misses'] += 1
+                    return stdout
+
+        self.stats['hits'] += 1
+        return stdout
+
+
+    def invalidate(self):
+        """Discard all cached output, e.g. because a job was just submitted
+        """
+        with self._lock():
+            self._write({'invalidated': time.time(), 'entries': {}})
+        self.stats['invalidations'] += 1
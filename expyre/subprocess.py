@@ -9,6 +9,12 @@ import re
 import warnings
 import time
 import shlex
+import asyncio
+import atexit
+import tempfile
+import threading
+import selectors
+import uuid
 
 from pathlib import Path
 
@@ -29,6 +35,294 @@ def _my_warn(msg):
     warnings.warn(msg, category=FailedSubprocessWarning)
 
 
+class SSHConnectionPool:
+    """Pool of ssh ControlMaster connections, one per configured host, which are reused by all
+    ``subprocess_run`` and ``subprocess_copy`` calls for that host, so that only the first one pays for
+    the full ssh handshake (including any MFA or Kerberos steps).  Each master is started lazily by the
+    first command that needs it, its health is checked (with ``ssh -O check``) at most every
+    ``check_interval`` seconds, and it is restarted if it has died.  If a master dies between checks, or
+    cannot be started, ssh falls back to a separate connection.  Masters started by this process are
+    closed at exit.
+
+    Counters of masters started, total time spent in their handshakes, and number of commands that
+    reused a master are in ``stats[host]``, and ``saved_time(host)`` estimates the handshake time saved.
+    """
+    def __init__(self):
+        self.hosts = {}
+        self.stats = {}
+        self._atexit_registered = False
+
+
+    def configure(self, host, control_dir=None, control_persist=600, check_interval=60):
+        """Enable connection multiplexing for a host
+
+        Parameters
+        ----------
+        host: str
+            [username@]host, as passed to subprocess_run
+        control_dir: str, default None
+            directory for control sockets, default ``expyre-ssh-<uid>`` in system temporary directory
+        control_persist: int or str, default 600
+            ssh ControlPersist, time for idle master to stay alive
+        check_interval: float, default 60
+            time (in sec) between health checks of master
+        """
+        if control_dir is None:
+            control_dir = os.path.join(tempfile.gettempdir(), f'expyre-ssh-{os.getuid()}')
+        control_dir = os.path.expanduser(control_dir)
+
+        if host not in self.hosts:
+            self.hosts[host] = {'last_check': None, 'alive': False, 'remsh_cmd': None, 'lock': threading.Lock()}
+        # %C is hash of connection parameters, short enough for socket path length limit
+        self.hosts[host].update({'control_dir': control_dir, 'control_path': os.path.join(control_dir, '%C'),
+                                 'control_persist': control_persist, 'check_interval': check_interval})
+        self.stats.setdefault(host, {'masters_started': 0, 'handshake_time': 0.0, 'reused': 0})
+
+        if not self._atexit_registered:
+            atexit.register(self.close_all)
+            self._atexit_registered = True
+
+
+    def options(self, host, remsh_cmd):
+        """ssh options to use master connection to host, starting master if needed
+
+        Parameters
+        ----------
+        host: str
+            [username@]host
+        remsh_cmd: list(str)
+            remote shell command
+
+        Returns
+        -------
+        list(str) options, empty if host is not configured
+        """
+        if host not in self.hosts:
+            return []
+
+        settings = self.hosts[host]
+        with settings['lock']:
+            if settings['last_check'] is None or time.time() - settings['last_check'] > settings['check_interval']:
+                settings['alive'] = self._run_control(host, remsh_cmd, 'check') == 0
+                if settings['alive']:
+                    self.stats[host]['reused'] += 1
+                else:
+                    # command does not reuse master even if it is started now
+                    settings['alive'] = self._start(host, remsh_cmd)
+                settings['last_check'] = time.time()
+            elif settings['alive']:
+                # last check (or start) succeeded
+                self.stats[host]['reused'] += 1
+
+        return ['-o', 'ControlPath=' + settings['control_path'], '-o', 'ControlMaster=no']
+
+
+    async def aoptions(self, host, remsh_cmd):
+        """asyncio version of ``options``, which checks or starts master in a thread, so that a
+        full ssh handshake does not block the event loop
+        """
+        if host not in self.hosts:
+            return []
+        return await asyncio.get_running_loop().run_in_executor(None, self.options, host, remsh_cmd)
+
+
+    def _run_control(self, host, remsh_cmd, command):
+        # control command (check, exit) for master
+        return subprocess.run(remsh_cmd + ['-o', 'ControlPath=' + self.hosts[host]['control_path'], '-O', command, host],
+                              stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode
+
+
+    def _start(self, host, remsh_cmd):
+        settings = self.hosts[host]
+        os.makedirs(settings['control_dir'], mode=0o700, exist_ok=True)
+
+        t0 = time.time()
+        # -f backgrounds master after authentication, so output must not be a pipe, otherwise waiting
+        # for its end would wait for master to exit
+        returncode = subprocess.run(remsh_cmd + ['-o', 'ControlMaster=yes', '-o', 'ControlPath=' + settings['control_path'],
+                                                 '-o', f'ControlPersist={settings["control_persist"]}', '-N', '-f', host],
+                                    stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                    stderr=subprocess.DEVNULL).returncode
+        if returncode != 0:
+            _my_warn(f'Failed to start ssh master connection to {host}, using separate connections')
+            return False
+
+        settings['remsh_cmd'] = remsh_cmd
+        self.stats[host]['masters_started'] += 1
+        self.stats[host]['handshake_time'] += time.time() - t0
+        return True
+
+
+    def saved_time(self, host):
+        """Estimate of handshake time saved by reusing master connections to host
+
+        Parameters
+        ----------
+        host: str
+            [username@]host
+
+        Returns
+        -------
+        float time in seconds: number of reuses times mean handshake time
+        """
+        stats = self.stats[host]
+        if stats['masters_started'] == 0:
+            return 0.0
+        return stats['reused'] * stats['handshake_time'] / stats['masters_started']
+
+
+    def close(self, host):
+        """Close master connection to host, if started by this process
+
+        Parameters
+        ----------
+        host: str
+            [username@]host
+        """
+        settings = self.hosts[host]
+        with settings['lock']:
+            if settings['remsh_cmd'] is not None:
+                self._run_control(host, settings['remsh_cmd'], 'exit')
+                settings['remsh_cmd'] = None
+            settings['last_check'] = None
+            settings['alive'] = False
+
+
+    def close_all(self):
+        """Close all master connections started by this process"""
+        for host in self.hosts:
+            if 'EXPYRE_TIMING_VERBOSE' in os.environ and self.stats[host]['masters_started'] > 0:
+                sys.stderr.write(f'ssh connection pool {host} {self.stats[host]} saved {self.saved_time(host):.1f} s\n')
+            self.close(host)
+
+
+ssh_pool = SSHConnectionPool()
+
+
+class RemoteSession:
+    """Long-lived remote shell on a host, i.e. one ``ssh host bash`` process, which runs commands
+    written to its stdin one at a time, so that each command costs neither an ssh process (and
+    handshake) nor a remote login shell.  Each command is followed by printing a unique sentinel
+    line, with the exit status, to stdout and to stderr, which delimits the command's output.  If
+    the session process dies, it is restarted by the next command.
+
+    Parameters
+    ----------
+    host: str
+        [username@]host
+    remsh_cmd: str, list(str), default EXPYRE_RSH env var or 'ssh'
+        remote shell command
+    """
+    def __init__(self, host, remsh_cmd=None):
+        self.host = host
+        self.remsh_cmd = remsh_cmd
+        self.n_started = 0
+        self.n_commands = 0
+        self._proc = None
+        self._lock = threading.Lock()
+
+
+    def _start(self):
+        remsh_cmd = self.remsh_cmd
+        if remsh_cmd is None:
+            remsh_cmd = os.environ.get('EXPYRE_RSH', 'ssh')
+        if isinstance(remsh_cmd, str):
+            remsh_cmd = remsh_cmd.split()
+
+        self._proc = subprocess.Popen(remsh_cmd + ssh_pool.options(self.host, remsh_cmd) + [self.host, 'bash'],
+                                      stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                      env=os.environ)
+        self.n_started += 1
+
+
+    def run(self, command, script=None):
+        """Run a command in the session
+
+        Parameters
+        ----------
+        command: str
+            command line, as would be passed to ``ssh host``
+        script: bytes, default None
+            standard input of command
+
+        Returns
+        -------
+        returncode: int, stdout: bytes, stderr: bytes
+        """
+        sentinel = f'_EXPYRE_SESSION_{uuid.uuid4().hex}'
+        if script is not None:
+            # stdin as here document, which has to end with newline
+            if not script.endswith(b'\n'):
+                script += b'\n'
+            text = command.encode() + f" <<'{sentinel}'\n".encode() + script + f'{sentinel}\n'.encode()
+        else:
+            text = command.encode() + b' < /dev/null\n'
+        # newline before sentinels in case output does not end in one, removed when parsing
+        text += f"printf '\\n{sentinel} %d\\n' $?; printf '\\n{sentinel}\\n' >&2\n".encode()
+
+        with self._lock:
+            if self._proc is None or self._proc.poll() is not None:
+                self._start()
+            try:
+                self._proc.stdin.write(text)
+                self._proc.stdin.flush()
+                stdout, stderr = self._read_until(sentinel.encode())
+            except Exception:
+                self.close()
+                raise
+            self.n_commands += 1
+
+        stdout, returncode = stdout.rsplit(b'\n' + sentinel.encode() + b' ', 1)
+        stderr = stderr[:-len(b'\n' + sentinel.encode() + b'\n')]
+        return int(returncode), stdout, stderr
+
+
+    def _read_until(self, sentinel):
+        # read stdout and stderr at the same time, so that neither pipe fills up, until each ends with its sentinel
+        stdout, stderr = b'', b''
+        out_end = re.compile(b'\n' + sentinel + b' -?[0-9]+\n$')
+        err_end = b'\n' + sentinel + b'\n'
+        with selectors.DefaultSelector() as sel:
+            sel.register(self._proc.stdout, selectors.EVENT_READ)
+            sel.register(self._proc.stderr, selectors.EVENT_READ)
+            while not (out_end.search(stdout[-len(sentinel) - 32:]) and stderr.endswith(err_end)):
+                for key, _ in sel.select():
+                    data = os.read(key.fileobj.fileno(), 65536)
+                    if len(data) == 0:
+                        raise RuntimeError(f'Remote session to {self.host} closed unexpectedly')
+                    if key.fileobj is self._proc.stdout:
+                        stdout += data
+                    else:
+                        stderr += data
+
+        return stdout[:-1], stderr
+
+
+    def close(self):
+        """Close the session, if it is running"""
+        if self._proc is not None:
+            if self._proc.poll() is None:
+                try:
+                    self._proc.stdin.close()
+                    self._proc.wait(timeout=10)
+                except Exception:
+                    self._proc.kill()
+                    self._proc.wait()
+            self._proc = None
+
+
+# remote sessions used by subprocess_run for each host
+remote_sessions = {}
+
+
+def _close_remote_sessions():
+    for session in remote_sessions.values():
+        session.close()
+
+
+atexit.register(_close_remote_sessions)
+
+
 def _optionally_remote_args(args, shell, host, remsh_cmd, in_dir='_HOME_'):
     """Convert args array into a shell call, optionally preceded by an ssh command
 
@@ -81,7 +375,97 @@ def _optionally_remote_args(args, shell, host, remsh_cmd, in_dir='_HOME_'):
     return args
 
 
-def subprocess_run(host, args, script=None, shell='bash -c', remsh_cmd=None, retry=None, in_dir='_HOME_', dry_run=False, verbose=False):
+def _remsh_cmd_list(remsh_cmd):
+    # remote shell command as list, default from EXPYRE_RSH env var
+    if remsh_cmd is None:
+        remsh_cmd = os.environ.get('EXPYRE_RSH', 'ssh')
+    if isinstance(remsh_cmd, str):
+        remsh_cmd = remsh_cmd.split()
+    return remsh_cmd
+
+
+def _prepare_run(host, args, script, shell, remsh_cmd, retry, in_dir, dry_run, verbose, pool_options=None,
+                 use_session=True):
+    # fill in defaults and make args for subprocess_run and asubprocess_run, and command
+    # to run in remote session instead, if host has one and use_session.  pool_options are options from
+    # ssh_pool, if already obtained (by asubprocess_run)
+    session_command = None
+    if use_session and host in remote_sessions:
+        # same as what ssh would pass to remote shell
+        session_args = _optionally_remote_args(args, shell, None, None, in_dir)
+        session_command = ' '.join(session_args[0:-1] + ["'" + session_args[-1] + "'"])
+    remsh_cmd = _remsh_cmd_list(remsh_cmd)
+    if host is not None and not dry_run and session_command is None:
+        # reuse master connection, if multiplexing is enabled for host
+        if pool_options is None:
+            pool_options = ssh_pool.options(host, remsh_cmd)
+        remsh_cmd = remsh_cmd + pool_options
+    if retry is None:
+        if 'EXPYRE_RETRY' in os.environ:
+            retry = tuple([int(_ii) for _ii in os.environ['EXPYRE_RETRY'].strip().split()])
+        else:
+            retry = (3, 5)
+
+    # always run at least once, and wait a valid (>= 0) amount of time
+    retry = (max(retry[0], 1), max(retry[1], 0))
+
+    args = _optionally_remote_args(args, shell, host, remsh_cmd, in_dir)
+
+    if verbose:
+        if dry_run:
+            print('DRY-RUN COMMAND:')
+        else:
+            print('RUNNING COMMAND:')
+        print(' '.join([shlex.quote(arg) for arg in args]))
+        if script is not None:
+            print('SCRIPT:')
+            print(script.rstrip())
+
+    if script is not None:
+        script = script.encode()
+
+    return args, script, retry, session_command
+
+
+def _run_streaming_stdin(args, script, stdin_args):
+    # run args with script and then output of local command stdin_args as its standard input.
+    # Output goes to temporary files, so that it cannot fill a pipe and block the process while
+    # its input is still being written
+    with tempfile.TemporaryFile() as fout, tempfile.TemporaryFile() as ferr:
+        p = subprocess.Popen(args, stdout=fout, stderr=ferr, stdin=subprocess.PIPE, close_fds=False, env=os.environ)
+        src_returncode = None
+        src_stderr = b''
+        try:
+            if script is not None:
+                p.stdin.write(script)
+                p.stdin.flush()
+            src = subprocess.Popen(stdin_args, stdout=p.stdin, stderr=subprocess.PIPE)
+            _, src_stderr = src.communicate()
+            src_returncode = src.returncode
+        except BrokenPipeError:
+            # process exited before reading all of its input, returncode will say why
+            pass
+        finally:
+            try:
+                p.stdin.close()
+            except BrokenPipeError:
+                pass
+        returncode = p.wait()
+
+        fout.seek(0)
+        ferr.seek(0)
+        stdout = fout.read()
+        stderr = ferr.read()
+
+    if returncode == 0 and src_returncode != 0:
+        returncode = src_returncode if src_returncode is not None else 1
+        stderr += f'Failed to run input command "{" ".join(stdin_args)}"\n'.encode() + src_stderr
+
+    return returncode, stdout, stderr
+
+
+def subprocess_run(host, args, script=None, shell='bash -c', remsh_cmd=None, retry=None, in_dir='_HOME_', dry_run=False,
+                   stdin_args=None, verbose=False):
     """run a subprocess, optionally via ssh on a remote machine.  Raises RuntimeError for non-zero
     return status.
 
@@ -102,6 +486,9 @@ def subprocess_run(host, args, script=None, shell='bash -c', remsh_cmd=None, ret
         number of times to retry and number of seconds to wait between each trial
     in_dir: str, default _HOME_
         directory to cd into before running args, _HOME_ for home dir, _PWD_ for python current working directory (only for host == None)
+    stdin_args: list(str), default None
+        local command whose output is streamed to process's standard input after script, e.g. to send
+        a tar archive without holding it in memory.  Host's remote session, if any, is not used.
     verbose: bool, default False
         verbose output
 
@@ -109,42 +496,79 @@ def subprocess_run(host, args, script=None, shell='bash -c', remsh_cmd=None, ret
     -------
     stdout, stderr: output and error of subprocess, as strings (bytes.decode())
     """
-    if remsh_cmd is None:
-        remsh_cmd = os.environ.get('EXPYRE_RSH', 'ssh')
-    if retry is None:
-        if 'EXPYRE_RETRY' in os.environ:
-            retry = tuple([int(_ii) for _ii in os.environ['EXPYRE_RETRY'].strip().split()])
-        else:
-            retry = (3, 5)
+    args, script, retry, session_command = _prepare_run(host, args, script, shell, remsh_cmd, retry, in_dir, dry_run, verbose,
+                                                        use_session=stdin_args is None)
 
-    # always run at least once, and wait a valid (>= 0) amount of time
-    retry = (max(retry[0], 1), max(retry[1], 0))
+    if dry_run:
+        return args, script
 
-    args = _optionally_remote_args(args, shell, host, remsh_cmd, in_dir)
+    for i_try in range(retry[0]):
+        stderr = b''
+        try:
+            if session_command is not None:
+                returncode, stdout, stderr = remote_sessions[host].run(session_command, script)
+            elif stdin_args is not None:
+                returncode, stdout, stderr = _run_streaming_stdin(args, script, stdin_args)
+            else:
+                p = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.PIPE,
+                                     close_fds=False, env=os.environ)
+                stdout, stderr = p.communicate(script)
+                returncode = p.returncode
+
+            if returncode != 0:
+                raise RuntimeError(f'Failed to run command "{" ".join(args)}" with err {stderr.decode()}')
+
+            # success
+            if i_try > 0:
+                _my_warn(f'Succeeded to run "{" ".join(args)}" on attempt {i_try} after failure(s), trying again')
+            break
+        except Exception:
+            if i_try == retry[0]-1:
+                # last try
+                _my_warn(f'Failed to run "{" ".join(args)}" on attempt {i_try} for the last time, giving up.\nSTDERR\n{stderr.decode()}')
+
+                # failed last chance
+                raise
+            _my_warn(f'Failed to run "{" ".join(args)}" on attempt {i_try}, trying again.\nSTDERR\n{stderr.decode()}')
+
+        time.sleep(retry[1])
 
     if verbose:
-        if dry_run:
-            print('DRY-RUN COMMAND:')
-        else:
-            print('RUNNING COMMAND:')
-        print(' '.join([shlex.quote(arg) for arg in args]))
-        if script is not None:
-            print('SCRIPT:')
-            print(script.rstrip())
+        print('GOT STDOUT:')
+        print(stdout.decode())
+        print('GOT STDERR:')
+        print(stderr.decode())
 
-    if script is not None:
-        script = script.encode()
+    return stdout.decode(), stderr.decode()
+
+
+async def asubprocess_run(host, args, script=None, shell='bash -c', remsh_cmd=None, retry=None, in_dir='_HOME_', dry_run=False, verbose=False):
+    """asyncio version of ``subprocess_run``, with the same arguments and return values, which waits for
+    the subprocess (and between retries) without blocking the event loop
+    """
+    pool_options = None
+    if host is not None and not dry_run and host not in remote_sessions:
+        pool_options = await ssh_pool.aoptions(host, _remsh_cmd_list(remsh_cmd))
+    args, script, retry, session_command = _prepare_run(host, args, script, shell, remsh_cmd, retry, in_dir, dry_run, verbose,
+                                                        pool_options=pool_options)
 
     if dry_run:
         return args, script
 
     for i_try in range(retry[0]):
+        stderr = b''
         try:
-            p = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.PIPE,
-                                 close_fds=False, env=os.environ)
-            stdout, stderr = p.communicate(script)
-
-            if p.returncode != 0:
+            if session_command is not None:
+                # session is synchronous, but commands are fast
+                returncode, stdout, stderr = await asyncio.get_running_loop().run_in_executor(
+                    None, remote_sessions[host].run, session_command, script)
+            else:
+                p = await asyncio.create_subprocess_exec(*args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+                                                         stdin=asyncio.subprocess.PIPE, close_fds=False, env=os.environ)
+                stdout, stderr = await p.communicate(script)
+                returncode = p.returncode
+
+            if returncode != 0:
                 raise RuntimeError(f'Failed to run command "{" ".join(args)}" with err {stderr.decode()}')
 
             # success
@@ -160,7 +584,7 @@ def subprocess_run(host, args, script=None, shell='bash -c', remsh_cmd=None, ret
                 raise
             _my_warn(f'Failed to run "{" ".join(args)}" on attempt {i_try}, trying again.\nSTDERR\n{stderr.decode()}')
 
-        time.sleep(retry[1])
+        await asyncio.sleep(retry[1])
 
     if verbose:
         print('GOT STDOUT:')
@@ -210,16 +634,51 @@ def subprocess_copy(from_files, to_file, from_host='_LOCAL_', to_host='_LOCAL_',
     dry_run: bool, default False
         dry run, don't actually copy
     """
+    # do copy (or dry run)
+    retval = subprocess_run(None, _copy_args(from_files, to_file, from_host, to_host, rcp_args, rcp_cmd, remsh_cmd,
+                                             remsh_flags, delete, dry_run),
+                            retry=retry, in_dir='_PWD_', dry_run=dry_run, verbose=verbose)
+    if dry_run:
+        return retval
+
+
+async def asubprocess_copy(from_files, to_file, from_host='_LOCAL_', to_host='_LOCAL_',
+                           rcp_args='-a', rcp_cmd='rsync', remsh_cmd=None, retry=None, remsh_flags='-e',
+                           delete=False, verbose=False, dry_run=False):
+    """asyncio version of ``subprocess_copy``, with the same arguments
+    """
+    remote_host = from_host if from_host != '_LOCAL_' else to_host
+    pool_options = None
+    if remote_host is not None and not dry_run:
+        pool_options = await ssh_pool.aoptions(remote_host, _remsh_cmd_list(remsh_cmd))
+    retval = await asubprocess_run(None, _copy_args(from_files, to_file, from_host, to_host, rcp_args, rcp_cmd, remsh_cmd,
+                                                    remsh_flags, delete, dry_run, pool_options=pool_options),
+                                   retry=retry, in_dir='_PWD_', dry_run=dry_run, verbose=verbose)
+    if dry_run:
+        return retval
+
+
+def _copy_args(from_files, to_file, from_host, to_host, rcp_args, rcp_cmd, remsh_cmd, remsh_flags, delete, dry_run,
+               pool_options=None):
+    # args for subprocess_copy and asubprocess_copy to run, pool_options as in _prepare_run
+
     # exactly one of from_host, to_host must be provided
     if from_host != '_LOCAL_' and to_host != '_LOCAL_':
         raise RuntimeError(f'Cannot have remote machine for both of source host "{from_host}" and "{to_host}"')
 
     if remsh_cmd is None:
         remsh_cmd = os.environ.get('EXPYRE_RSH', 'ssh')
-    rcp_args = remsh_flags + ' ' + remsh_cmd + ' ' + rcp_args
+    remote_host = from_host if from_host != '_LOCAL_' else to_host
+    if remote_host is not None and not dry_run:
+        # reuse master connection, if multiplexing is enabled for host
+        if pool_options is None:
+            pool_options = ssh_pool.options(remote_host, remsh_cmd.split())
+        remsh_cmd = ' '.join([remsh_cmd] + pool_options)
+    # remote shell command is a single argument, even if it contains spaces
+    rcp_args = [remsh_flags, remsh_cmd] + rcp_args.split()
 
     if delete:
-        rcp_args += ' --delete'
+        rcp_args += ['--delete']
 
     # make from_files plain str or Path into list
     if isinstance(from_files, str) or isinstance(from_files, Path):
@@ -257,7 +716,4 @@ def subprocess_copy(from_files, to_file, from_host='_LOCAL_', to_host='_LOCAL_',
     abs_from_files = [from_host + str(f) for f in abs_from_files]
     abs_to_file = to_host + str(abs_to_file)
 
-    # do copy (or dry run)
-    retval = subprocess_run(None, [rcp_cmd] + rcp_args.split() + abs_from_files + [abs_to_file], retry=retry, in_dir='_PWD_', dry_run=dry_run, verbose=verbose)
-    if dry_run:
-        return retval
+    return [rcp_cmd] + rcp_args + abs_from_files + [abs_to_file]
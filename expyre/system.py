@@ -2,12 +2,44 @@ import sys
 import os
 from pathlib import Path
 import time
+import re
+import tempfile
+import threading
 
-from .subprocess import subprocess_run, subprocess_copy
+from contextlib import contextmanager
+
+from .subprocess import (_optionally_remote_args, subprocess_run, subprocess_copy, asubprocess_copy, ssh_pool,
+                         RemoteSession, remote_sessions)
 from .schedulers import schedulers
+from .blobstore import BlobStore
+from .compression import codecs
+from .polling import make_policy
+from .statuscache import StatusCache
 from . import util
 
 
+# semaphores limiting concurrent remote copies from each host, shared by all systems on the same host
+_host_copy_slots = {}
+_host_copy_slots_lock = threading.Lock()
+
+
+class SubmitManyError(RuntimeError):
+    """Some jobs of a ``System.submit_many`` batch failed to submit, while others were submitted
+
+    Attributes
+    ----------
+    remote_ids: list(str / None)
+        remote id of each job in batch, None for jobs that failed
+    errors: dict
+        error message (scheduler's stdout and stderr) of each job id that failed
+    """
+    def __init__(self, remote_ids, errors):
+        self.remote_ids = remote_ids
+        self.errors = errors
+        super().__init__(f'Failed to submit {len(errors)} of {len(remote_ids)} jobs: ' +
+                         '; '.join([f'{id}: {err}' for id, err in errors.items()]))
+
+
 class System:
     """Interface for a System that can run jobs remotely, including staging files from
     a local directory to a (config-specified) remote directory, submitting it with the correct
@@ -42,9 +74,52 @@ class System:
         extra string to add to remote_rundir, e.g. per-project part of path
     remsh_cmd: str, default EXPYRE_RSH or 'ssh'
         remote shell command to use with this system
+    blob_store: bool, default False
+        use a remote content-addressed store (in ``_expyre_blobs`` under rundir, shared by all projects)
+        for files that were hardlinked from the local blob store into stage dirs, so each distinct
+        file is uploaded to the system only once, and hardlinked (``ln``) into each job's remote rundir
+    compression: str, default None
+        codec (see ``expyre.compression``) to compress task, result, and exception pickles with,
+        or None for no compression
+    max_array_size: int, default 1000
+        max number of tasks in each array job submitted by ``submit_array``, e.g. to stay within
+        scheduler's limits (such as slurm MaxArraySize)
+    polling: dict, default None
+        policy for intervals between checks of job completion, passed to ``polling.make_policy``,
+        default fixed 30 s interval
+    ssh_multiplex: bool or dict, default False
+        reuse one ssh master connection to host for all commands and copies (see
+        ``subprocess.SSHConnectionPool``), with dict passed to ``SSHConnectionPool.configure``
+    remote_session: bool, default False
+        run all remote commands (but not copies) for host in one long-lived remote shell
+        (see ``subprocess.RemoteSession``)
+    tar_submit: bool, default False
+        submit each job (from ``submit``) with one remote command, which creates its remote rundir,
+        unpacks its stage dir from a tar archive sent with the command, writes the job script and submits it,
+        instead of separate commands for each of these steps.  Jobs with input files in the blob store
+        are staged out normally.
+    status_cache_ttl: float, default None
+        time (in sec) for which output of scheduler status command is shared by all processes and threads
+        checking jobs on this host (see ``statuscache.StatusCache``), None to run it for every check
+    status_cache_dir: str / Path, default None
+        directory for status cache file, required if status_cache_ttl is not None.  Set to local stage dir
+        by ``config.init``
+    two_phase_sync: bool, default False
+        when syncing results, first get only the small marker files of all ongoing jobs, and then all
+        files only of jobs that have finished, rather than all files of every ongoing job
+    sync_only_outputs: bool, default False
+        with two_phase_sync, get only the files needed for results (results, exception, and error files,
+        stdout and stderr, and output_files of each job) of finished jobs, rather than all of their files
+    max_concurrent_copies: int, default 4
+        max number of remote copies from host that may run at the same time (in different threads), when
+        results of many jobs are synced concurrently.  If several systems use the same host, the limit of the
+        first one to copy applies to all of them.
     """
     def __init__(self, host, partitions, scheduler, header=[], no_default_header=False, script_exec='/bin/bash',
-                 pre_submit_cmds=[], commands=[], rundir=None, rundir_extra=None, remsh_cmd=None):
+                 pre_submit_cmds=[], commands=[], rundir=None, rundir_extra=None, remsh_cmd=None, blob_store=False,
+                 compression=None, max_array_size=1000, polling=None, ssh_multiplex=False,
+                 remote_session=False, tar_submit=False, status_cache_ttl=None, status_cache_dir=None,
+                 two_phase_sync=False, sync_only_outputs=False, max_concurrent_copies=4):
         self.host = host
 
         self.remote_rundir = rundir
@@ -59,6 +134,10 @@ class System:
         if self.remote_rundir is not None:
             while self.remote_rundir.endswith('/'):
                 self.remote_rundir = self.remote_rundir[:-1]
+        if blob_store and self.remote_rundir is not None:
+            self.remote_blob_dir = self.remote_rundir + '/_expyre_blobs'
+        else:
+            self.remote_blob_dir = None
         if rundir_extra is not None and self.remote_rundir is not None:
             self.remote_rundir += '/' + rundir_extra
         self.partitions = partitions.copy() if partitions is not None else partitions
@@ -68,25 +147,43 @@ class System:
         self.pre_submit_cmds = pre_submit_cmds
         self.commands = commands.copy()
         self.remsh_cmd = util.remsh_cmd(remsh_cmd)
+        if ssh_multiplex and self.host is not None:
+            ssh_pool.configure(self.host, **(ssh_multiplex if isinstance(ssh_multiplex, dict) else {}))
+        if remote_session and self.host is not None and self.host not in remote_sessions:
+            remote_sessions[self.host] = RemoteSession(self.host, self.remsh_cmd)
+        if compression is not None and compression not in codecs:
+            raise ValueError(f'Unknown compression codec {compression}, not one of {list(codecs)}')
+        self.compression = compression
+        self.max_array_size = max_array_size
+        self.tar_submit = tar_submit
+        self.two_phase_sync = two_phase_sync
+        self.sync_only_outputs = sync_only_outputs
+        self.max_concurrent_copies = max_concurrent_copies
+        self.polling = make_policy(polling)
         self.initialized = False
 
         if isinstance(scheduler, str):
             self.scheduler = schedulers[scheduler](host, self.remsh_cmd)
         else:
             self.scheduler = scheduler(host)
+        if status_cache_ttl is not None:
+            self.scheduler.status_cache = StatusCache(Path(status_cache_dir) / f'_expyre_status_cache_{host}.json',
+                                                      status_cache_ttl)
 
 
-    def run(self, args, script=None, shell='bash -c', retry=None, in_dir='_HOME_', dry_run=False, verbose=False):
+    def run(self, args, script=None, shell='bash -c', retry=None, in_dir='_HOME_', dry_run=False, stdin_args=None,
+            verbose=False):
         # like subprocess_run, but filling in host and remsh command from self
         return subprocess_run(self.host, args, script=script, shell=shell, remsh_cmd=self.remsh_cmd,
-                              retry=retry, in_dir=in_dir, dry_run=dry_run, verbose=verbose)
+                              retry=retry, in_dir=in_dir, dry_run=dry_run, stdin_args=stdin_args, verbose=verbose)
 
 
     def initialize_remote_rundir(self, verbose=False):
         if self.initialized or self.remote_rundir is None:
             return
 
-        self.run(['mkdir', '-p', str(self.remote_rundir)], verbose=verbose)
+        self.run(['mkdir', '-p', str(self.remote_rundir)] +
+                 ([str(self.remote_blob_dir)] if self.remote_blob_dir is not None else []), verbose=verbose)
         self.initialized = True
 
 
@@ -94,6 +191,94 @@ class System:
         return f'{self.remote_rundir}/{stage_dir.name}'
 
 
+    def _stage_out(self, stage_dirs, extra_remote_dirs=[], verbose=False):
+        """Create remote job rundirs, failing if any of them already exists, and copy
+        stage dirs into them.  Files that were hardlinked from the local blob store are uploaded
+        to the remote blob store only if they are not already there, and hardlinked from it.
+
+        Parameters
+        ----------
+        stage_dirs: list(Path)
+            local stage directories
+        extra_remote_dirs: list(str), default []
+            other remote directories to create (if they do not exist) at the same time
+        verbose: bool, default False
+            verbose output
+        """
+        job_remote_rundirs = [self._job_remote_rundir(stage_dir) for stage_dir in stage_dirs]
+
+        # blobs to upload, grouped by local store, and remote links to create
+        blobs = {}
+        links = []
+        if self.remote_blob_dir is not None:
+            for stage_dir, job_remote_rundir in zip(stage_dirs, job_remote_rundirs):
+                blobs_manifest = BlobStore.read_manifest(stage_dir)
+                if blobs_manifest is None:
+                    continue
+                for rel_file, digest in blobs_manifest['files'].items():
+                    blobs.setdefault(blobs_manifest['store'], set()).add(digest)
+                    links.append((digest, f'{job_remote_rundir}/{rel_file}'))
+
+        for store, digests in blobs.items():
+            subprocess_copy([str(Path(store) / digest) for digest in sorted(digests)], self.remote_blob_dir,
+                            to_host=self.host, rcp_args='-a --ignore-existing', remsh_cmd=self.remsh_cmd, verbose=verbose)
+
+        # make remote rundir, but fail if job-specific remote dir already exists
+        script = (f'if [ ! -d "{self.remote_rundir}" ]; then\n'
+                  f'    echo "remote rundir \'{self.remote_rundir}\' does not exist" 1>&2\n'
+                   '    exit 1\n'
+                   'fi\n')
+        for job_remote_rundir in job_remote_rundirs:
+            script += (f'if [ -e "{job_remote_rundir}" ]; then\n'
+                       f'    echo "remote job rundir \'{job_remote_rundir}\' already exists" 1>&2\n'
+                        '    exit 2\n'
+                        'fi\n')
+        script += ''.join([f'mkdir -p "{job_remote_rundir}"\n' for job_remote_rundir in job_remote_rundirs + extra_remote_dirs])
+        # failure to link is not fatal, since rsync below will then copy file
+        for digest, remote_file in links:
+            script += (f'mkdir -p "$(dirname "{remote_file}")" && '
+                       f'ln -f "{self.remote_blob_dir}/{digest}" "{remote_file}" 2> /dev/null\n')
+        script += 'exit 0\n'
+        self.run(['bash'], script=script, verbose=verbose)
+
+        # stage out files
+        # strip out final / from source path so that rsync creates stage_dir.name remotely under self.remote_rundir
+        stage_dir_srcs = []
+        for stage_dir in stage_dirs:
+            stage_dir_src = str(stage_dir)
+            while stage_dir_src.endswith('/'):
+                stage_dir_src = stage_dir_src[:-1]
+            stage_dir_srcs.append(stage_dir_src)
+        if 'EXPYRE_TIMING_VERBOSE' in os.environ:
+            sys.stderr.write(f'system {self.host} submit start stage in {time.time()}\n')
+        # job rundirs were just created, so any existing files are linked blobs that need not be copied
+        subprocess_copy(stage_dir_srcs, self.remote_rundir, to_host=self.host,
+                        rcp_args='-a --ignore-existing' if len(links) > 0 else '-a',
+                        remsh_cmd=self.remsh_cmd, verbose=verbose)
+
+        return job_remote_rundirs
+
+
+    def _invalidate_status_cache(self):
+        # cached status output from before a submission does not list the new job, and would report it as done
+        if self.scheduler.status_cache is not None:
+            self.scheduler.status_cache.invalidate()
+
+
+    def _find_partition(self, resources, header_extra, exact_fit, partial_node):
+        # returns scheduler partition name, node_dict, and header_extra with partition-specific header
+        partition, node_dict = resources.find_nodes(self.partitions, exact_fit=exact_fit,
+                                                    partial_node=partial_node)
+        # add partition-specific header after per-system header but before header specific
+        # to this submission
+        header_extra = self.partitions[partition].get("header", []) + header_extra
+        # override default partition name from dict key (but after using dict key to look up
+        # other things like header above)
+        actual_partition = self.partitions[partition].get("partition", partition)
+
+        return actual_partition, node_dict, header_extra
+
+
     def submit(self, id, stage_dir, resources, commands, header_extra=[], exact_fit=True, partial_node=False, verbose=False):
         """Submit a job on a remote machine, including staging out files
 
@@ -119,17 +304,10 @@ class System:
         id of job on remote machine
         """
         if 'EXPYRE_TIMING_VERBOSE' in os.environ:
-            sys.stderr.write(f'system {self.id} submit start {time.time()}\n')
+            sys.stderr.write(f'system {self.host} submit start {time.time()}\n')
         self.initialize_remote_rundir()
 
-        partition, node_dict = resources.find_nodes(self.partitions, exact_fit=exact_fit,
-                                                    partial_node=partial_node)
-        # add partition-specific header after per-system header but before header specific
-        # to this submission
-        header_extra = self.partitions[partition].get("header", []) + header_extra
-        # override default partition name from dict key (but after using dict key to look up
-        # other things like header above)
-        actual_partition = self.partitions[partition].get("partition", partition)
+        actual_partition, node_dict, header_extra = self._find_partition(resources, header_extra, exact_fit, partial_node)
 
         commands = self.commands + commands
 
@@ -137,34 +315,19 @@ class System:
         if self.remote_rundir is None:
             # no host, so run in stage dir to avoid needless copying
             job_remote_rundir = str(stage_dir)
-        else:
-            job_remote_rundir = self._job_remote_rundir(stage_dir)
-
-            # make remote rundir, but fail if job-specific remote dir already exists
-            self.run(['bash'],
-                     script=f'if [ ! -d "{self.remote_rundir}" ]; then '
-                            f'    echo "remote rundir \'{self.remote_rundir}\' does not exist" 1>&2; '
-                             '    exit 1; '
-                            f'elif [ -e "{job_remote_rundir}" ]; then '
-                            f'    echo "remote job rundir \'{job_remote_rundir}\' already exists" 1>&2; '
-                             '    exit 2; '
-                             'else '
-                            f'    mkdir -p "{job_remote_rundir}"; '
-                             'fi', verbose=verbose)
-
-            # stage out files
-            # strip out final / from source path so that rsync creates stage_dir.name remotely under self.remote_rundir
-            stage_dir_src = str(stage_dir)
-            while stage_dir_src.endswith('/'):
-                stage_dir_src = stage_dir_src[:-1]
+        elif self.tar_submit and BlobStore.read_manifest(stage_dir) is None:
+            r = self._submit_tar(id, stage_dir, actual_partition, commands, resources.max_time,
+                                 self.queuing_sys_header + header_extra, node_dict, verbose=verbose)
+            self._invalidate_status_cache()
             if 'EXPYRE_TIMING_VERBOSE' in os.environ:
-                sys.stderr.write(f'system {self.id} submit start stage in {time.time()}\n')
-            subprocess_copy(stage_dir_src, self.remote_rundir, to_host=self.host,
-                            remsh_cmd=self.remsh_cmd, verbose=verbose)
+                sys.stderr.write(f'system {self.host} submit end {time.time()}\n')
+            return r
+        else:
+            job_remote_rundir = self._stage_out([stage_dir], verbose=verbose)[0]
 
         # submit job
         if 'EXPYRE_TIMING_VERBOSE' in os.environ:
-            sys.stderr.write(f'system {self.id} submit start scheduler submit {time.time()}\n')
+            sys.stderr.write(f'system {self.host} submit start scheduler submit {time.time()}\n')
         try:
             r = self.scheduler.submit(id, str(job_remote_rundir), actual_partition,
                                       commands, resources.max_time, self.queuing_sys_header + header_extra,
@@ -176,13 +339,339 @@ class System:
                                  f'cleaning up remote dir {str(self.remote_rundir)}\n')
                 self.run(['rm', '-r', str(job_remote_rundir)], verbose=verbose)
             raise
+        self._invalidate_status_cache()
 
         if 'EXPYRE_TIMING_VERBOSE' in os.environ:
-            sys.stderr.write(f'system {self.id} submit end {time.time()}\n')
+            sys.stderr.write(f'system {self.host} submit end {time.time()}\n')
         return r
 
 
-    def get_remotes(self, local_dir, subdir_glob=None, delete=False, verbose=False):
+    def _submit_tar(self, id, stage_dir, partition, commands, max_time, header, node_dict, verbose=False):
+        """Submit a job with a single remote command, which checks for and creates job remote rundir,
+        unpacks stage dir into it from a tar archive streamed after the command's script, writes the
+        job script, and submits it, cleaning up the job remote rundir if anything fails
+
+        Returns
+        -------
+        id of job on remote machine
+        """
+        job_remote_rundir = self._job_remote_rundir(stage_dir)
+
+        job_script = self.scheduler.job_script(id, job_remote_rundir, partition, commands, max_time, header, node_dict,
+                                               no_default_header=self.no_default_header, script_exec=self.script_exec)
+
+        script = (self._tar_stage_out_script([stage_dir]) +
+                  self._write_job_script_script(job_remote_rundir, job_script) +
+                  # subshell, since submit command changes dir
+                  f'( {self._submit_cmd(job_remote_rundir)} ) || {{ rm -rf "{job_remote_rundir}"; exit 4; }}\n')
+
+        stdout, stderr = self._run_tar(script, [stage_dir], verbose=verbose)
+
+        return self.scheduler.parse_submit_output(stdout)
+
+
+    def _tar_stage_out_script(self, stage_dirs):
+        # bash script that checks that remote rundir exists and job remote rundirs do not, and unpacks
+        # stage dirs into it from a gzipped tar archive read from standard input (see _run_tar)
+        job_remote_rundirs = [self._job_remote_rundir(stage_dir) for stage_dir in stage_dirs]
+
+        script = (f'if [ ! -d "{self.remote_rundir}" ]; then\n'
+                  f'    echo "remote rundir \'{self.remote_rundir}\' does not exist" 1>&2\n'
+                   '    exit 1\n'
+                   'fi\n')
+        for job_remote_rundir in job_remote_rundirs:
+            script += (f'if [ -e "{job_remote_rundir}" ]; then\n'
+                       f'    echo "remote job rundir \'{job_remote_rundir}\' already exists" 1>&2\n'
+                        '    exit 2\n'
+                        'fi\n')
+        script += (f'tar -x -z -f - -C "{self.remote_rundir}" || '
+                   '{ rm -rf ' + ' '.join([f'"{d}"' for d in job_remote_rundirs]) + '; exit 3; }\n')
+
+        return script
+
+
+    def _run_tar(self, script, stage_dirs, verbose=False):
+        # run bash script that starts with _tar_stage_out_script, streaming a gzipped tar archive of
+        # stage dirs after it on standard input, so that the archive is never held in memory.
+        # Bash reads a script from a pipe only as far as the command it is about to run, so the whole
+        # script is one { } block, which is read entirely before tar reads the rest of the input.
+        tar_args = ['tar', '-c', '-z', '-f', '-']
+        for stage_dir in stage_dirs:
+            tar_args += ['-C', str(stage_dir.absolute().parent), stage_dir.name]
+
+        return self.run(['bash'], script='{\n' + script + '}\n', stdin_args=tar_args, verbose=verbose)
+
+
+    def _write_job_script_script(self, job_remote_rundir, job_script):
+        # bash script that writes job script into job remote rundir
+        return (f'cat > "{job_remote_rundir}/{self.scheduler.job_script_file}" << "EOF_EXPYRE_JOB_SCRIPT"\n' +
+                job_script +
+                'EOF_EXPYRE_JOB_SCRIPT\n')
+
+
+    def _submit_cmd(self, job_remote_rundir):
+        # command line that submits an already written job script, same as subprocess_run would pass to shell
+        return _optionally_remote_args(self.scheduler.submit_args(job_remote_rundir, self.pre_submit_cmds, write_script=False),
+                                       'bash -c', None, None, in_dir='_PWD_')[-1]
+
+
+    def _stage_out_group(self, group_id, stage_dirs, verbose=False):
+        """Stage out stage dirs of a group of jobs that will be run by one scheduler job
+
+        Parameters
+        ----------
+        group_id: str
+            unique id of group
+        stage_dirs: list(str, Path)
+            local stage directories of jobs
+        verbose: bool, default False
+            verbose output
+
+        Returns
+        -------
+        group_remote_dir: str remote directory for scheduler job script
+        task_remote_dirs: list(str) remote directory of each job, relative to group_remote_dir or absolute
+        job_remote_rundirs: list(str) remote directories that were created for jobs
+        """
+        stage_dirs = [Path(stage_dir) for stage_dir in stage_dirs]
+        if self.remote_rundir is None:
+            # no host, so run in stage dirs, and put job script next to them
+            group_remote_dir = str(stage_dirs[0].parent / f'_expyre_{group_id}')
+            Path(group_remote_dir).mkdir()
+            return group_remote_dir, [str(stage_dir) for stage_dir in stage_dirs], []
+
+        group_remote_dir = f'{self.remote_rundir}/_expyre_{group_id}'
+        job_remote_rundirs = self._stage_out(stage_dirs, extra_remote_dirs=[group_remote_dir], verbose=verbose)
+        return group_remote_dir, [f'../{stage_dir.name}' for stage_dir in stage_dirs], job_remote_rundirs
+
+
+    def submit_packed(self, packed_id, ids, stage_dirs, resources, commands, header_extra=[], exact_fit=True,
+                      partial_node=False, cores_per_task=1, python_cmd='python3', verbose=False):
+        """Submit a packed job on a remote machine, which runs the jobs of all stage directories concurrently
+        (see ``Scheduler.submit_packed``), staging out all stage directories at once
+
+        Parameters
+        ----------
+        packed_id: str
+            unique id for packed job
+        ids: list(str)
+            unique id for each task
+        stage_dirs: list(str, Path)
+            directory in which files have been prepared for each task
+        resources: Resources
+            resources to use for entire packed job
+        commands: list(str)
+            commands to run in each task, in its own directory
+        header_extra: list(str), optional
+            list of lines to append to system header for this job
+        exact_fit: bool, default True
+            only match partitions that have nodes with exact match to number of cores
+        partial_node: bool, default False
+            allow jobs that take less than an entire node
+        cores_per_task: int, default 1
+            number of cores used by each task
+        python_cmd: str, default python3
+            name of python interpreter that runs tasks
+
+        Returns
+        -------
+        str id of packed job on remote machine, shared by all tasks
+        """
+        self.initialize_remote_rundir()
+
+        actual_partition, node_dict, header_extra = self._find_partition(resources, header_extra, exact_fit, partial_node)
+
+        group_remote_dir, task_remote_dirs, job_remote_rundirs = self._stage_out_group(packed_id, stage_dirs, verbose=verbose)
+
+        try:
+            r = self.scheduler.submit_packed(packed_id, group_remote_dir, task_remote_dirs, ids, actual_partition,
+                                             self.commands, commands, resources.max_time,
+                                             self.queuing_sys_header + header_extra, node_dict,
+                                             cores_per_task=cores_per_task, python_cmd=python_cmd,
+                                             no_default_header=self.no_default_header, script_exec=self.script_exec,
+                                             pre_submit_cmds=self.pre_submit_cmds, verbose=verbose)
+        except Exception:
+            sys.stderr.write(f'System.submit_packed call to Scheduler.submit_packed failed for packed job id {packed_id}, '
+                             f'cleaning up remote dirs\n')
+            self.run(['rm', '-r', group_remote_dir] + job_remote_rundirs, verbose=verbose)
+            raise
+        self._invalidate_status_cache()
+
+        return r
+
+
+    def submit_array(self, array_id, ids, stage_dirs, resources, commands, header_extra=[], exact_fit=True,
+                     partial_node=False, verbose=False):
+        """Submit an array job on a remote machine, one task per stage directory, staging out all
+        stage directories at once
+
+        Parameters
+        ----------
+        array_id: str
+            unique id for array job
+        ids: list(str)
+            unique id for each task
+        stage_dirs: list(str, Path)
+            directory in which files have been prepared for each task
+        resources: Resources
+            resources to use for each task
+        commands: list(str)
+            commands to run in each task, in its own directory, after per-machine commands
+        header_extra: list(str), optional
+            list of lines to append to system header for this job
+        exact_fit: bool, default True
+            only match partitions that have nodes with exact match to number of cores
+        partial_node: bool, default False
+            allow jobs that take less than an entire node
+
+        Returns
+        -------
+        list(str) id of each task on remote machine
+        """
+        if len(ids) > self.max_array_size:
+            raise ValueError(f'Array job with {len(ids)} tasks is larger than max_array_size {self.max_array_size}')
+        self.initialize_remote_rundir()
+
+        actual_partition, node_dict, header_extra = self._find_partition(resources, header_extra, exact_fit, partial_node)
+
+        commands = self.commands + commands
+
+        group_remote_dir, task_remote_dirs, job_remote_rundirs = self._stage_out_group(array_id, stage_dirs, verbose=verbose)
+
+        try:
+            r = self.scheduler.submit_array(array_id, group_remote_dir, task_remote_dirs, ids, actual_partition,
+                                            commands, resources.max_time, self.queuing_sys_header + header_extra,
+                                            node_dict, no_default_header=self.no_default_header,
+                                            script_exec=self.script_exec, pre_submit_cmds=self.pre_submit_cmds,
+                                            verbose=verbose)
+        except Exception:
+            sys.stderr.write(f'System.submit_array call to Scheduler.submit_array failed for array job id {array_id}, '
+                             f'cleaning up remote dirs\n')
+            self.run(['rm', '-r', group_remote_dir] + job_remote_rundirs, verbose=verbose)
+            raise
+        self._invalidate_status_cache()
+
+        return r
+
+
+    def submit_many(self, jobs, verbose=False):
+        """Submit many independent jobs, each with its own resources, staging out all of their
+        stage directories at once (one remote copy, or with ``tar_submit`` the same remote command), and
+        submitting all of them with one remote command.  Jobs that fail to submit have their remote
+        dirs removed, but the others remain submitted.
+
+        Parameters
+        ----------
+        jobs: list(dict)
+            each with keys "id", "stage_dir", "resources", and "commands", and optionally "header_extra",
+            "exact_fit", and "partial_node", same as arguments of ``submit``
+        verbose: bool, default False
+            verbose output
+
+        Returns
+        -------
+        list(str) id of each job on remote machine
+
+        Raises
+        ------
+        SubmitManyError if any job failed to submit, with remote ids of those that were submitted
+        """
+        if len(jobs) == 0:
+            return []
+
+        self.initialize_remote_rundir()
+
+        job_scripts = []
+        for job in jobs:
+            actual_partition, node_dict, header_extra = self._find_partition(job['resources'], job.get('header_extra', []),
+                                                                             job.get('exact_fit', True),
+                                                                             job.get('partial_node', False))
+            job_scripts.append((job['id'], actual_partition, self.commands + job['commands'], job['resources'].max_time,
+                                self.queuing_sys_header + header_extra, node_dict))
+
+        stage_dirs = [Path(job['stage_dir']) for job in jobs]
+        script = ''
+        tar_stage_dirs = False
+        if self.remote_rundir is None:
+            # no host, so run in stage dirs to avoid needless copying
+            job_remote_rundirs = [str(stage_dir) for stage_dir in stage_dirs]
+        elif self.tar_submit and all([BlobStore.read_manifest(stage_dir) is None for stage_dir in stage_dirs]):
+            job_remote_rundirs = [self._job_remote_rundir(stage_dir) for stage_dir in stage_dirs]
+            script += self._tar_stage_out_script(stage_dirs)
+            tar_stage_dirs = True
+        else:
+            job_remote_rundirs = self._stage_out(stage_dirs, verbose=verbose)
+
+        # submit each job, never failing as a whole (so submitted jobs are not resubmitted by a retry),
+        # but reporting stdout, stderr and exit status of each submission between markers
+        script += '_expyre_stderr=$(mktemp)\n'
+        for job_i, (job_remote_rundir, job_script_args) in enumerate(zip(job_remote_rundirs, job_scripts)):
+            id, partition, commands, max_time, header, node_dict = job_script_args
+            job_script = self.scheduler.job_script(id, job_remote_rundir, partition, commands, max_time, header, node_dict,
+                                                   no_default_header=self.no_default_header,
+                                                   script_exec=self.script_exec)
+            script += (self._write_job_script_script(job_remote_rundir, job_script) +
+                       f'_expyre_stdout=$( {self._submit_cmd(job_remote_rundir)} 2> $_expyre_stderr )\n'
+                       '_expyre_stat=$?\n')
+            if self.remote_rundir is not None:
+                script += f'[ $_expyre_stat != 0 ] && rm -rf "{job_remote_rundir}"\n'
+            script += (f'echo "_EXPYRE_SUBMIT_STDOUT_ {job_i}"\n'
+                       'echo "$_expyre_stdout"\n'
+                       f'echo "_EXPYRE_SUBMIT_STDERR_ {job_i}"\n'
+                       'cat $_expyre_stderr\n'
+                       f'echo "_EXPYRE_SUBMIT_STATUS_ {job_i} $_expyre_stat"\n')
+        script += 'rm -f $_expyre_stderr\n'
+        script += 'exit 0\n'
+
+        if 'EXPYRE_TIMING_VERBOSE' in os.environ:
+            sys.stderr.write(f'system {self.host} submit_many start scheduler submit {time.time()}\n')
+        if tar_stage_dirs:
+            stdout, stderr = self._run_tar(script, stage_dirs, verbose=verbose)
+        else:
+            stdout, stderr = self.run(['bash'], script=script, verbose=verbose)
+
+        # parse output of each submission
+        outputs = [{'stdout': '', 'stderr': '', 'status': None} for _ in jobs]
+        markers = {'_EXPYRE_SUBMIT_STDOUT_': 'stdout', '_EXPYRE_SUBMIT_STDERR_': 'stderr'}
+        field = None
+        for line in stdout.splitlines(keepends=True):
+            fields = line.split()
+            if len(fields) == 2 and fields[0] in markers:
+                job_i = int(fields[1])
+                field = markers[fields[0]]
+                continue
+            elif len(fields) == 3 and fields[0] == '_EXPYRE_SUBMIT_STATUS_':
+                outputs[int(fields[1])]['status'] = int(fields[2])
+                field = None
+                continue
+            if field is not None:
+                outputs[job_i][field] += line
+
+        remote_ids = []
+        errors = {}
+        for job, output in zip(jobs, outputs):
+            remote_id = None
+            if output['status'] == 0:
+                try:
+                    remote_id = self.scheduler.parse_submit_output(output['stdout'].rstrip('\n'))
+                except Exception as exc:
+                    errors[job['id']] = f'{exc}, stdout {output["stdout"].strip()}'
+            elif output['status'] is None:
+                errors[job['id']] = 'no submission output'
+            else:
+                errors[job['id']] = (f'exit status {output["status"]}, stdout {output["stdout"].strip()}, '
+                                     f'stderr {output["stderr"].strip()}')
+            remote_ids.append(remote_id)
+        self._invalidate_status_cache()
+
+        if len(errors) > 0:
+            sys.stderr.write(f'System.submit_many failed to submit jobs {list(errors)}\n')
+            raise SubmitManyError(remote_ids, errors)
+
+        return remote_ids
+
+
+    def get_remotes(self, local_dir, subdir_glob=None, delete=False, include=None, verbose=False):
         """get data from directories of remotely running jobs
 
         Parameters
@@ -193,6 +682,42 @@ class System:
             only get subdirectories that much one or more globs
         delete: bool, default False
             delete local files that aren't in remote dir
+        include: list(str), default None
+            only get files that match one or more of these rsync patterns, relative to each subdirectory
+        verbose: bool, default False
+            verbose output
+        """
+        if self.remote_rundir is None:
+            # nothing to "get" since this ran in stage dir
+            return
+
+        with self._copy_slot():
+            subprocess_copy(self._remote_subdirs(subdir_glob), local_dir, from_host=self.host,
+                            rcp_args=System._include_args(include), remsh_cmd=self.remsh_cmd, delete=delete, verbose=verbose)
+
+
+    async def aget_remotes(self, local_dir, subdir_glob=None, delete=False, include=None, verbose=False):
+        """asyncio version of ``get_remotes``, with the same arguments
+        """
+        if self.remote_rundir is None:
+            # nothing to "get" since this ran in stage dir
+            return
+
+        await asubprocess_copy(self._remote_subdirs(subdir_glob), local_dir, from_host=self.host,
+                               rcp_args=System._include_args(include), remsh_cmd=self.remsh_cmd, delete=delete,
+                               verbose=verbose)
+
+
+    def get_remote_files(self, local_dir, files, verbose=False):
+        """get specific files from directories of remotely running jobs, with one ``rsync --files-from``
+        call, so that remote directories do not need to be listed
+
+        Parameters
+        ----------
+        local_dir: str | Path
+            local directory to get into
+        files: list(str)
+            files to get, relative to remote rundir (and local_dir), i.e. starting with job subdirectory
         verbose: bool, default False
             verbose output
         """
@@ -200,6 +725,59 @@ class System:
             # nothing to "get" since this ran in stage dir
             return
 
+        with self._copy_slot(), self._files_from(local_dir, files) as files_from:
+            subprocess_copy(self.remote_rundir + '/', local_dir, from_host=self.host, rcp_args=f'-a --files-from={files_from}',
+                            remsh_cmd=self.remsh_cmd, verbose=verbose)
+
+
+    async def aget_remote_files(self, local_dir, files, verbose=False):
+        """asyncio version of ``get_remote_files``, with the same arguments
+        """
+        if self.remote_rundir is None:
+            # nothing to "get" since this ran in stage dir
+            return
+
+        with self._files_from(local_dir, files) as files_from:
+            await asubprocess_copy(self.remote_rundir + '/', local_dir, from_host=self.host,
+                                   rcp_args=f'-a --files-from={files_from}', remsh_cmd=self.remsh_cmd, verbose=verbose)
+
+
+    def _copy_slot(self):
+        # semaphore to hold while copying from host
+        with _host_copy_slots_lock:
+            if self.host not in _host_copy_slots:
+                _host_copy_slots[self.host] = threading.BoundedSemaphore(self.max_concurrent_copies)
+            return _host_copy_slots[self.host]
+
+
+    @staticmethod
+    @contextmanager
+    def _files_from(local_dir, files):
+        # temporary file listing files, for rsync --files-from, which reads it locally
+        fd, files_from = tempfile.mkstemp(dir=local_dir, prefix='_tmp_expyre_files_from_')
+        try:
+            with os.fdopen(fd, 'w') as fout:
+                fout.write('\n'.join(files) + '\n')
+            yield files_from
+        finally:
+            os.unlink(files_from)
+
+
+    @staticmethod
+    def _include_args(include):
+        # rsync args to copy only files matching patterns (in any job subdirectory), creating no empty dirs
+        if include is None:
+            return '-a'
+        # escape glob chars, since copy command is run by shell
+        include = [re.sub(r'([*?\[\]])', r'\\\1', pattern) for pattern in include]
+        # each pattern also includes everything inside matching dirs
+        return ' '.join(['-a', '--prune-empty-dirs', '--include=\\*/'] +
+                        [f'--include=/\\*/{pattern}{suffix}' for pattern in include for suffix in ['', '/\\*\\*\\*']] +
+                        ['--exclude=\\*'])
+
+
+    def _remote_subdirs(self, subdir_glob):
+        # remote path of subdirectories matching one or more globs, or all if None
         if subdir_glob is None:
             subdir_glob = '/*'
         elif isinstance(subdir_glob, str):
@@ -209,9 +787,7 @@ class System:
         else:
             subdir_glob = '/{' + ','.join(subdir_glob) + '}'
 
-        subprocess_copy(self.remote_rundir + subdir_glob, local_dir, from_host=self.host,
-                        remsh_cmd=self.remsh_cmd, delete=delete, verbose=verbose)
-
+        return self.remote_rundir + subdir_glob
 
 
     def clean_rundir(self, stage_dir, filenames, dry_run=False, verbose=False):
@@ -232,6 +808,14 @@ class System:
 
         job_remote_rundir = self._job_remote_rundir(Path(stage_dir))
 
+        evict_cmds = ''
+        blobs_manifest = BlobStore.read_manifest(stage_dir)
+        if filenames is None and self.remote_blob_dir is not None and blobs_manifest is not None:
+            # evict blobs that are no longer linked from any job rundir
+            evict_cmds = (f' ; cd {self.remote_blob_dir} && find . -maxdepth 1 -type f -links 1 \\( ' +
+                          ' -o '.join([f'-name {digest}' for digest in sorted(set(blobs_manifest['files'].values()))]) +
+                          ' \\) -delete')
+
         if filenames is not None:
             filenames = ['"' + filename + '"' for filename in filenames]
             self.run(['bash'],
@@ -243,7 +827,7 @@ class System:
                              f'done\n'), dry_run=dry_run, verbose=verbose)
         else:
             self.run(['bash'],
-                     script="find " + str(job_remote_rundir) + " -type d -exec chmod u+rwx {} \\; ; rm -rf " + str(job_remote_rundir),
+                     script="find " + str(job_remote_rundir) + " -type d -exec chmod u+rwx {} \\; ; rm -rf " + str(job_remote_rundir) + evict_cmds,
                      dry_run=dry_run, verbose=verbose)
 
 
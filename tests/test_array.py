@@ -0,0 +1,224 @@
+import os
+import sys
+import subprocess
+
+import pytest
+
+from expyre.resources import Resources
+from expyre import serialize
+
+
+def test_start_array(tmp_path, expyre_dummy_config, monkeypatch):
+    from expyre import config
+    from expyre.func import ExPyRe
+    import expyre.schedulers.slurm
+
+    scripts = []
+    def _fake_sbatch(host, args, script=None, **kwargs):
+        scripts.append(script)
+        return 'Submitted batch job 1234\n', ''
+    monkeypatch.setattr(expyre.schedulers.slurm, 'subprocess_run', _fake_sbatch)
+    monkeypatch.chdir(tmp_path)
+
+    xprs = [ExPyRe('array', function=sum, args=[list(range(i))]) for i in range(3)]
+    ExPyRe.start_array(xprs, Resources(num_nodes=1, max_time='1h'), system_name='_sys_timelimited',
+                       python_cmd=sys.executable)
+
+    assert len(scripts) == 1
+    assert '#SBATCH --array=1-3' in scripts[0]
+    assert [xpr.remote_id for xpr in xprs] == ['1234_1', '1234_2', '1234_3']
+    assert [job['remote_id'] for job in config.db.jobs(name='array')] == ['1234_1', '1234_2', '1234_3']
+    assert all([job['status'] == 'submitted' for job in config.db.jobs(name='array')])
+
+    # run each task as scheduler would
+    for task_i in range(1, 4):
+        subprocess.run(['bash'], input=scripts[0].encode(), check=True,
+                       env=dict(os.environ, SLURM_ARRAY_TASK_ID=str(task_i)))
+
+    for i, xpr in enumerate(xprs):
+        assert serialize.load(xpr.stage_dir / '_expyre_job_succeeded') == sum(range(i))
+        assert (xpr.stage_dir / f'job.{xpr.id}.stdout').exists()
+
+
+def test_start_packed(tmp_path, expyre_dummy_config, monkeypatch):
+    from expyre.func import ExPyRe
+    import expyre.schedulers.slurm
+
+    scripts = []
+    def _fake_sbatch(host, args, script=None, **kwargs):
+        scripts.append(script)
+        return f'Submitted batch job {1234 + len(scripts)}\n', ''
+    monkeypatch.setattr(expyre.schedulers.slurm, 'subprocess_run', _fake_sbatch)
+    monkeypatch.chdir(tmp_path)
+
+    xprs = [ExPyRe('packed', function=sum, args=[list(range(i))]) for i in range(5)]
+    ExPyRe.start_packed(xprs, Resources(num_nodes=1, max_time='1h'), system_name='_sys_timelimited',
+                        python_cmd=sys.executable, tasks_per_job=3, cores_per_task=4)
+
+    assert len(scripts) == 2
+    assert [xpr.remote_id for xpr in xprs] == ['1235'] * 3 + ['1236'] * 2
+
+    for script in scripts:
+        subprocess.run(['bash'], input=script.encode(), check=True)
+
+    for i, xpr in enumerate(xprs):
+        assert serialize.load(xpr.stage_dir / '_expyre_job_succeeded') == sum(range(i))
+        assert (xpr.stage_dir / f'job.{xpr.id}.stdout').exists()
+
+
+def test_array_status(monkeypatch):
+    import expyre.schedulers.sge
+    from expyre.schedulers import SGE
+
+    def _job_list(state, job_number, sge_state, queue=None, tasks=None):
+        return (f'    <job_list state="{state}">\n'
+                f'      <JB_job_number>{job_number}</JB_job_number>\n'
+                 '      <JAT_prio>0.50000</JAT_prio>\n'
+                 '      <JB_owner>user</JB_owner>\n'
+                f'      <state>{sge_state}</state>\n' +
+                (f'      <queue_name>{queue}</queue_name>\n' if queue is not None else '') +
+                 '      <slots>1</slots>\n' +
+                (f'      <tasks>{tasks}</tasks>\n' if tasks is not None else '') +
+                 '    </job_list>\n')
+    qstat_output = ("<?xml version='1.0'?>\n"
+                    '<job_info  xmlns:xsd="http://arc.liv.ac.uk/repos/darcs/sge/source/dist/util/resources/schemas/qstat/qstat.xsd">\n'
+                    '  <queue_info>\n' +
+                    _job_list('running', 101, 'r', 'all.q@node1') +
+                    _job_list('running', 102, 'r', 'all.q@node2', '1') +
+                    '  </queue_info>\n'
+                    '  <job_info>\n' +
+                    _job_list('pending', 102, 'qw', tasks='2-6:2,7') +
+                    _job_list('pending', 103, 'qw') +
+                    '  </job_info>\n'
+                    '</job_info>\n')
+    monkeypatch.setattr(expyre.schedulers.sge, 'subprocess_run', lambda *args, **kwargs: (qstat_output, ''))
+
+    remote_ids = ['101', '102.1', '102.2', '102.3', '102.4', '102.7', '103', '104']
+    assert SGE(None).status(remote_ids) == {'101': 'running', '102.1': 'running', '102.2': 'queued', '102.3': 'done',
+                                            '102.4': 'queued', '102.7': 'queued', '103': 'queued', '104': 'done'}
+
+
+def test_gather(tmp_path, expyre_dummy_config, monkeypatch):
+    import asyncio
+    import expyre
+    from expyre.func import ExPyRe
+    import expyre.schedulers.slurm
+
+    scripts = []
+    def _fake_sbatch(host, args, script=None, **kwargs):
+        scripts.append(script)
+        return f'Submitted batch job {1234 + len(scripts)}\n', ''
+    monkeypatch.setattr(expyre.schedulers.slurm, 'subprocess_run', _fake_sbatch)
+    # no running jobs listed, so all are done
+    status_calls = []
+    def _fake_status_args(self, remote_ids):
+        status_calls.append(remote_ids)
+        return ['true']
+    monkeypatch.setattr(expyre.schedulers.slurm.Slurm, 'status_args', _fake_status_args)
+    monkeypatch.setattr(expyre.schedulers.slurm.Slurm, 'accounting_args', lambda self, remote_ids: None)
+    monkeypatch.chdir(tmp_path)
+
+    xprs = [ExPyRe('gather', function=sum, args=[list(range(i))]) for i in range(4)]
+    for xpr in xprs:
+        xpr.start(Resources(num_nodes=1, max_time='1h'), system_name='_sys_timelimited', python_cmd=sys.executable)
+    for script in scripts:
+        subprocess.run(['bash'], input=script.encode(), check=True)
+
+    results = asyncio.run(expyre.gather(*xprs, check_interval=1))
+
+    assert [res[0] for res in results] == [sum(range(i)) for i in range(4)]
+    # one status query for all jobs
+    assert len(status_calls) == 1 and sorted(status_calls[0]) == sorted([xpr.remote_id for xpr in xprs])
+    assert all([job['status'] == 'succeeded' for job in expyre.config.db.jobs(name='gather')])
+
+
+def test_gather_sync_failure(tmp_path, expyre_dummy_config, monkeypatch):
+    import asyncio
+    import expyre
+    import expyre.aio
+    from expyre.func import ExPyRe
+    import expyre.schedulers.slurm
+
+    scripts = []
+    def _fake_sbatch(host, args, script=None, **kwargs):
+        scripts.append(script)
+        return f'Submitted batch job {1234 + len(scripts)}\n', ''
+    monkeypatch.setattr(expyre.schedulers.slurm, 'subprocess_run', _fake_sbatch)
+    monkeypatch.setattr(expyre.schedulers.slurm.Slurm, 'status_args', lambda self, remote_ids: ['true'])
+    monkeypatch.setattr(expyre.schedulers.slurm.Slurm, 'accounting_args', lambda self, remote_ids: None)
+    monkeypatch.chdir(tmp_path)
+
+    # sync that fails a given number of times (e.g. ssh to busy login node) before working
+    n_failures = [0]
+    orig_sync = ExPyRe._async_sync_remote_results_status_ll
+    async def _flaky_sync(*args, **kwargs):
+        if n_failures[0] > 0:
+            n_failures[0] -= 1
+            raise RuntimeError('Connection timed out')
+        return await orig_sync(*args, **kwargs)
+    monkeypatch.setattr(ExPyRe, '_async_sync_remote_results_status_ll', staticmethod(_flaky_sync))
+    monkeypatch.setattr(expyre.aio._SystemPoller, 'max_sync_failures', 3)
+
+    xprs = [ExPyRe('gather_retry', function=sum, args=[list(range(i))]) for i in range(2)]
+    for xpr in xprs:
+        xpr.start(Resources(num_nodes=1, max_time='1h'), system_name='_sys_timelimited', python_cmd=sys.executable)
+    for script in scripts:
+        subprocess.run(['bash'], input=script.encode(), check=True)
+
+    # transient failures are retried
+    n_failures[0] = 2
+    with pytest.warns(UserWarning, match='Connection timed out'):
+        results = asyncio.run(expyre.gather(*xprs, check_interval=0.1))
+    assert [res[0] for res in results] == [sum(range(i)) for i in range(2)]
+
+    # persistent failures fail all jobs
+    xpr = ExPyRe('gather_fail', function=sum, args=[[1, 2]])
+    xpr.start(Resources(num_nodes=1, max_time='1h'), system_name='_sys_timelimited', python_cmd=sys.executable)
+    n_failures[0] = 3
+    with pytest.warns(UserWarning, match='giving up after 3'):
+        with pytest.raises(RuntimeError, match='Connection timed out'):
+            asyncio.run(expyre.gather(xpr, check_interval=0.1))
+
+
+def test_start_many(tmp_path, expyre_dummy_config, monkeypatch):
+    import pytest
+    from expyre import config
+    from expyre.func import ExPyRe
+    from expyre.system import SubmitManyError
+
+    # fake sbatch that numbers jobs from 101, and fails for jobs longer than 1 hour
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    with open(bin_dir / 'sbatch', 'w') as fout:
+        fout.write('#!/bin/bash\n'
+                   'if grep -q "time=2:00:00" $1; then\n'
+                   '    echo "sbatch: error: partition not available" 1>&2\n'
+                   '    exit 1\n'
+                   'fi\n'
+                  f'n=$(( $(cat {tmp_path}/n_jobs 2>/dev/null || echo 100) + 1 ))\n'
+                  f'echo $n > {tmp_path}/n_jobs\n'
+                   'echo "Submitted batch job $n"\n')
+    (bin_dir / 'sbatch').chmod(0o755)
+    monkeypatch.setenv('PATH', str(bin_dir) + ':' + os.environ['PATH'])
+    monkeypatch.chdir(tmp_path)
+
+    xprs = [ExPyRe('many', function=sum, args=[list(range(i))]) for i in range(3)]
+    with pytest.raises(SubmitManyError) as exc_info:
+        ExPyRe.start_many(xprs, [Resources(num_nodes=1, max_time='5m'), Resources(num_nodes=1, max_time='5m'),
+                                 Resources(num_nodes=1, max_time='2h')],
+                          system_name='_sys_timelimited', python_cmd=sys.executable)
+
+    assert list(exc_info.value.errors) == [xprs[2].id]
+    assert 'partition not available' in exc_info.value.errors[xprs[2].id]
+    # other jobs remain submitted
+    assert exc_info.value.remote_ids == ['101', '102', None]
+    for xpr in xprs[:2]:
+        job = list(config.db.jobs(id=xpr.id))[0]
+        assert job['status'] == 'submitted' and job['remote_id'] == xpr.remote_id
+    assert list(config.db.jobs(id=xprs[2].id))[0]['status'] == 'created'
+    assert xprs[2].status == 'created'
+
+    # run successful jobs as scheduler would
+    for xpr in xprs[:2]:
+        subprocess.run(['bash', 'job.script.slurm'], cwd=xpr.stage_dir, check=True)
+        assert serialize.load(xpr.stage_dir / '_expyre_job_succeeded') == sum(range(xprs.index(xpr)))
@@ -0,0 +1,107 @@
+import os
+
+import pytest
+
+from pathlib import Path
+
+from expyre.blobstore import BlobStore
+from expyre.filehash import FileDigestCache
+
+
+def test_blobstore(tmp_path):
+    store = BlobStore(tmp_path / 'blobs', FileDigestCache(tmp_path / 'digests.db'))
+
+    with open(tmp_path / 'file_1', 'w') as fout:
+        fout.write('same\n')
+    with open(tmp_path / 'file_2', 'w') as fout:
+        fout.write('same\n')
+    with open(tmp_path / 'file_3', 'w') as fout:
+        fout.write('different\n')
+
+    (tmp_path / 'stage_1').mkdir()
+    (tmp_path / 'stage_2').mkdir()
+    digest_1 = store.link(tmp_path / 'file_1', tmp_path / 'stage_1' / 'file_1')
+    digest_2 = store.link(tmp_path / 'file_2', tmp_path / 'stage_2' / 'file_2')
+    digest_3 = store.link(tmp_path / 'file_3', tmp_path / 'stage_2' / 'file_3')
+
+    # identical content is stored once
+    assert digest_1 == digest_2
+    assert digest_1 != digest_3
+    assert len(list((tmp_path / 'blobs').iterdir())) == 2
+    assert os.stat(tmp_path / 'stage_1' / 'file_1').st_ino == os.stat(tmp_path / 'stage_2' / 'file_2').st_ino
+    with open(tmp_path / 'stage_2' / 'file_2') as fin:
+        assert fin.read() == 'same\n'
+    # blobs are shared, so they must not be writable
+    assert not (os.stat(store.blob_path(digest_1)).st_mode & 0o222)
+
+    # all blobs are referenced
+    assert store.evict() == []
+
+    (tmp_path / 'stage_2' / 'file_2').unlink()
+    (tmp_path / 'stage_2' / 'file_3').unlink()
+    # file_1 content is still referenced by stage_1
+    assert store.evict([digest_1, digest_3], dry_run=True) == [digest_3]
+    assert store.blob_path(digest_3).exists()
+    assert store.evict([digest_1, digest_3]) == [digest_3]
+    assert not store.blob_path(digest_3).exists()
+
+    (tmp_path / 'stage_1' / 'file_1').unlink()
+    assert store.evict() == [digest_1]
+
+
+def test_blobstore_evict_race(tmp_path, monkeypatch):
+    store = BlobStore(tmp_path / 'blobs', FileDigestCache(tmp_path / 'digests.db'))
+
+    with open(tmp_path / 'file_1', 'w') as fout:
+        fout.write('content\n')
+    (tmp_path / 'stage_1').mkdir()
+    digest = store.link(tmp_path / 'file_1', tmp_path / 'stage_1' / 'file_1')
+    (tmp_path / 'stage_1' / 'file_1').unlink()
+
+    # another process links the blob after evict checked its link count, but before it was removed
+    rename = os.rename
+
+    def racing_rename(src, dst):
+        os.link(src, tmp_path / 'stage_1' / 'file_1')
+        rename(src, dst)
+
+    monkeypatch.setattr(os, 'rename', racing_rename)
+    assert store.evict() == []
+    monkeypatch.undo()
+
+    assert store.blob_path(digest).exists()
+    assert os.stat(store.blob_path(digest)).st_ino == os.stat(tmp_path / 'stage_1' / 'file_1').st_ino
+    assert [p.name for p in (tmp_path / 'blobs').iterdir()] == [digest]
+
+    (tmp_path / 'stage_1' / 'file_1').unlink()
+    assert store.evict() == [digest]
+    assert list((tmp_path / 'blobs').iterdir()) == []
+
+
+def test_stage_in_blob_store(tmp_path, expyre_dummy_config, monkeypatch):
+    from expyre import config
+    from expyre.func import ExPyRe
+
+    monkeypatch.setattr(config, 'blob_store', BlobStore(tmp_path / 'blobs', config.file_digests))
+    monkeypatch.chdir(tmp_path)
+
+    (tmp_path / 'inputs').mkdir()
+    for f in ['file_1', 'file_2']:
+        with open(tmp_path / 'inputs' / f, 'w') as fout:
+            fout.write('content\n')
+
+    xprs = [ExPyRe('blob', input_files=['inputs'], function=sum, args=[[i]]) for i in range(2)]
+
+    inodes = set()
+    for xpr in xprs:
+        manifest = BlobStore.read_manifest(xpr.stage_dir)
+        assert set(manifest['files'].keys()) == set(['inputs/file_1', 'inputs/file_2'])
+        inodes |= set([os.stat(xpr.stage_dir / f).st_ino for f in manifest['files']])
+    # one blob for all four staged files
+    assert len(inodes) == 1
+    assert len(list((tmp_path / 'blobs').iterdir())) == 1
+
+    xprs[0].clean(wipe=True)
+    assert len(list((tmp_path / 'blobs').iterdir())) == 1
+    xprs[1].clean(wipe=True)
+    assert len(list((tmp_path / 'blobs').iterdir())) == 0
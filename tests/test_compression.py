@@ -0,0 +1,56 @@
+import os
+import sys
+import pickle
+import subprocess
+
+import pytest
+
+from expyre import compression, serialize
+
+
+@pytest.mark.parametrize('codec', list(compression.codecs))
+def test_codecs(tmp_path, codec):
+    if codec == 'zstd':
+        pytest.importorskip('zstandard')
+    elif codec == 'lz4':
+        pytest.importorskip('lz4')
+
+    data = pickle.dumps([list(range(10000)), 'abc' * 10000])
+    with open(tmp_path / 'data', 'wb') as fout_raw, compression.writer(fout_raw, codec) as fout:
+        fout.write(data)
+
+    assert compression.codec_of(tmp_path / 'data') == codec
+    assert (tmp_path / 'data').stat().st_size < len(data)
+    # chunk size smaller than file
+    assert compression.read(tmp_path / 'data', chunk_size=100) == data
+
+    compression.recode(tmp_path / 'data', None)
+    assert compression.codec_of(tmp_path / 'data') is None
+    with open(tmp_path / 'data', 'rb') as fin:
+        assert fin.read() == data
+    assert compression.read(tmp_path / 'data') == data
+
+
+def _str_len_and_double(data):
+    return len(data), data + data
+
+
+def test_compressed_task(tmp_path, expyre_dummy_config, monkeypatch):
+    from expyre.func import ExPyRe
+
+    monkeypatch.chdir(tmp_path)
+    data = 'abc' * 10000
+    xpr = ExPyRe('compressed', function=_str_len_and_double, args=[data])
+
+    # compress as start() would
+    compression.recode(xpr.stage_dir / '_expyre_task_in.pckl', 'lzma')
+    with open(xpr.stage_dir / '_expyre_codec', 'w') as fout:
+        fout.write('lzma\n')
+
+    # run job script core directly, as a remote job would
+    subprocess.run([sys.executable, '_expyre_script_core.py'], cwd=xpr.stage_dir, check=True,
+                   env=dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+    os.rename(xpr.stage_dir / '_tmp_expyre_job_succeeded', xpr.stage_dir / '_expyre_job_succeeded')
+
+    assert compression.codec_of(xpr.stage_dir / '_expyre_job_succeeded') == 'lzma'
+    assert serialize.load(xpr.stage_dir / '_expyre_job_succeeded') == (len(data), data + data)
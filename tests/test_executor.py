@@ -0,0 +1,130 @@
+import sys
+import subprocess
+import itertools
+
+from expyre.resources import Resources
+
+
+def _setup_fake_slurm(monkeypatch):
+    import expyre.schedulers.slurm
+
+    # run job script as soon as it's submitted
+    scripts = []
+    def _fake_sbatch(host, args, script=None, **kwargs):
+        scripts.append(script)
+        subprocess.run(['bash'], input=script.encode(), check=True)
+        return f'Submitted batch job {1234 + len(scripts)}\n', ''
+    monkeypatch.setattr(expyre.schedulers.slurm, 'subprocess_run', _fake_sbatch)
+    # no running jobs listed, so all are done
+    monkeypatch.setattr(expyre.schedulers.slurm.Slurm, 'status_args', lambda self, remote_ids: ['true'])
+    monkeypatch.setattr(expyre.schedulers.slurm.Slurm, 'accounting_args', lambda self, remote_ids: None)
+
+    return scripts
+
+
+def test_executor_submit(tmp_path, expyre_dummy_config, monkeypatch):
+    from expyre import ExPyReExecutor
+
+    _setup_fake_slurm(monkeypatch)
+    monkeypatch.chdir(tmp_path)
+
+    with ExPyReExecutor('_sys_timelimited', Resources(num_nodes=1, max_time='1h'), check_interval=1,
+                        python_cmd=sys.executable) as executor:
+        future = executor.submit(sum, [1, 2, 3])
+        future_fail = executor.submit(int, 'five')
+        assert future.result() == 6
+        try:
+            future_fail.result()
+            assert False
+        except ValueError as exc:
+            assert 'five' in str(exc)
+
+
+def test_executor_map_lazy(tmp_path, expyre_dummy_config, monkeypatch):
+    from expyre import ExPyReExecutor
+
+    scripts = _setup_fake_slurm(monkeypatch)
+    monkeypatch.chdir(tmp_path)
+    # jobs of unused results are cancelled, don't retry failing scancel
+    monkeypatch.setenv('EXPYRE_RETRY', '1 0')
+
+    with ExPyReExecutor('_sys_timelimited', Resources(num_nodes=1, max_time='1h'), check_interval=1,
+                        max_in_flight=2, python_cmd=sys.executable) as executor:
+        # infinite input, only consumed as results are needed
+        results = executor.map(abs, itertools.count(-3))
+        assert list(itertools.islice(results, 4)) == [3, 2, 1, 0]
+        assert len(scripts) <= 4 + 2
+        results.close()
+
+
+def test_executor_slow_submit(tmp_path, expyre_dummy_config, monkeypatch):
+    import time
+    import asyncio
+    import threading
+    import expyre.schedulers.slurm
+    from expyre import ExPyReExecutor
+
+    _setup_fake_slurm(monkeypatch)
+    monkeypatch.chdir(tmp_path)
+
+    # submission that takes a while, e.g. slow ssh or busy scheduler
+    submitting = threading.Event()
+    def _slow_sbatch(host, args, script=None, _fake_sbatch=expyre.schedulers.slurm.subprocess_run, **kwargs):
+        submitting.set()
+        time.sleep(3)
+        return _fake_sbatch(host, args, script=script, **kwargs)
+    monkeypatch.setattr(expyre.schedulers.slurm, 'subprocess_run', _slow_sbatch)
+
+    with ExPyReExecutor('_sys_timelimited', Resources(num_nodes=1, max_time='1h'), check_interval=1,
+                        python_cmd=sys.executable) as executor:
+        future = executor.submit(sum, [1, 2, 3])
+        assert submitting.wait(timeout=30)
+
+        # event loop (which polls all other jobs) still runs while job is being submitted
+        t0 = time.time()
+        asyncio.run_coroutine_threadsafe(asyncio.sleep(0), executor._loop).result(timeout=10)
+        assert time.time() - t0 < 1.0
+        assert not future.done()
+
+        assert future.result() == 6
+
+
+def test_executor_cancel_slot(tmp_path, expyre_dummy_config, monkeypatch):
+    import time
+    import threading
+    import expyre.schedulers.base
+    from expyre import ExPyReExecutor
+
+    scripts = _setup_fake_slurm(monkeypatch)
+    monkeypatch.chdir(tmp_path)
+
+    # job that stays queued, and remote cancel that takes a while
+    def _fake_sbatch(host, args, script=None, **kwargs):
+        scripts.append(script)
+        return f'Submitted batch job {1234 + len(scripts)}\n', ''
+    monkeypatch.setattr(expyre.schedulers.slurm, 'subprocess_run', _fake_sbatch)
+    monkeypatch.setattr(expyre.schedulers.slurm.Slurm, 'status_args',
+                        lambda self, remote_ids: ['echo', f'{remote_ids[0]}', 'PENDING', 'None'])
+    cancelled = threading.Event()
+    def _slow_scancel(host, args, **kwargs):
+        time.sleep(2)
+        cancelled.set()
+        return '', ''
+    monkeypatch.setattr(expyre.schedulers.base, 'subprocess_run', _slow_scancel)
+
+    executor = ExPyReExecutor('_sys_timelimited', Resources(num_nodes=1, max_time='1h'), check_interval=1,
+                              max_in_flight=1, python_cmd=sys.executable)
+    future = executor.submit(sum, [1, 2, 3])
+    while len(scripts) == 0:
+        time.sleep(0.1)
+    future.cancel()
+
+    # slot of cancelled job is only available once its remote job has been cancelled
+    submitted = threading.Event()
+    thread = threading.Thread(target=lambda: (executor.submit(sum, [4]).cancel(), submitted.set()))
+    thread.start()
+    assert submitted.wait(timeout=30)
+    assert cancelled.is_set()
+    thread.join()
+
+    executor.shutdown(cancel_futures=True)
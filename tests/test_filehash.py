@@ -0,0 +1,96 @@
+import os
+import hashlib
+
+import pytest
+
+from expyre import filehash
+from expyre.filehash import FileDigestCache, file_digest
+
+
+def test_file_digest(tmp_path):
+    content = os.urandom(100000)
+    with open(tmp_path / 'file', 'wb') as fout:
+        fout.write(content)
+
+    # chunk size that does not divide file size
+    assert file_digest(tmp_path / 'file', chunk_size=777) == hashlib.sha256(content).digest()
+    assert file_digest(tmp_path / 'file') == hashlib.sha256(content).digest()
+
+
+def test_digest_cache(tmp_path, monkeypatch):
+    contents = [os.urandom(1000 + i) for i in range(5)]
+    files = []
+    for i, content in enumerate(contents):
+        files.append(tmp_path / f'file_{i}')
+        with open(files[-1], 'wb') as fout:
+            fout.write(content)
+
+    n_hashed = []
+    orig_file_digest = filehash.file_digest
+    def _counting_file_digest(filename):
+        n_hashed.append(filename)
+        return orig_file_digest(filename)
+    monkeypatch.setattr(filehash, 'file_digest', _counting_file_digest)
+
+    cache = FileDigestCache(tmp_path / 'digests.db')
+    assert cache.digests(files) == [hashlib.sha256(c).digest() for c in contents]
+    assert len(n_hashed) == 5
+
+    # reopen, should not rehash anything
+    n_hashed.clear()
+    cache = FileDigestCache(tmp_path / 'digests.db')
+    assert cache.digests(files) == [hashlib.sha256(c).digest() for c in contents]
+    assert len(n_hashed) == 0
+
+    # modify one file
+    with open(files[2], 'wb') as fout:
+        fout.write(b'new content')
+    assert cache.digest(files[2]) == hashlib.sha256(b'new content').digest()
+    assert len(n_hashed) == 1
+
+
+def test_digest_cache_threads(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+
+    contents = [os.urandom(1000 + i) for i in range(40)]
+    files = []
+    for i, content in enumerate(contents):
+        files.append(tmp_path / f'file_{i}')
+        with open(files[-1], 'wb') as fout:
+            fout.write(content)
+
+    # one shared cache, used from many threads at once, with overlapping sets of files
+    cache = FileDigestCache(tmp_path / 'digests.db', max_workers=1)
+    def _digests(i):
+        return cache.digests(files[i % 11:i % 11 + 30]), id(cache.db)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(_digests, range(64)))
+
+    for i, (digests, _) in enumerate(results):
+        assert digests == [hashlib.sha256(c).digest() for c in contents[i % 11:i % 11 + 30]]
+    # a separate connection for each thread
+    assert len(set([db_id for _, db_id in results])) > 1
+
+    # all were saved in the cache
+    assert FileDigestCache(tmp_path / 'digests.db').db.execute('SELECT COUNT(*) FROM digests').fetchone()[0] == 40
+
+
+def test_input_files_hash(tmp_path, expyre_dummy_config, monkeypatch):
+    from expyre.func import ExPyRe
+
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'subdir').mkdir()
+    with open(tmp_path / 'subdir' / 'file_1', 'w') as fout:
+        fout.write('1\n')
+    with open(tmp_path / 'file_2', 'w') as fout:
+        fout.write('2\n')
+
+    xpr_1 = ExPyRe('hash', input_files=['subdir', 'file_2'], function=sum, args=[[1, 2]])
+    xpr_2 = ExPyRe('hash', input_files=['subdir', 'file_2'], function=sum, args=[[1, 2]])
+    # same inputs, so restarted from first
+    assert xpr_2.id == xpr_1.id
+
+    with open(tmp_path / 'subdir' / 'file_1', 'w') as fout:
+        fout.write('changed\n')
+    xpr_3 = ExPyRe('hash', input_files=['subdir', 'file_2'], function=sum, args=[[1, 2]])
+    assert not xpr_3.id.startswith(xpr_1.id[:-9])
@@ -105,3 +105,251 @@ def test_basic(tmp_path):
     assert _clean(jobs[0]) == {'id': 'job2', 'name': 'task', 'from_dir': 'rundir_2', 'status': 'succeeded',
                        'remote_id': None, 'remote_status': None, 'system': 'sys'}
 
+
+
+def test_sql_filters(tmp_path):
+    import re
+
+    db = JobsDB(tmp_path / 'expyre.db')
+    for id in ['job_a.1', 'job_a.10', 'job_ab', 'job_b', 'jobxa']:
+        db.add(id, 'task', 'rundir', system='sys_1' if id.endswith('1') else 'sys_2')
+
+    # literal and prefix matches are done with indices, others with REGEXP
+    assert [j['id'] for j in db.jobs(id=re.escape('job_a.1'))] == ['job_a.1']
+    assert [j['id'] for j in db.jobs(id=re.escape('job_a.') + '.*')] == ['job_a.1', 'job_a.10']
+    assert [j['id'] for j in db.jobs(id='job.a.*')] == ['job_a.1', 'job_a.10', 'job_ab', 'jobxa']
+    assert [j['id'] for j in db.jobs(id=['job_b', 'job_a\\..*'])] == ['job_a.1', 'job_a.10', 'job_b']
+    assert [j['id'] for j in db.jobs(id='.*', system='sys_1')] == ['job_a.1']
+    assert [j['id'] for j in db.jobs(id='.*b', status='ongoing')] == ['job_ab', 'job_b']
+    with pytest.raises(ValueError):
+        list(db.jobs(id='job_(a'))
+
+    assert db.get('job_a.1')['system'] == 'sys_1'
+    assert db.get('job_a.') is None
+
+    indices = [row[0] for row in db.db.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'jobs'")]
+    assert set(indices) == set(['jobs_id_unique', 'jobs_status', 'jobs_system', 'jobs_name'])
+    plan = ' '.join([str(row) for row in db.db.execute("EXPLAIN QUERY PLAN SELECT * FROM jobs WHERE id = 'job_b'")])
+    assert 'jobs_id' in plan
+
+
+def test_bulk(tmp_path):
+    db = JobsDB(tmp_path / 'expyre.db')
+
+    db.add_many([{'id': f'job_{i}', 'name': 'task', 'from_dir': f'rundir_{i}'} for i in range(5)])
+    assert [j['id'] for j in db.jobs()] == [f'job_{i}' for i in range(5)]
+    # nothing is added if any job exists
+    with pytest.raises(ValueError, match='job_4'):
+        db.add_many([{'id': 'job_5', 'name': 'task', 'from_dir': 'rundir_5'}, {'id': 'job_4', 'name': 'task', 'from_dir': 'rundir_4'}])
+    with pytest.raises(ValueError):
+        db.add('job_0', 'task', 'rundir_0')
+    assert len(list(db.jobs())) == 5
+
+    # different sets of fields in one transaction
+    db.update_many({'job_0': {'status': 'submitted'}, 'job_1': {'status': 'submitted', 'remote_id': '12'},
+                    'job_2': {'remote_status': 'queued'}})
+    assert [(j['status'], j['remote_id'], j['remote_status']) for j in db.jobs(id='job_[012]')] == [
+            ('submitted', None, None), ('submitted', '12', None), ('created', None, 'queued')]
+    # nothing is updated if any job does not exist
+    with pytest.raises(ValueError, match='job_9'):
+        db.update_many({'job_3': {'status': 'submitted'}, 'job_9': {'status': 'submitted'}})
+    assert db.get('job_3')['status'] == 'created'
+
+    # unchanged values are not written, so status time is kept
+    db.update_many({'job_0': {'status': 'started'}})
+    db.db.execute("UPDATE jobs SET status_time = 0 WHERE id = 'job_0'")
+    db.db.commit()
+    db.update('job_0', status='started', only_changed=True)
+    assert db.get('job_0', readable=False)['status_time'] == 0
+    db.update_many({'job_0': {'status': 'succeeded'}, 'job_2': {'remote_status': None}}, only_changed=True)
+    assert db.get('job_0', readable=False)['status_time'] > 0
+    assert db.get('job_2')['remote_status'] is None
+    with pytest.raises(ValueError):
+        db.update('job_9', status='started', only_changed=True)
+    with pytest.raises(ValueError, match='job_9'):
+        db.update_many({'job_3': {'remote_id': None}, 'job_9': {'remote_id': '9'}}, only_changed=True)
+
+    # skipping unchanged jobs does not query each of them separately
+    updates = {f'job_{i}': {'status': db.get(f'job_{i}')['status']} for i in range(3)}
+    updates.update({f'job_{i}': {'remote_id': None} for i in range(3, 5)})
+    statements = []
+    db.db.set_trace_callback(statements.append)
+    db.update_many(updates, only_changed=True)
+    db.db.set_trace_callback(None)
+    # old values of jobs with status, and existence of others
+    assert len([st for st in statements if st.startswith('SELECT')]) == 2
+
+    db.remove_many(['job_0', 'job_1'])
+    assert [j['id'] for j in db.jobs()] == ['job_2', 'job_3', 'job_4']
+    # nothing is removed if any job does not exist
+    with pytest.raises(ValueError):
+        db.remove_many(['job_2', 'job_9'])
+    assert len(list(db.jobs())) == 3
+
+
+def _add_and_update(db, prefix, n):
+    for i in range(n):
+        db.add(f'{prefix}_{i}', 'task', 'rundir')
+        db.update(f'{prefix}_{i}', status='submitted')
+        list(db.jobs(status='ongoing'))
+
+
+def test_concurrent(tmp_path, monkeypatch):
+    import threading
+    import multiprocessing
+
+    db = JobsDB(tmp_path / 'expyre.db', busy_timeout=10)
+    assert db.db.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+
+    # threads each have their own connection
+    connections = []
+    def _connection():
+        connections.append(db.db)
+    threads = [threading.Thread(target=_connection) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set([id(c) for c in connections + [db.db]])) == 3
+
+    # many writers in threads and forked processes (which inherit db from parent) at once
+    procs = [multiprocessing.get_context('fork').Process(target=_add_and_update, args=(db, f'proc_{i}', 20)) for i in range(4)]
+    threads = [threading.Thread(target=_add_and_update, args=(db, f'thread_{i}', 20)) for i in range(4)]
+    for worker in procs + threads:
+        worker.start()
+    for worker in procs + threads:
+        worker.join()
+    assert all([proc.exitcode == 0 for proc in procs])
+
+    assert len(list(db.jobs(status='submitted'))) == 8 * 20
+
+    db.unlock()
+    assert len(list(db.jobs(status='submitted'))) == 8 * 20
+    assert (tmp_path / 'expyre.db.old').exists()
+
+    # connections of threads that have ended are closed, rather than accumulating
+    import gc
+    connections.clear()
+    threads = [threading.Thread(target=db.get, args=('thread_0_0',)) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+        thread.join()
+    gc.collect()
+    assert len(db._connections) == 1
+
+    # opening existing database only reads
+    commands = []
+    def _execute(self, cmd, params=(), _execute=JobsDB._execute, **kwargs):
+        commands.extend([cmd] if isinstance(cmd, str) else cmd)
+        return _execute(self, cmd, params, **kwargs)
+    monkeypatch.setattr(JobsDB, '_execute', _execute)
+    JobsDB(tmp_path / 'expyre.db', events_retention=3600)
+    assert len(commands) > 0 and all([cmd.startswith('SELECT') for cmd in commands])
+
+
+def test_events_latencies(tmp_path, monkeypatch):
+    import time
+    import expyre.jobsdb
+
+    class _Clock:
+        t = 1000.0
+        def time(self):
+            return self.t
+        def __getattr__(self, name):
+            return getattr(time, name)
+    clock = _Clock()
+    monkeypatch.setattr(expyre.jobsdb, 'time', clock)
+
+    db = JobsDB(tmp_path / 'expyre.db')
+    for i in range(4):
+        # queued for i+1 s, runs for 10 * (i+1) s, synced back 0.5 s later
+        clock.t = 1000.0
+        db.add(f'job_{i}', 'task', 'rundir', source='constructor')
+        db.update(f'job_{i}', status='submitted', system='sys', remote_id=str(i), source='start')
+        db.log_events([(f'job_{i}', 'partition', 'debug' if i < 3 else 'big')], source='start')
+        clock.t += i + 1
+        db.update(f'job_{i}', remote_status='running', source='sync')
+        # unchanged, not logged
+        db.update(f'job_{i}', remote_status='running', only_changed=True, source='sync')
+        clock.t += 10 * (i + 1)
+        db.update(f'job_{i}', remote_status='done', source='sync')
+        clock.t += 0.5
+        db.update(f'job_{i}', status='succeeded', source='get_results')
+
+    assert [(e['field'], e['old_value'], e['new_value'], e['source'], e['system']) for e in db.events(id='job_1')] == [
+            ('status', None, 'created', 'constructor', None), ('status', 'created', 'submitted', 'start', 'sys'),
+            ('partition', None, 'debug', 'start', None), ('remote_status', None, 'running', 'sync', 'sys'),
+            ('remote_status', 'running', 'done', 'sync', 'sys'), ('status', 'submitted', 'succeeded', 'get_results', 'sys')]
+
+    latencies = db.latencies(percentiles=[50, 100])
+    assert set(latencies.keys()) == set([('sys', 'debug'), ('sys', 'big')])
+    assert latencies[('sys', 'debug')]['queue_wait'] == pytest.approx({'n': 3, 'mean': 2.0, 'p50': 2.0, 'p100': 3.0})
+    assert latencies[('sys', 'debug')]['run_time']['p50'] == pytest.approx(20.0)
+    assert latencies[('sys', 'debug')]['sync_lag']['p50'] == pytest.approx(0.5)
+    assert latencies[('sys', 'big')]['turnaround']['n'] == 1
+    assert 'processing' not in latencies[('sys', 'big')]
+    assert db.latencies(system='other') == {}
+
+    # retention
+    clock.t = 1010.0
+    n_events = len(list(db.events()))
+    # created, submitted, and partition of each job
+    assert db.prune_events(1001.0) == 12
+    assert len(list(db.events())) == n_events - 12
+    # pruned on open only once events are a day older than retention, so that opening does not usually write
+    clock.t = 2000.0
+    JobsDB(tmp_path / 'expyre.db', events_retention=0.1)
+    assert len(list(db.events())) == n_events - 12
+    clock.t = 2000.0 + 24 * 3600
+    JobsDB(tmp_path / 'expyre.db', events_retention=0.1)
+    assert len(list(db.events())) == 0
+
+
+@pytest.mark.parametrize('archive_filename', [None, 'archive.db'])
+def test_compact(tmp_path, archive_filename):
+    import re
+
+    if archive_filename is not None:
+        archive_filename = tmp_path / archive_filename
+    db = JobsDB(tmp_path / 'expyre.db', archive_filename=archive_filename)
+    statuses = ['processed', 'cleaned', 'succeeded', 'failed', 'started']
+    db.add_many([dict(id=f'task_{job_i:04d}', name='task', from_dir='rundir_' + 'x' * 1000, status=statuses[job_i % 5])
+                 for job_i in range(1000)])
+
+    # nothing is old enough
+    res = db.compact(3600)
+    assert res['archived'] == 0 and res['jobs'] == 1000 and res['archive_jobs'] == 0
+
+    with pytest.raises(ValueError):
+        db.compact(0, status='succeeded')
+    with pytest.raises(ValueError):
+        db.compact(0, status=['processed', 'done'])
+    # failed jobs may still be inspected or rerun
+    with pytest.raises(ValueError):
+        db.compact(0, status='failed')
+
+    res = db.compact(-1)
+    assert res['archived'] == 400 and res['jobs'] == 600 and res['archive_jobs'] == 400
+    if archive_filename is not None:
+        # jobs.db shrinks by size of archived jobs
+        size_before, size_after = res['file_sizes'][str(tmp_path / 'expyre.db')]
+        assert size_after < 0.7 * size_before
+        assert res['file_sizes'][str(archive_filename)][1] > 0.3 * size_before
+
+    assert len(list(db.jobs())) == 600
+    assert set([j['status'] for j in db.jobs()]) == set(['succeeded', 'failed', 'started'])
+    assert len(list(db.jobs(archived=True))) == 1000
+    assert [j['id'] for j in db.jobs(id=re.escape('task_000') + '.*', archived=True)] == [f'task_{job_i:04d}' for job_i in
+                                                                                      [2, 3, 4, 7, 8, 9, 0, 1, 5, 6]]
+    assert db.get('task_0000') is None
+    assert db.get('task_0000', archived=True)['status'] == 'processed'
+
+    # archived jobs are only looked up through index
+    archive_table = ('archive.' if archive_filename is not None else '') + 'jobs_archive'
+    plan = ' '.join([str(row) for row in db.db.execute(f"EXPLAIN QUERY PLAN SELECT * FROM {archive_table} WHERE id = 'task_0000'")])
+    assert 'jobs_archive_id_unique' in plan
+
+    # archive persists
+    db = JobsDB(tmp_path / 'expyre.db', archive_filename=archive_filename)
+    assert len(list(db.jobs(archived=True))) == 1000
+    assert db.compact(-1)['archived'] == 0
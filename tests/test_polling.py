@@ -0,0 +1,75 @@
+import json
+import time
+
+from expyre.polling import AdaptivePolling, FixedPolling, make_policy
+
+
+def test_adaptive_backoff():
+    policy = AdaptivePolling(min_interval=10, max_interval=50, backoff=2.0, jitter=0.0)
+
+    assert [policy.interval('job', 'queued') for _ in range(4)] == [10, 20, 40, 50]
+    # state change restarts backoff
+    assert [policy.interval('job', 'running') for _ in range(2)] == [10, 20]
+    assert [d['reason'] for d in policy.decisions] == ['backoff'] * 6
+
+
+def test_adaptive_estimates():
+    policy = AdaptivePolling(min_interval=10, max_interval=1000, backoff=4.0, jitter=0.0)
+
+    assert policy.needs_estimate('job', 'queued')
+    # expected to start in 100 s, so wait at most half of that
+    intervals = [policy.interval('job', 'queued', (time.time() + 100, time.time() + 200))]
+    assert not policy.needs_estimate('job', 'queued')
+    intervals += [policy.interval('job', 'queued') for _ in range(2)]
+    assert intervals[0] == 10
+    assert intervals[1] == 40
+    assert 45 < intervals[2] <= 50
+    assert policy.decisions[-1]['reason'] == 'estimate'
+
+    # new estimate once running
+    assert policy.needs_estimate('job', 'running')
+    policy.forget('job')
+    assert policy.needs_estimate('job', 'queued')
+
+
+def test_jitter_and_log(tmp_path):
+    policy = make_policy({'policy': 'adaptive', 'min_interval': 100, 'jitter': 0.1, 'log_file': str(tmp_path / 'polling.log')})
+    assert isinstance(policy, AdaptivePolling)
+
+    intervals = [policy.interval(f'job_{i}', 'queued') for i in range(20)]
+    assert all([90 <= interval <= 110 for interval in intervals])
+    assert len(set(intervals)) > 1
+
+    with open(tmp_path / 'polling.log') as fin:
+        decisions = [json.loads(line) for line in fin]
+    assert [d['interval'] for d in decisions] == intervals
+
+    assert make_policy(None).interval('job', 'queued') == 30
+    assert isinstance(make_policy({'policy': 'expyre.polling.FixedPolling', 'check_interval': 5}), FixedPolling)
+
+
+def test_slurm_time_estimates(monkeypatch):
+    import expyre.schedulers.base
+    from expyre.schedulers import Slurm
+
+    stdout = ('1234                2026-10-18T10:00:00           2026-10-18T12:00:00           \n'
+              '1235                N/A                           N/A                           \n'
+              '1236                2026-10-18T10:00:00           2026-10-18T12:00:00           \n')
+    estimates = Slurm(None).parse_time_estimates(stdout, ['1234', '1235'])
+    assert set(estimates) == {'1234', '1235'}
+    assert estimates['1234'][1] - estimates['1234'][0] == 7200
+    assert estimates['1235'] == (None, None)
+
+    # only tracked jobs are queried, in chunks, like status, and jobs that have left the queue are not an error
+    calls = []
+    def _fake_squeue(host, args, **kwargs):
+        calls.append(' '.join(args))
+        return stdout + '_EXPYRE_CHUNK_FAILED\n', 'slurm_load_jobs error: Invalid job id specified\n'
+    monkeypatch.setattr(expyre.schedulers.base, 'subprocess_run', _fake_squeue)
+    scheduler = Slurm(None)
+    scheduler.status_chunk_size = 2
+    assert set(scheduler.time_estimates(['1234', '1235', '1237'])) == {'1234', '1235'}
+    assert calls == ['squeue -r --noheader -O jobid:20,starttime:30,endtime:30 --jobs=1234,1235 || echo _EXPYRE_CHUNK_FAILED ; '
+                     'squeue -r --noheader -O jobid:20,starttime:30,endtime:30 --jobs=1237 || echo _EXPYRE_CHUNK_FAILED']
+    assert scheduler.time_estimates([]) == {}
+    assert len(calls) == 1
@@ -165,3 +165,174 @@ def do_definitely_queued_job(tmp_path, expyre_config, sys_name, queued_job_resou
 
     status = sched.status(remote_job_1)
     assert status[remote_job_1] == 'done'
+
+
+def test_slurm_status_accounting(monkeypatch):
+    import expyre.schedulers.slurm
+    from expyre.schedulers import Slurm
+
+    calls = []
+    def _fake_slurm(host, args, **kwargs):
+        calls.append(' '.join(args))
+        if args[0] == 'squeue':
+            return ('1001       RUNNING     None\n'
+                    '1002_3     PENDING     JobHeldUser\n'), ''
+        return ('1003|COMPLETED|0:0\n'
+                '1004|TIMEOUT|0:15\n'
+                '1005|OUT_OF_MEMORY|0:125\n'
+                '1006|NODE_FAIL|1:0\n'
+                '1007|CANCELLED by 500|0:9\n'), ''
+    monkeypatch.setattr(expyre.schedulers.slurm, 'subprocess_run', _fake_slurm)
+
+    scheduler = Slurm(None)
+    scheduler.status_chunk_size = 4
+    remote_ids = ['1001', '1002_3', '1003', '1004', '1005', '1006', '1007', '1008']
+    assert scheduler.status(remote_ids) == {'1001': 'running', '1002_3': 'held', '1003': 'done', '1004': 'timeout',
+                                            '1005': 'failed', '1006': 'failed', '1007': 'other', '1008': 'done'}
+
+    # only tracked jobs, in chunks, and accounting only for jobs no longer listed by squeue
+    assert len(calls) == 2
+    assert ('--jobs=1001,1002_3,1003,1004 || echo _EXPYRE_CHUNK_FAILED ; squeue' in calls[0] and
+            calls[0].endswith('--jobs=1005,1006,1007,1008 || echo _EXPYRE_CHUNK_FAILED'))
+    assert ('--jobs=1003,1004,1005,1006 || echo _EXPYRE_CHUNK_FAILED ; sacct' in calls[1] and
+            calls[1].endswith('--jobs=1007,1008 || echo _EXPYRE_CHUNK_FAILED'))
+
+    assert scheduler.parse_accounting(_fake_slurm(None, ['sacct'])[0], ['1003', '1004', '1006']) == {
+        '1003': ('done', 0), '1004': ('timeout', -15), '1006': ('failed', 1)}
+
+
+def test_slurm_status_failure(monkeypatch):
+    import expyre.schedulers.slurm
+    from expyre.schedulers import Slurm
+
+    calls = []
+    squeue_stderr = None
+    def _fake_slurm(host, args, **kwargs):
+        calls.append(args[0])
+        if args[0] == 'squeue':
+            # second chunk fails
+            return '1001       RUNNING     None\n_EXPYRE_CHUNK_FAILED\n', squeue_stderr
+        return '1003|COMPLETED|0:0\n', ''
+    monkeypatch.setattr(expyre.schedulers.slurm, 'subprocess_run', _fake_slurm)
+
+    scheduler = Slurm(None)
+    scheduler.status_chunk_size = 2
+    remote_ids = ['1001', '1002', '1003', '1004']
+
+    # chunk failed only because its jobs are no longer known to squeue
+    squeue_stderr = 'slurm_load_jobs error: Invalid job id specified\n'
+    assert scheduler.status(remote_ids) == {'1001': 'running', '1002': 'done', '1003': 'done', '1004': 'done'}
+    assert calls == ['squeue', 'sacct']
+
+    # any other failure (e.g. slurmctld not responding) is an error, rather than all jobs being done
+    calls.clear()
+    squeue_stderr = 'slurm_load_jobs error: Socket timed out on send/recv operation\n'
+    with pytest.raises(RuntimeError, match='Socket timed out'):
+        scheduler.status(remote_ids)
+    assert calls == ['squeue']
+
+
+def test_pbs_status_json(monkeypatch):
+    import expyre.schedulers.pbs
+    from expyre.schedulers import PBS
+
+    calls = []
+    def _fake_qstat(host, args, **kwargs):
+        calls.append(' '.join(args))
+        # one json document per chunk, with full server name
+        return (json.dumps({'pbs_version': '2022.1', 'Jobs': {
+                    '101.server.domain': {'job_state': 'R'},
+                    '102[1].server.domain': {'job_state': 'F', 'Exit_status': 0},
+                    '102[2].server.domain': {'job_state': 'F', 'Exit_status': 271},
+                    '102[3].server.domain': {'job_state': 'X', 'Exit_status': 1},
+                    '102[4].server.domain': {'job_state': 'X', 'Exit_status': -29}}}, indent=4) + '\n' +
+                json.dumps({'pbs_version': '2022.1', 'Jobs': {
+                    '103.server.domain': {'job_state': 'H', 'Variable_List': 'PATH=C:\\bin'}}}) + '\n'), ''
+    monkeypatch.setattr(expyre.schedulers.pbs, 'subprocess_run', _fake_qstat)
+
+    scheduler = PBS(None)
+    scheduler.status_chunk_size = 2
+    remote_ids = ['101.server', '102[1].server', '102[2].server', '102[3].server', '102[4].server', '103.server',
+                  '104.server']
+    assert scheduler.status(remote_ids) == {'101.server': 'running', '102[1].server': 'done', '102[2].server': 'failed',
+                                            '102[3].server': 'failed', '102[4].server': 'timeout', '103.server': 'held',
+                                            '104.server': 'done'}
+    assert calls == ['qstat -f -F json -x 101.server 102\\[1\\].server || echo _EXPYRE_CHUNK_FAILED ; '
+                     'qstat -f -F json -x 102\\[2\\].server 102\\[3\\].server || echo _EXPYRE_CHUNK_FAILED ; '
+                     'qstat -f -F json -x 102\\[4\\].server 103.server || echo _EXPYRE_CHUNK_FAILED ; '
+                     'qstat -f -F json -x 104.server || echo _EXPYRE_CHUNK_FAILED']
+    # exit status of finished jobs, from status query, not known for job killed by server
+    assert scheduler.accounting(remote_ids) == {'102[1].server': ('done', 0), '102[2].server': ('failed', -15),
+                                                '102[3].server': ('failed', 1), '102[4].server': ('timeout', None)}
+    assert len(calls) == 2
+
+
+def test_pbs_status_failure(monkeypatch):
+    import expyre.schedulers.pbs
+    from expyre.schedulers import PBS
+
+    qstat_stderr = None
+    def _fake_qstat(host, args, **kwargs):
+        return (json.dumps({'pbs_version': '2022.1', 'Jobs': {'101.server': {'job_state': 'R'}}}) + '\n' +
+                '_EXPYRE_CHUNK_FAILED\n'), qstat_stderr
+    monkeypatch.setattr(expyre.schedulers.pbs, 'subprocess_run', _fake_qstat)
+
+    scheduler = PBS(None)
+    scheduler.status_chunk_size = 1
+
+    qstat_stderr = 'qstat: Unknown Job Id 102.server\n'
+    assert scheduler.status(['101.server', '102.server']) == {'101.server': 'running', '102.server': 'done'}
+
+    qstat_stderr = 'Connection refused\nqstat: cannot connect to server server (errno=15010)\n'
+    with pytest.raises(RuntimeError, match='cannot connect'):
+        scheduler.status(['101.server', '102.server'])
+
+
+def test_sge_qacct(monkeypatch):
+    import expyre.schedulers.sge
+    import expyre.schedulers.base
+    from expyre.schedulers import SGE
+
+    def _record(jobnumber, taskid, failed, exit_status):
+        return ('==============================================================\n'
+                'qname        all.q\n'
+                'hostname     node1\n'
+                f'jobnumber    {jobnumber}\n'
+                f'taskid       {taskid}\n'
+                f'failed       {failed}\n'
+                f'exit_status  {exit_status}\n')
+
+    calls = []
+    def _fake_sge(host, args, **kwargs):
+        calls.append(' '.join(args))
+        if args[0] == 'qstat':
+            return "<?xml version='1.0'?>\n<job_info>\n  <queue_info>\n  </queue_info>\n  <job_info>\n  </job_info>\n</job_info>\n", ''
+        return (_record(201, 'undefined', 0, 0) + _record(202, 1, 0, 0) + _record(202, 2, '100 : assumedly after job', 137) +
+                _record(203, 'undefined', '37  : qmaster enforced h_rt, h_cpu, or h_vmem limit', 0)), ''
+    monkeypatch.setattr(expyre.schedulers.sge, 'subprocess_run', _fake_sge)
+    monkeypatch.setattr(expyre.schedulers.base, 'subprocess_run', _fake_sge)
+
+    remote_ids = ['201', '202.1', '202.2', '203', '204']
+    scheduler = SGE(None)
+    assert scheduler.status(remote_ids) == {'201': 'done', '202.1': 'done', '202.2': 'failed', '203': 'timeout', '204': 'done'}
+    # one scan of accounting file for all jobs
+    assert calls[1] == 'qacct -o $USER -d 7 -j || echo _EXPYRE_CHUNK_FAILED'
+    # final status of jobs found in accounting file is not queried again, but job that was not found is
+    calls.clear()
+    assert scheduler.status(remote_ids) == {'201': 'done', '202.1': 'done', '202.2': 'failed', '203': 'timeout', '204': 'done'}
+    assert calls[0].startswith('qstat') and calls[1].startswith('qacct')
+    calls.clear()
+    assert scheduler.status(remote_ids[:4]) == {'201': 'done', '202.1': 'done', '202.2': 'failed', '203': 'timeout'}
+    assert len(calls) == 1 and calls[0].startswith('qstat')
+    assert SGE(None).accounting(['202.2']) == {'202.2': ('failed', -9)}
+
+    # qacct of job that is not in accounting file yet is not an error, unlike failure of qacct itself
+    qacct_stderr = None
+    def _fake_qacct(host, args, **kwargs):
+        return _record(201, 'undefined', 0, 0) + '_EXPYRE_CHUNK_FAILED\n', qacct_stderr
+    monkeypatch.setattr(expyre.schedulers.base, 'subprocess_run', _fake_qacct)
+    qacct_stderr = 'error: job id 204 not found\n'
+    assert SGE(None).accounting(['201', '204']) == {'201': ('done', 0)}
+    qacct_stderr = 'error: reading file "/opt/sge/default/common/accounting": Stale file handle\n'
+    with pytest.raises(RuntimeError, match='Stale file handle'):
+        SGE(None).accounting(['201', '204'])
@@ -0,0 +1,80 @@
+import os
+import sys
+import hashlib
+import subprocess
+
+from expyre import serialize
+
+
+def test_dump_load(tmp_path):
+    big = os.urandom(100000)
+    obj = {'big': big, 'big_mutable': bytearray(big), 'small': b'123', 'other': [1, 2.0, 'three']}
+
+    serialize.dump(obj, tmp_path / 'obj.pckl', min_size=1000)
+    assert [f.name for f in serialize.buffer_files(tmp_path / 'obj.pckl')] == ['obj.pckl.buf.0', 'obj.pckl.buf.1']
+    # large buffers are not in pickle itself
+    assert (tmp_path / 'obj.pckl').stat().st_size < 1000
+
+    assert serialize.load(tmp_path / 'obj.pckl') == obj
+
+    # hash depends on content of out-of-band buffers
+    h_1 = hashlib.sha256()
+    serialize.hash_update(h_1, obj, min_size=1000)
+    obj['big_mutable'][0] = (obj['big_mutable'][0] + 1) % 256
+    h_2 = hashlib.sha256()
+    serialize.hash_update(h_2, obj, min_size=1000)
+    assert h_1.digest() != h_2.digest()
+
+
+def _bytes_len_and_double(data):
+    return len(data), data + data
+
+
+def test_oob_task(tmp_path, expyre_dummy_config, monkeypatch):
+    from expyre.func import ExPyRe
+
+    monkeypatch.chdir(tmp_path)
+    data = os.urandom(50000)
+    xpr = ExPyRe('oob', function=_bytes_len_and_double, args=[data], oob_buffer_min_size=1000)
+    assert len(serialize.buffer_files(xpr.stage_dir / '_expyre_task_in.pckl')) == 1
+
+    # run job script core directly, as a remote job would
+    subprocess.run([sys.executable, '_expyre_script_core.py'], cwd=xpr.stage_dir, check=True,
+                   env=dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+    os.rename(xpr.stage_dir / '_tmp_expyre_job_succeeded', xpr.stage_dir / '_expyre_job_succeeded')
+    assert len(serialize.buffer_files(xpr.stage_dir / '_expyre_job_succeeded')) == 1
+
+    assert serialize.load(xpr.stage_dir / '_expyre_job_succeeded') == (len(data), data + data)
+
+
+def _generate_items(n):
+    for i in range(n):
+        print('item', i)
+        yield bytes([i % 256]) * 2000
+
+
+def test_stream_results(tmp_path, expyre_dummy_config, monkeypatch):
+    from expyre.func import ExPyRe
+
+    monkeypatch.chdir(tmp_path)
+    xpr = ExPyRe('stream', function=_generate_items, args=[10], stream_results=True, oob_buffer_min_size=1000)
+
+    subprocess.run([sys.executable, '_expyre_script_core.py'], cwd=xpr.stage_dir, check=True,
+                   env=dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+    os.rename(xpr.stage_dir / '_tmp_expyre_job_succeeded', xpr.stage_dir / '_expyre_job_succeeded')
+    assert len(serialize.buffer_files(xpr.stage_dir / '_expyre_job_succeeded')) == 10
+    # generator output went to job stdout file
+    with open(xpr.stage_dir / '_expyre_stdout') as fin:
+        assert fin.read() == ''.join([f'item {i}\n' for i in range(10)])
+
+    items = list(_generate_items(10))
+    lazy_results = serialize.LazyResults(xpr.stage_dir / '_expyre_job_succeeded')
+    for item_i, item in enumerate(lazy_results):
+        assert item == items[item_i]
+    assert lazy_results.load() == items
+    assert serialize.load(xpr.stage_dir / '_expyre_job_succeeded') == items
+
+    # not a stream
+    serialize.dump(items, tmp_path / 'items.pckl', min_size=1000)
+    assert list(serialize.LazyResults(tmp_path / 'items.pckl')) == items
+    assert serialize.LazyResults(tmp_path / 'items.pckl').load() == items
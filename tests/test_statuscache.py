@@ -0,0 +1,104 @@
+import time
+import asyncio
+
+from concurrent.futures import ThreadPoolExecutor
+
+from expyre.statuscache import StatusCache
+
+
+def test_ttl_and_invalidate(tmp_path):
+    cache = StatusCache(tmp_path / 'cache.json', ttl=0.5)
+    runs = []
+    def _run():
+        runs.append(time.time())
+        return f'output {len(runs)}'
+
+    assert cache.get_or_run('squeue', _run) == 'output 1'
+    assert cache.get_or_run('squeue', _run) == 'output 1'
+    # shared with other processes through file
+    assert StatusCache(tmp_path / 'cache.json', ttl=0.5).get('squeue') == 'output 1'
+    assert cache.stats == {'hits': 1, 'misses': 1, 'invalidations': 0}
+
+    time.sleep(0.6)
+    assert cache.get_or_run('squeue', _run) == 'output 2'
+
+    # output of command started before invalidation is not stored
+    start_time = time.time()
+    cache.invalidate()
+    assert cache.get('squeue') is None
+    cache.put('squeue', 'stale output', start_time)
+    assert cache.get('squeue') is None
+    cache.put('squeue', 'fresh output', time.time())
+    assert cache.get('squeue') == 'fresh output'
+
+
+def test_bounded(tmp_path):
+    import json
+
+    cache = StatusCache(tmp_path / 'cache.json', ttl=0.2)
+    # e.g. per-job queries of processes tracking different jobs
+    for job_i in range(5):
+        cache.put(f'qstat {job_i}', 'x' * 10000, time.time())
+    assert cache.get_or_run('qstat 5', lambda: 'output') == 'output'
+    with open(tmp_path / 'cache.json') as fin:
+        assert len(json.load(fin)['entries']) == 6
+
+    # entries that are no longer fresh are dropped by next write
+    time.sleep(0.3)
+    cache.put('qstat 6', 'output', time.time())
+    with open(tmp_path / 'cache.json') as fin:
+        assert list(json.load(fin)['entries'].keys()) == ['qstat 6']
+    assert cache.get_or_run('qstat 7', lambda: 'output') == 'output'
+    assert (tmp_path / 'cache.json').stat().st_size < 1000
+
+
+def test_concurrent_refresh(tmp_path):
+    runs = []
+    def _run():
+        runs.append(time.time())
+        time.sleep(0.5)
+        return 'output'
+
+    # separate objects, each with its own lock file descriptors, like separate processes
+    caches = [StatusCache(tmp_path / 'cache.json', ttl=60) for _ in range(8)]
+    with ThreadPoolExecutor(8) as executor:
+        outputs = list(executor.map(lambda cache: cache.get_or_run('squeue', _run), caches))
+
+    assert outputs == ['output'] * 8
+    assert len(runs) == 1
+    assert sum([cache.stats['hits'] for cache in caches]) == 7
+
+
+def test_scheduler_status(tmp_path, monkeypatch):
+    import expyre.schedulers.slurm
+    import expyre.schedulers.base
+    from expyre.schedulers import Slurm
+
+    calls = []
+    def _fake_squeue(host, args, **kwargs):
+        calls.append(args)
+        if args[0] == 'squeue':
+            return '1234 RUNNING None\n', ''
+        else:
+            return '1235|COMPLETED|0:0\n', ''
+    monkeypatch.setattr(expyre.schedulers.slurm, 'subprocess_run', _fake_squeue)
+    async def _afake_squeue(host, args, **kwargs):
+        return _fake_squeue(host, args, **kwargs)
+    monkeypatch.setattr(expyre.schedulers.base, 'asubprocess_run', _afake_squeue)
+
+    scheduler = Slurm(None)
+    scheduler.status_cache = StatusCache(tmp_path / 'cache.json', ttl=60)
+    assert scheduler.status(['1234', '1235']) == {'1234': 'running', '1235': 'done'}
+    assert scheduler.status(['1234', '1235']) == {'1234': 'running', '1235': 'done'}
+    assert asyncio.run(scheduler.astatus(['1234', '1235'])) == {'1234': 'running', '1235': 'done'}
+    # squeue once, sacct only until final status of job is known
+    assert [args[0] for args in calls] == ['squeue', 'sacct']
+    # of all of user's jobs, so that it is shared by checks of other jobs
+    assert '--user' in calls[0]
+    assert scheduler.status(['1234']) == {'1234': 'running'}
+    assert len(calls) == 2
+
+    scheduler.status_cache.invalidate()
+    assert asyncio.run(scheduler.astatus(['1234'])) == {'1234': 'running'}
+    assert scheduler.status('1234') == {'1234': 'running'}
+    assert [args[0] for args in calls[2:]] == ['squeue']
@@ -1,4 +1,5 @@
 import os
+import sys
 from pathlib import Path
 
 import pytest
@@ -149,3 +150,155 @@ def test_copy_dry_run(tmp_path):
                             args = args[0][2].split()
 
                             assert args[args.index('-a') + 1:] == from_file_out + [to_file_out]
+
+
+def test_ssh_pool(tmp_path):
+    from expyre.subprocess import SSHConnectionPool
+    import expyre.subprocess
+
+    # fake ssh, which records its args, runs commands locally, and has a master "connection"
+    # that exists as long as a marker file does
+    fake_ssh = tmp_path / 'fake_ssh'
+    with open(fake_ssh, 'w') as fout:
+        fout.write(f'''#!{sys.executable}
+import sys, os, time, subprocess
+with open('{tmp_path}/ssh.log', 'a') as fout:
+    fout.write(' '.join(sys.argv[1:]) + '\\n')
+args = sys.argv[1:]
+op = None
+master = False
+while args[0].startswith('-'):
+    if args[0] == '-O':
+        op = args[1]
+    if args[0] == '-o' and args[1] == 'ControlMaster=yes':
+        master = True
+    args = args[2:] if args[0] in ['-o', '-O'] else args[1:]
+marker = '{tmp_path}/master'
+if op == 'check':
+    sys.exit(0 if os.path.exists(marker) else 1)
+elif op == 'exit':
+    os.remove(marker)
+elif master:
+    if os.path.exists('{tmp_path}/no_master'):
+        sys.exit(255)
+    time.sleep(float(os.environ.get('FAKE_SSH_HANDSHAKE', '0')))
+    open(marker, 'w').close()
+else:
+    sys.exit(subprocess.run(['bash', '-c', ' '.join(args[1:])]).returncode)
+''')
+    fake_ssh.chmod(0o755)
+
+    pool = SSHConnectionPool()
+    pool.configure('fakehost', control_dir=tmp_path / 'sockets')
+    orig_pool = expyre.subprocess.ssh_pool
+    expyre.subprocess.ssh_pool = pool
+    try:
+        for _ in range(3):
+            stdout, stderr = subprocess_run('fakehost', ['echo', 'hi'], remsh_cmd=str(fake_ssh))
+            assert stdout == 'hi\n'
+        # not configured, no multiplexing
+        subprocess_run('otherhost', ['echo', 'hi'], remsh_cmd=str(fake_ssh))
+    finally:
+        expyre.subprocess.ssh_pool = orig_pool
+
+    assert (tmp_path / 'master').exists()
+    assert pool.stats['fakehost']['masters_started'] == 1
+    assert pool.stats['fakehost']['reused'] == 2
+    assert pool.saved_time('fakehost') > 0.0
+
+    with open(tmp_path / 'ssh.log') as fin:
+        log = fin.read().splitlines()
+    # one failed check, one master start, then 3 commands through master, and one separate
+    assert sum(['-O check' in line for line in log]) == 1
+    assert sum(['ControlMaster=yes' in line for line in log]) == 1
+    assert sum(['ControlMaster=no' in line for line in log]) == 3
+    assert 'ControlPath' not in log[-1]
+
+    pool.close_all()
+    assert not (tmp_path / 'master').exists()
+
+    # master that cannot be started is not counted as reused
+    (tmp_path / 'no_master').touch()
+    pool = SSHConnectionPool()
+    pool.configure('fakehost', control_dir=tmp_path / 'sockets')
+    expyre.subprocess.ssh_pool = pool
+    try:
+        for _ in range(3):
+            assert subprocess_run('fakehost', ['echo', 'hi'], remsh_cmd=str(fake_ssh))[0] == 'hi\n'
+    finally:
+        expyre.subprocess.ssh_pool = orig_pool
+    assert pool.stats['fakehost'] == {'masters_started': 0, 'handshake_time': 0.0, 'reused': 0}
+    assert pool.saved_time('fakehost') == 0.0
+    (tmp_path / 'no_master').unlink()
+
+    # async commands check and start master without blocking event loop
+    import time
+    import asyncio
+    from expyre.subprocess import asubprocess_run
+
+    async def _run_and_tick():
+        ticks = []
+        async def _tick():
+            while True:
+                ticks.append(time.time())
+                await asyncio.sleep(0.05)
+        ticker = asyncio.ensure_future(_tick())
+        stdout, stderr = await asubprocess_run('fakehost', ['echo', 'hi'], remsh_cmd=str(fake_ssh))
+        ticker.cancel()
+        return stdout, ticks
+
+    pool = SSHConnectionPool()
+    pool.configure('fakehost', control_dir=tmp_path / 'sockets')
+    expyre.subprocess.ssh_pool = pool
+    os.environ['FAKE_SSH_HANDSHAKE'] = '1'
+    try:
+        stdout, ticks = asyncio.run(_run_and_tick())
+    finally:
+        expyre.subprocess.ssh_pool = orig_pool
+        del os.environ['FAKE_SSH_HANDSHAKE']
+    assert stdout == 'hi\n'
+    assert pool.stats['fakehost']['masters_started'] == 1
+    # loop ran throughout the 1 s handshake
+    assert len(ticks) > 10
+    pool.close_all()
+
+
+def test_remote_session(tmp_path, monkeypatch):
+    from expyre.subprocess import RemoteSession, remote_sessions
+
+    # fake ssh, which runs remote command locally
+    fake_ssh = tmp_path / 'fake_ssh'
+    with open(fake_ssh, 'w') as fout:
+        fout.write('#!/bin/bash\n'
+                   'while [[ $1 == -* ]]; do shift 2; done\n'
+                   'shift\n'
+                   'exec bash -c "$*"\n')
+    fake_ssh.chmod(0o755)
+
+    session = RemoteSession('fakehost', str(fake_ssh))
+    monkeypatch.setitem(remote_sessions, 'fakehost', session)
+
+    # each command in a separate subshell of the same session shell
+    pids = [subprocess_run('fakehost', ['echo', '$PPID'], retry=(1, 0))[0] for _ in range(3)]
+    assert len(set(pids)) == 1
+    assert session.n_started == 1
+
+    # quoting, stdin, output without trailing newline, stderr
+    stdout, stderr = subprocess_run('fakehost', ['cat', '>', str(tmp_path / 'file 2'), '&&', 'printf', 'a b',
+                                                 '&&', 'echo', 'err', '>&2'], script='line 1\nline 2', retry=(1, 0))
+    assert (stdout, stderr) == ('a b', 'err\n')
+    with open(tmp_path / 'file 2') as fin:
+        assert fin.read() == 'line 1\nline 2\n'
+
+    # failure does not end session
+    with pytest.raises(RuntimeError):
+        subprocess_run('fakehost', ['exit', '3'], retry=(1, 0))
+    assert subprocess_run('fakehost', ['echo', '$PPID'], retry=(1, 0))[0] == pids[0]
+
+    # reconnect after session dies
+    session._proc.kill()
+    session._proc.wait()
+    assert subprocess_run('fakehost', ['echo', 'hi'], retry=(1, 0))[0] == 'hi\n'
+    assert session.n_started == 2
+
+    session.close()
@@ -60,3 +60,190 @@ def do_system(tmp_path, system, job_name):
         lines = fin.readlines()
     assert ['BOB'] == [l.strip() for l in lines]
 
+
+
+def test_tar_submit(tmp_path, monkeypatch):
+    from expyre.system import System
+
+    # fake ssh, which logs and runs remote command locally, and fake sbatch
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    with open(bin_dir / 'fake_ssh', 'w') as fout:
+        fout.write('#!/bin/bash\n'
+                  f'echo "$*" >> {tmp_path}/ssh.log\n'
+                   'while [[ $1 == -* ]]; do shift 2; done\n'
+                   'shift\n'
+                   'exec bash -c "$*"\n')
+    with open(bin_dir / 'sbatch', 'w') as fout:
+        fout.write('#!/bin/bash\n'
+                   'echo "Submitted batch job 77 from $(pwd) $1"\n')
+    for f in bin_dir.iterdir():
+        f.chmod(0o755)
+    monkeypatch.setenv('PATH', str(bin_dir) + ':' + os.environ['PATH'])
+
+    stage_dir = tmp_path / 'stage_job'
+    stage_dir.mkdir()
+    (stage_dir / 'subdir').mkdir()
+    with open(stage_dir / 'subdir' / 'input', 'w') as fout:
+        fout.write('input data\n')
+    # large enough to fill pipes many times over, streamed rather than embedded in script
+    large_content = os.urandom(20 * 1024 * 1024)
+    (stage_dir / 'large_input').write_bytes(large_content)
+
+    system = System('fakehost', {'debug': {'num_cores': 40, 'max_time': 3600, 'max_mem': 120000000}}, 'slurm',
+                    rundir=str(tmp_path / 'remote'), remsh_cmd=str(bin_dir / 'fake_ssh'), tar_submit=True)
+    system.initialize_remote_rundir()
+    # remote blob store is not used unless enabled
+    assert not (tmp_path / 'remote' / '_expyre_blobs').exists()
+    with open(tmp_path / 'ssh.log') as fin:
+        n_ssh_init = len(fin.readlines())
+
+    remote_id = system.submit('job', stage_dir, Resources(num_nodes=1, max_time='5m'), commands=['echo hi'])
+
+    assert remote_id == '77'
+    job_remote_rundir = tmp_path / 'remote' / 'stage_job'
+    with open(job_remote_rundir / 'subdir' / 'input') as fin:
+        assert fin.read() == 'input data\n'
+    assert (job_remote_rundir / 'large_input').read_bytes() == large_content
+    assert 'echo hi' in (job_remote_rundir / 'job.script.slurm').read_text()
+    # one remote command for whole submission
+    with open(tmp_path / 'ssh.log') as fin:
+        assert len(fin.readlines()) == n_ssh_init + 1
+
+    # rundir already exists
+    monkeypatch.setenv('EXPYRE_RETRY', '1 0')
+    with pytest.raises(RuntimeError):
+        system.submit('job', stage_dir, Resources(num_nodes=1, max_time='5m'), commands=['echo hi'])
+
+    # many jobs with different resources, staged and submitted with one remote command
+    stage_dirs = []
+    for i in range(2):
+        stage_dirs.append(tmp_path / f'stage_many_{i}')
+        stage_dirs[-1].mkdir()
+        (stage_dirs[-1] / 'input').write_text(f'input {i}\n')
+    with open(tmp_path / 'ssh.log') as fin:
+        n_ssh_prev = len(fin.readlines())
+    # timing messages must not break submission
+    monkeypatch.setenv('EXPYRE_TIMING_VERBOSE', '1')
+    remote_ids = system.submit_many([{'id': f'many_{i}', 'stage_dir': stage_dir, 'commands': [f'echo {i}'],
+                                      'resources': Resources(num_nodes=1, max_time=f'{i + 1}m')}
+                                     for i, stage_dir in enumerate(stage_dirs)])
+    assert remote_ids == ['77', '77']
+    for i in range(2):
+        job_remote_rundir = tmp_path / 'remote' / f'stage_many_{i}'
+        assert (job_remote_rundir / 'input').read_text() == f'input {i}\n'
+        assert f'--time=0:0{i + 1}:00' in (job_remote_rundir / 'job.script.slurm').read_text()
+    with open(tmp_path / 'ssh.log') as fin:
+        assert len(fin.readlines()) == n_ssh_prev + 1
+
+
+def test_two_phase_sync(tmp_path, monkeypatch):
+    from expyre.system import System
+    from expyre.func import ExPyRe
+
+    system = System('fakehost', {'debug': {'num_cores': 40, 'max_time': 3600, 'max_mem': 120000000}}, 'slurm',
+                    rundir=str(tmp_path / 'remote'), two_phase_sync=True, sync_only_outputs=True)
+
+    jobs = []
+    for i, status in enumerate(['running', 'running', 'queued', 'done']):
+        stage_dir = tmp_path / f'stage_{i}'
+        stage_dir.mkdir()
+        (stage_dir / '_expyre_output_files').write_text(f'out_{i}.txt\ncommon.txt\n')
+        jobs.append({'from_dir': str(stage_dir), 'remote_id': str(i), 'status': status})
+    # job 1 has finished, although the scheduler does not know it yet
+    (tmp_path / 'stage_1' / '_expyre_job_finished').touch()
+    status_of_remote_id = {j['remote_id']: j['status'] for j in jobs}
+
+    # markers of all jobs
+    assert ExPyRe._marker_copies(system, jobs, 3) == [(['stage_0', 'stage_1', 'stage_2'], ExPyRe._marker_files),
+                                                      (['stage_3'], ExPyRe._marker_files)]
+    # results only of finished jobs, including one whose status is done without a marker (e.g. killed)
+    manifest_files, copies = ExPyRe._result_copies(system, jobs, status_of_remote_id, 3)
+    assert manifest_files == []
+    assert [subdirs for subdirs, _ in copies] == [['stage_1', 'stage_3']]
+    assert copies[0][1] == ExPyRe._result_files + ['out_1.txt', 'common.txt', 'out_3.txt']
+
+    # files listed in manifest, except those already present with the same content
+    (tmp_path / 'stage_1' / 'out_1.txt').write_text('result\n')
+    (tmp_path / 'stage_1' / 'common.txt').write_text('old\n')
+    (tmp_path / 'stage_1' / '_expyre_manifest').write_text(
+        '7 5656fafa00d4f294bcb606cf4f7d4fa877390e46f583e8b3c8744ace104a31d1 out_1.txt\n'
+        '4 27ce7b4c6d5bb4a4b1dd2ea3fd3bfbbd0e7da7dbcc98e0bbaa4ab08f9bb0bb73 common.txt\n'
+        '10 0000000000000000000000000000000000000000000000000000000000000000 sub dir/out file\n'
+        '- - job.1.stdout\n')
+    (tmp_path / 'stage_1' / 'job.1.stdout').write_text('still being written\n')
+    manifest_files, copies = ExPyRe._result_copies(system, jobs, status_of_remote_id, 3)
+    assert manifest_files == ['stage_1/common.txt', 'stage_1/sub dir/out file', 'stage_1/job.1.stdout']
+    assert [subdirs for subdirs, _ in copies] == [['stage_3']]
+
+    # files already copied are hashed once, not on every sync
+    import expyre.config
+    import expyre.filehash
+    from expyre.filehash import FileDigestCache
+    monkeypatch.setattr(expyre.config, 'file_digests', FileDigestCache(tmp_path / 'file_digests.db'))
+    hashed = []
+    def _file_digest(filename, _file_digest=expyre.filehash.file_digest):
+        hashed.append(Path(filename).name)
+        return _file_digest(filename)
+    monkeypatch.setattr(expyre.filehash, 'file_digest', _file_digest)
+    for _ in range(3):
+        assert ExPyRe._manifest_missing(tmp_path / 'stage_1') == ['common.txt', 'sub dir/out file', 'job.1.stdout']
+    assert sorted(hashed) == ['common.txt', 'out_1.txt']
+
+    # everything of all jobs when disabled
+    system.two_phase_sync = False
+    assert ExPyRe._marker_copies(system, jobs, 3) == []
+    assert ExPyRe._result_copies(system, jobs, status_of_remote_id, 3) == ([], [(['stage_0', 'stage_1', 'stage_2'], None),
+                                                                                (['stage_3'], None)])
+
+    assert System._include_args(None) == '-a'
+    assert System._include_args(['a*']) == ('-a --prune-empty-dirs --include=\\*/ --include=/\\*/a\\* '
+                                            '--include=/\\*/a\\*/\\*\\*\\* --exclude=\\*')
+
+
+def test_get_remote_files(tmp_path, monkeypatch):
+    import expyre.system
+    from expyre.system import System
+
+    copies = []
+    def _fake_copy(from_files, to_file, from_host, rcp_args, **kwargs):
+        files_from = rcp_args.split('--files-from=')[1]
+        copies.append((from_files, to_file, from_host, Path(files_from).read_text()))
+    monkeypatch.setattr(expyre.system, 'subprocess_copy', _fake_copy)
+
+    system = System('fakehost', {'debug': {'num_cores': 40, 'max_time': 3600, 'max_mem': 120000000}}, 'slurm',
+                    rundir='run_expyre')
+    system.get_remote_files(tmp_path, ['stage_0/_expyre_job_succeeded', 'stage_1/out file'])
+
+    assert copies == [('run_expyre/', tmp_path, 'fakehost', 'stage_0/_expyre_job_succeeded\nstage_1/out file\n')]
+    # temporary list is removed
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_concurrent_copies(tmp_path, monkeypatch):
+    import threading
+    import expyre.system
+    from expyre.system import System
+    from concurrent.futures import ThreadPoolExecutor
+
+    running = []
+    max_running = []
+    lock = threading.Lock()
+    def _fake_copy(from_files, to_file, from_host, **kwargs):
+        with lock:
+            running.append(from_host)
+            max_running.append(len(running))
+        time.sleep(0.1)
+        with lock:
+            running.remove(from_host)
+    monkeypatch.setattr(expyre.system, 'subprocess_copy', _fake_copy)
+
+    partitions = {'debug': {'num_cores': 40, 'max_time': 3600, 'max_mem': 120000000}}
+    # two systems on same host share limit
+    systems = [System('concurrent_copies_host', partitions, 'slurm', max_concurrent_copies=2),
+               System('concurrent_copies_host', partitions, 'slurm', max_concurrent_copies=2)]
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(lambda i: systems[i % 2].get_remotes(tmp_path, subdir_glob=[f'job_{i}']), range(8)))
+
+    assert len(max_running) == 8
+    assert max(max_running) == 2